@@ -0,0 +1,6 @@
+"""Solutions of the challenge: the top dates (q1), emojis (q2) and
+mentioned users (q3) of a tweets file, each one optimized for execution
+time and for memory usage.
+
+All the q-functions are available, loaded on first use, from `src.queries`.
+"""
@@ -0,0 +1,437 @@
+"""Choose the engine of a query from the input and the machine.
+
+The `_time` engines are the fastest, but their peak memory grows with the
+file (about 900 MB on the 389 MB sample file). The `_memory` engines keep
+only the ids and the counters, and with `max_memory_mb` they spill them to
+disk so the memory is bounded whatever the size of the file. `q1_auto`,
+`q2_auto` and `q3_auto` pick one of them:
+
+1. with `allow_time=True` only, the `_time` engine, if its predicted peak
+   fits in a fraction of the available memory, with one worker per CPU
+   where the engine has workers,
+2. else, with more than one CPU, the `_memory` engine with a `mode` of
+   `parallel.count_file` and one worker, so one chunk of the file, per
+   CPU, if its predicted peak fits,
+3. else the `_memory` engine, if its predicted peak fits,
+4. else the `_memory` engine with the budget as `max_memory_mb`, which
+   sets the size of the runs spilled to disk.
+
+The `_memory` engine gives the same results with and without `mode` and
+`max_memory_mb`, ties included, so by default the result of a file doesn't
+depend on the machine. The `_time` engines don't have the same semantics:
+in q1 and q3 they count a main tweet repeated on several lines once, where
+the `_memory` engines count it on each line, and they can order the ties
+differently. They are only chosen when the caller accepts that.
+
+The predictions scale the memory growth and the duration of each engine,
+measured in a fresh interpreter by `measure_profiles` and saved to
+`benchmark/auto_profiles.txt`, to the size of the input. The chunks of
+`mode` are measured aggregated in one state (`mode='serial'`), the workers
+then share the duration, and their states, the copies the parent receives
+and the merged state add up to CHUNK_STATE_COPIES times its memory:
+
+    python -m src.auto farmers-protest-tweets-2021-2-4.json
+
+The engines read plain JSON lines only, a gzip file is
+rejected before planning. The decision is logged with the `logging`
+module, at INFO level.
+
+Example
+-------
+>>> import logging
+>>> logging.basicConfig(level=logging.INFO)
+>>> q2_auto("farmers-protest-tweets-2021-2-4.json", allow_time=True)
+INFO:src.auto:q2: q2_time with workers=4, predicted peak 395 MB and 8.7 s, ...
+"""
+
+import functools
+import logging
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import progress
+
+logger = logging.getLogger(__name__)
+
+# Root of the repository, the engines are run as `src.queries.<engine>`
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+# File of the profiles measured by `measure_profiles`
+PROFILES_FILE = ROOT / 'benchmark' / 'auto_profiles.txt'
+
+# Fraction of the available memory the engine can use
+DEFAULT_MEMORY_FRACTION = 0.5
+
+# Engines that accept a number of worker processes
+_WORKERS = {'q2_time'}
+
+# Memory of a chunked run over the memory of its state aggregated serially
+CHUNK_STATE_COPIES = 3
+
+# The profiles that are not an engine run with its defaults, with the
+# engine and the arguments measured
+_MEASURED_CALLS = {
+    f'{query}_chunks': (f'{query}_memory', {'mode': 'serial'})
+    for query in ('q1', 'q2', 'q3')}
+
+
+class Profile(NamedTuple):
+    """Cost of an engine per MB of input.
+
+    Attributes
+    ----------
+    mb_per_input_mb : float
+        Growth of the resident memory during a run.
+    seconds_per_input_mb : float
+        Duration of a run.
+    """
+
+    mb_per_input_mb: float
+    seconds_per_input_mb: float
+
+
+# The measurements of PROFILES_FILE, used when it is missing. They were
+# taken on a 54 MB file of generated tweets with the fields of the sample
+# file. Its lines are shorter than the ones of the sample file, so the
+# growth per MB of the `_memory` engines, mostly the set of ids, is on the
+# safe side
+DEFAULT_PROFILES = {
+    'q1_time': Profile(2.47396, 0.02965),
+    'q1_memory': Profile(0.17951, 0.02705),
+    'q2_time': Profile(1.68984, 0.02186),
+    'q2_memory': Profile(0.17718, 0.01487),
+    'q3_time': Profile(0.54057, 0.01652),
+    'q3_memory': Profile(0.17951, 0.02993),
+    'q1_chunks': Profile(0.37257, 0.04165),
+    'q2_chunks': Profile(0.37184, 0.03956),
+    'q3_chunks': Profile(0.37068, 0.04000),
+}
+
+
+class Plan(NamedTuple):
+    """The engine chosen for a query, and why.
+
+    Attributes
+    ----------
+    engine : str
+        Name of the q-function.
+    kwargs : Dict[str, Any]
+        Arguments of the q-function besides the file path.
+    predicted_peak_mb : float
+        Predicted peak RSS of the process.
+    predicted_seconds : float
+        Predicted duration.
+    input_mb : float
+        Size of the input.
+    available_mb : Optional[float]
+        Available memory of the machine, None if unknown.
+    cpus : int
+        CPUs the process can use.
+    """
+
+    engine: str
+    kwargs: Dict[str, Any]
+    predicted_peak_mb: float
+    predicted_seconds: float
+    input_mb: float
+    available_mb: Optional[float]
+    cpus: int
+
+
+# Runs an engine in a fresh interpreter and prints the growth of its peak
+# RSS in KB and its duration. The heavy dependencies are imported before
+# the baseline, a process that runs several queries pays them once
+_MEASURE_SCRIPT = """
+import resource, time
+import emoji, numpy, pandas
+from src import queries
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+queries.{engine}({file_path!r}, **{kwargs!r})
+seconds = time.perf_counter() - start
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before, seconds)
+"""
+
+
+def measure(engine: str, file_path: str) -> Profile:
+    """Profile of an engine on a file, run in a fresh interpreter.
+
+    The growth is the peak RSS of the run minus the peak RSS before it. In
+    a process that already holds memory, as in `memory_profile.py`, the
+    memory freed by earlier runs is reused and the growth is hidden.
+
+    Parameters
+    ----------
+    engine : str
+        Name of the q-function or of a chunked run, a key of
+        DEFAULT_PROFILES.
+    file_path : str
+        Path to the JSON file containing the tweets data.
+
+    Returns
+    -------
+    Profile
+        The growth and the duration per MB of the file.
+    """
+
+    function, kwargs = _MEASURED_CALLS.get(engine, (engine, {}))
+    script = _MEASURE_SCRIPT.format(
+        engine=function, file_path=os.path.abspath(file_path), kwargs=kwargs)
+    process = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    growth_kb, seconds = process.stdout.split()
+    input_mb = input_size_mb(file_path)
+    return Profile(int(growth_kb) / 2**10 / input_mb, float(seconds) / input_mb)
+
+
+def measure_profiles(file_path: str, n: int = 3) -> Dict[str, Profile]:
+    """Profiles of all the engines on a file, with the largest growth of n
+    runs, to be safe, and their median duration."""
+
+    profiles = {}
+    for engine in DEFAULT_PROFILES:
+        runs = [measure(engine, file_path) for _ in range(n)]
+        profiles[engine] = Profile(
+            max(run.mb_per_input_mb for run in runs),
+            statistics.median(run.seconds_per_input_mb for run in runs))
+    return profiles
+
+
+def save_profiles(
+        profiles: Dict[str, Profile],
+        path: pathlib.Path = PROFILES_FILE,
+        source: Optional[str] = None,
+        ) -> None:
+    """Write profiles in the format read by `calibrate`, after a comment
+    line describing the `source` of the measurements, if given."""
+
+    lines = [f'# {source}'] if source else []
+    lines += ['engine, mb_per_input_mb, seconds_per_input_mb']
+    lines += [f'{engine}, {p.mb_per_input_mb:.5f}, {p.seconds_per_input_mb:.5f}'
+              for engine, p in profiles.items()]
+    pathlib.Path(path).parent.mkdir(exist_ok=True)
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def calibrate(path: pathlib.Path = PROFILES_FILE) -> Dict[str, Profile]:
+    """Profiles of the engines saved by `save_profiles`.
+
+    Parameters
+    ----------
+    path : pathlib.Path, optional
+        File of the profiles, by default PROFILES_FILE
+
+    Returns
+    -------
+    Dict[str, Profile]
+        Profile of each engine, DEFAULT_PROFILES for the engines without
+        measurements.
+    """
+
+    profiles = dict(DEFAULT_PROFILES)
+    if not os.path.exists(path):
+        return profiles
+    with open(path, 'r') as f:
+        for line in f:
+            # skip the comments, the header and the blank lines
+            if not line.strip() or line.startswith(('#', 'engine,')):
+                continue
+            engine, mb, seconds = (x.strip() for x in line.split(','))
+            if engine in profiles:
+                profiles[engine] = Profile(float(mb), float(seconds))
+    return profiles
+
+
+@functools.lru_cache(maxsize=None)
+def _default_profiles() -> Dict[str, Profile]:
+    # the benchmark files are read once per process
+    return calibrate()
+
+
+def available_memory_mb() -> Optional[float]:
+    """Memory available to new processes without swapping, in MB.
+
+    It is `MemAvailable` of `/proc/meminfo` on Linux, else the free
+    physical pages, or None when neither is known.
+    """
+
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def cpu_count() -> int:
+    """CPUs the process is allowed to run on."""
+
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def input_size_mb(file_path: str) -> float:
+    """Size of a file in MB."""
+
+    return os.path.getsize(file_path) / 2**20
+
+
+def plan(
+        query: str,
+        file_path: str,
+        available_mb: Optional[float] = None,
+        cpus: Optional[int] = None,
+        memory_fraction: float = DEFAULT_MEMORY_FRACTION,
+        profiles: Optional[Dict[str, Profile]] = None,
+        allow_time: bool = False,
+        ) -> Plan:
+    """Choose the engine of a query for a file.
+
+    Parameters
+    ----------
+    query : str
+        'q1', 'q2' or 'q3'.
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    available_mb : Optional[float], optional
+        Available memory in MB. If None, read from the system,
+        by default None
+    cpus : Optional[int], optional
+        Number of CPUs. If None, the CPUs of the process, by default None
+    memory_fraction : float, optional
+        Fraction of the available memory the engine can use, by default
+        DEFAULT_MEMORY_FRACTION
+    profiles : Optional[Dict[str, Profile]], optional
+        Costs of the engines. If None, calibrated from the benchmark,
+        by default None
+    allow_time : bool, optional
+        Whether the `_time` engine can be chosen. Its results can differ
+        from the ones of the `_memory` engine on repeated main tweets and
+        on ties, so they would depend on the memory of the machine,
+        by default False
+
+    Returns
+    -------
+    Plan
+        The engine, its arguments and the predictions.
+
+    Raises
+    ------
+    ValueError
+        If the query is unknown, or the file is compressed with gzip,
+        which none of the engines can read.
+    """
+
+    if query not in ('q1', 'q2', 'q3'):
+        raise ValueError(f"query must be 'q1', 'q2' or 'q3', not {query!r}")
+    if file_path.endswith('.gz'):
+        raise ValueError(f'{file_path}: gzip files are not supported, decompress it first')
+
+    profiles = profiles or _default_profiles()
+    if available_mb is None:
+        available_mb = available_memory_mb()
+    cpus = cpus or cpu_count()
+    input_mb = input_size_mb(file_path)
+    current_mb = progress.current_rss_mb()
+    # without the available memory, the fastest engine is used
+    budget = float('inf') if available_mb is None else memory_fraction * available_mb
+
+    def predict(engine: str, kwargs: Dict[str, Any], measured: Optional[str] = None) -> Plan:
+        profile = profiles[measured or engine]
+        growth = profile.mb_per_input_mb * input_mb
+        seconds = profile.seconds_per_input_mb * input_mb
+        if 'max_memory_mb' in kwargs:
+            growth = min(growth, kwargs['max_memory_mb'])
+        if 'mode' in kwargs:
+            growth *= CHUNK_STATE_COPIES
+            seconds /= kwargs['workers']
+        return Plan(engine, kwargs, current_mb + growth, seconds,
+                    input_mb, available_mb, cpus)
+
+    time_engine, memory_engine = f'{query}_time', f'{query}_memory'
+    candidates = [predict(memory_engine, {})]
+    if cpus > 1:
+        from .parallel import choose_mode
+        candidates.insert(0, predict(
+            memory_engine, {'mode': choose_mode(cpus), 'workers': cpus}, f'{query}_chunks'))
+    if allow_time:
+        candidates.insert(0, predict(
+            time_engine, {'workers': cpus} if time_engine in _WORKERS else {}))
+    for candidate in candidates:
+        if candidate.predicted_peak_mb - current_mb <= budget:
+            return candidate
+    # nothing fits, spill the ids and the counters to disk
+    return predict(memory_engine, {'max_memory_mb': budget})
+
+
+def run(query: str, file_path: str, **kwargs) -> List[Any]:
+    """Plan a query, log the decision and run the chosen engine.
+
+    Parameters
+    ----------
+    query : str
+        'q1', 'q2' or 'q3'.
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    **kwargs
+        Arguments of `plan`.
+
+    Returns
+    -------
+    List[Any]
+        The result of the query.
+    """
+
+    from . import queries
+
+    chosen = plan(query, file_path, **kwargs)
+    available = ('unknown' if chosen.available_mb is None
+                 else f'{chosen.available_mb:.0f} MB')
+    logger.info(
+        '%s: %s with %s, predicted peak %.0f MB and %.1f s, '
+        'for %.1f MB of input, %s available and %d CPUs',
+        query, chosen.engine,
+        ', '.join(f'{k}={v:g}' if isinstance(v, (int, float)) else f'{k}={v}'
+                  for k, v in chosen.kwargs.items()) or 'defaults',
+        chosen.predicted_peak_mb, chosen.predicted_seconds,
+        chosen.input_mb, available, chosen.cpus)
+    return getattr(queries, chosen.engine)(file_path, **chosen.kwargs)
+
+
+def q1_auto(file_path: str, **kwargs) -> List[Any]:
+    """q1 with the engine chosen by `plan`, see `run`."""
+    return run('q1', file_path, **kwargs)
+
+
+def q2_auto(file_path: str, **kwargs) -> List[Any]:
+    """q2 with the engine chosen by `plan`, see `run`."""
+    return run('q2', file_path, **kwargs)
+
+
+def q3_auto(file_path: str, **kwargs) -> List[Any]:
+    """q3 with the engine chosen by `plan`, see `run`."""
+    return run('q3', file_path, **kwargs)
+
+
+if __name__ == '__main__':
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'farmers-protest-tweets-2021-2-4.json'
+
+    profiles = measure_profiles(file_path)
+    for engine, profile in profiles.items():
+        print(f'{engine}: {profile.mb_per_input_mb:.3f} MB and '
+              f'{profile.seconds_per_input_mb:.4f} s per MB of input')
+    save_profiles(profiles, source=f'measured on {os.path.basename(file_path)} '
+                                   f'({input_size_mb(file_path):.0f} MB), {cpu_count()} CPU(s)')
+    print(f'Saved to {PROFILES_FILE}')
@@ -0,0 +1,576 @@
+"""Columnar batches of tweets, passed between the stages of a pipeline.
+
+`json.loads` gives a dict per tweet, with a dict per user, per mention and
+per quoted tweet, and each of them holds its own str objects. A
+`TweetBatch` keeps the fields of many tweets as a few arrays instead:
+
+* `ids` and `days` are NumPy int64 and int32 columns, days are encoded
+  as in `shared_counts.day_code`,
+* `users` and `contents` are `StringColumn`s: the UTF-8 bytes of all the
+  rows in one buffer, and the offset of each row,
+* `mentions` is ragged: the usernames of all the rows in one
+  `StringColumn`, the ones of row `i` at
+  `mention_offsets[i]:mention_offsets[i + 1]`,
+* `quoted` is ragged too: the quote chains flattened in a `TweetBatch`,
+  the chain of row `i` at `quote_offsets[i]:quote_offsets[i + 1]`, from
+  the tweet it quotes to the end of the chain.
+
+The per-row access goes through `TweetView`, a view with `__slots__` that
+decodes a field only when it is read.
+
+The pipeline has three stages:
+
+1. `read_batches` parses the lines and builds the batches, flattening the
+   quote chains,
+2. `counted_tweets` deduplicates the tweets of each batch as it is read,
+   with vectorized set operations on the ids, and gives the tweets
+   counted by the `_memory` engines as a single flat batch, in their
+   order,
+3. `aggregate` dictionary-encodes the usernames with `np.unique` and
+   counts the days, the (day, user) pairs, the mentions and the emojis in
+   a `SharedCounts`, which answers q1, q2 and q3 with the results and the
+   order of ties of the `_memory` engines.
+
+Example
+-------
+>>> counts = count_file("farmers-protest-tweets-2021-2-4.json")
+>>> counts.q3()       # same as q3_memory
+>>> q3_memory("farmers-protest-tweets-2021-2-4.json", mode="batch")
+"""
+
+import json
+from array import array
+from datetime import date
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import progress
+from .emojis import extract_emojis
+from .shared_counts import (
+    DAY_BASE, N_DAYS, NEVER, SharedCounts, day_code, emoji_vocabulary)
+
+# Number of main tweets of each batch read
+DEFAULT_BATCH_SIZE = 1 << 16
+
+# Bytes of strings hashed and compared at a time by `StringColumn.encode`,
+# and the odd multiplier of its hash (the 64-bit FNV prime)
+ENCODE_BLOCK = 1 << 20
+HASH_BASE = np.uint64(0x100000001b3)
+
+
+def _ragged(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Offsets and element indices of the rows `rows` of a ragged array."""
+
+    lengths = offsets[rows + 1] - offsets[rows]
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    # the index of each element in the original array
+    elements = (np.repeat(offsets[rows] - new_offsets[:-1], lengths)
+                + np.arange(new_offsets[-1], dtype=np.int64))
+    return new_offsets, elements
+
+
+def _join_offsets(offsets: Sequence[np.ndarray]) -> np.ndarray:
+    """Offsets of the concatenation of several ragged arrays."""
+
+    parts, shift = [np.zeros(1, dtype=np.int64)], 0
+    for o in offsets:
+        parts.append(o[1:] + shift)
+        shift += int(o[-1])
+    return np.concatenate(parts)
+
+
+class StringColumn:
+    """Strings stored as UTF-8 bytes in a single buffer.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        uint8 bytes of all the strings.
+    offsets : np.ndarray
+        int64, string `i` is `data[offsets[i]:offsets[i + 1]]`.
+    """
+
+    __slots__ = ('data', 'offsets')
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray) -> None:
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> 'StringColumn':
+        data, offsets = bytearray(), array('q', [0])
+        for s in strings:
+            data += s.encode('utf-8')
+            offsets.append(len(data))
+        return cls(np.frombuffer(bytes(data), dtype=np.uint8),
+                   np.frombuffer(offsets, dtype=np.int64))
+
+    @classmethod
+    def concat(cls, columns: Sequence['StringColumn']) -> 'StringColumn':
+        return cls(np.concatenate([c.data for c in columns] or [np.zeros(0, np.uint8)]),
+                   _join_offsets([c.offsets for c in columns]))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+    def non_ascii(self) -> np.ndarray:
+        """Mask of the strings with a character that is not ASCII."""
+
+        mask = np.zeros(len(self), dtype=bool)
+        high = np.flatnonzero(self.data >= 0x80)
+        mask[np.searchsorted(self.offsets, high, side='right') - 1] = True
+        return mask
+
+    def take(self, rows: np.ndarray) -> 'StringColumn':
+        """The strings of the rows `rows`, in that order."""
+
+        offsets, elements = _ragged(self.offsets, rows)
+        return StringColumn(self.data[elements], offsets)
+
+    def encode(self) -> Tuple[List[str], np.ndarray]:
+        """Dictionary-encode the strings, without a Python loop over rows.
+
+        The strings are grouped by a polynomial hash of their bytes with
+        `np.unique`, and each one is compared with the first string of its
+        group, so the encoding is exact: the strings of a group that differ
+        from the first one, a hash collision, are encoded apart. The bytes
+        are hashed and compared in blocks of about ENCODE_BLOCK bytes.
+
+        Returns
+        -------
+        Tuple[List[str], np.ndarray]
+            The distinct strings, sorted by their bytes, and the int64 code
+            of each row.
+        """
+
+        blocks = list(self._blocks())
+        # byte j of a string is multiplied by HASH_BASE ** j, modulo 2 ** 64
+        n_powers = max((int(self.offsets[r1] - self.offsets[r0]) for r0, r1 in blocks),
+                       default=0)
+        powers = np.full(n_powers, HASH_BASE, dtype=np.uint64)
+        if n_powers:
+            powers[0] = 1
+        np.cumprod(powers, out=powers)
+        hashes = np.concatenate(
+            [self._hashes(r0, r1, powers) for r0, r1 in blocks] or [np.zeros(0, np.uint64)])
+        _, first, codes = np.unique(hashes, return_index=True, return_inverse=True)
+        codes = codes.reshape(-1).astype(np.int64)
+        group_first = first[codes]
+
+        keys = self._bytes(first)
+        collisions = {}
+        lengths = np.diff(self.offsets)
+        for r0, r1 in blocks:
+            differs = self._differs(r0, r1, group_first[r0:r1], lengths)
+            rows = r0 + np.flatnonzero(differs)
+            for row, key in zip(rows, self._bytes(rows)):
+                codes[row] = collisions.setdefault(key, len(keys) + len(collisions))
+        keys.extend(collisions)
+
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        rank = np.empty(len(keys), dtype=np.int64)
+        rank[order] = np.arange(len(keys))
+        return [keys[i].decode('utf-8') for i in order], rank[codes]
+
+    def _bytes(self, rows: np.ndarray) -> List[bytes]:
+        view = memoryview(self.data)
+        return [bytes(view[start:end]) for start, end in zip(
+            self.offsets[rows].tolist(), self.offsets[rows + 1].tolist())]
+
+    def _blocks(self) -> Iterator[Tuple[int, int]]:
+        """Ranges of rows of about ENCODE_BLOCK bytes, at least one row."""
+
+        r0 = 0
+        while r0 < len(self):
+            r1 = int(np.searchsorted(self.offsets, self.offsets[r0] + ENCODE_BLOCK,
+                                     side='right')) - 1
+            r1 = min(max(r1, r0 + 1), len(self))
+            yield r0, r1
+            r0 = r1
+
+    def _hashes(self, r0: int, r1: int, powers: np.ndarray) -> np.ndarray:
+        """Hash of the bytes and the length of the rows `r0` to `r1`."""
+
+        offsets = self.offsets[r0:r1 + 1] - self.offsets[r0]
+        lengths = np.diff(offsets)
+        n_bytes = int(offsets[-1])
+        positions = np.arange(n_bytes) - np.repeat(offsets[:-1], lengths)
+        terms = self.data[self.offsets[r0]:self.offsets[r1]] * powers[positions]
+        sums = np.zeros(n_bytes + 1, dtype=np.uint64)
+        np.cumsum(terms, out=sums[1:])
+        return (sums[offsets[1:]] - sums[offsets[:-1]]) * HASH_BASE + lengths.astype(np.uint64)
+
+    def _differs(
+            self, r0: int, r1: int, others: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Mask of the rows `r0` to `r1` whose string differs from the
+        string of the row `others` of each one."""
+
+        rows = np.arange(r0, r1)
+        differs = lengths[rows] != lengths[others]
+        compared = np.flatnonzero(~differs & (rows != others))
+        _, own = _ragged(self.offsets, rows[compared])
+        _, theirs = _ragged(self.offsets, others[compared])
+        mismatches = np.repeat(np.arange(len(compared)), lengths[rows[compared]])
+        mismatches = mismatches[self.data[own] != self.data[theirs]]
+        differs[compared[np.unique(mismatches)]] = True
+        return differs
+
+
+class TweetBatch:
+    """Struct of arrays of the fields of a batch of tweets, see the module
+    documentation.
+    """
+
+    __slots__ = ('ids', 'days', 'users', 'contents',
+                 'mention_offsets', 'mentions', 'quote_offsets', 'quoted')
+
+    def __init__(
+            self,
+            ids: np.ndarray,
+            days: np.ndarray,
+            users: StringColumn,
+            contents: StringColumn,
+            mention_offsets: np.ndarray,
+            mentions: StringColumn,
+            quote_offsets: np.ndarray,
+            quoted: Optional['TweetBatch'] = None,
+            ) -> None:
+        self.ids = ids
+        self.days = days
+        self.users = users
+        self.contents = contents
+        self.mention_offsets = mention_offsets
+        self.mentions = mentions
+        self.quote_offsets = quote_offsets
+        self.quoted = quoted
+
+    @classmethod
+    def concat(cls, batches: Sequence['TweetBatch']) -> 'TweetBatch':
+        """The rows of several batches, one after the other."""
+
+        if not batches:
+            return BatchBuilder().build()
+        quoted = [b.quoted for b in batches if b.quoted is not None]
+        return cls(
+            np.concatenate([b.ids for b in batches]),
+            np.concatenate([b.days for b in batches]),
+            StringColumn.concat([b.users for b in batches]),
+            StringColumn.concat([b.contents for b in batches]),
+            _join_offsets([b.mention_offsets for b in batches]),
+            StringColumn.concat([b.mentions for b in batches]),
+            _join_offsets([b.quote_offsets for b in batches]),
+            cls.concat(quoted) if quoted else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> 'TweetView':
+        if not -len(self) <= row < len(self):
+            raise IndexError('row out of range')
+        return TweetView(self, row % len(self))
+
+    def __iter__(self) -> Iterator['TweetView']:
+        for row in range(len(self)):
+            yield TweetView(self, row)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the arrays of the batch, quoted tweets included."""
+
+        return (self.ids.nbytes + self.days.nbytes + self.users.nbytes
+                + self.contents.nbytes + self.mention_offsets.nbytes
+                + self.mentions.nbytes + self.quote_offsets.nbytes
+                + (self.quoted.nbytes if self.quoted is not None else 0))
+
+    def take(self, rows: np.ndarray, quotes: bool = True) -> 'TweetBatch':
+        """The rows `rows`, in that order, with their quote chains unless
+        `quotes` is False."""
+
+        rows = np.asarray(rows, dtype=np.int64)
+        mention_offsets, mention_elements = _ragged(self.mention_offsets, rows)
+        if quotes and self.quoted is not None:
+            quote_offsets, quote_elements = _ragged(self.quote_offsets, rows)
+            quoted = self.quoted.take(quote_elements)
+        else:
+            quote_offsets, quoted = np.zeros(len(rows) + 1, dtype=np.int64), None
+        return TweetBatch(
+            self.ids[rows], self.days[rows],
+            self.users.take(rows), self.contents.take(rows),
+            mention_offsets, self.mentions.take(mention_elements),
+            quote_offsets, quoted)
+
+
+class TweetView:
+    """A row of a `TweetBatch`, decoded field by field when read."""
+
+    __slots__ = ('batch', 'row')
+
+    def __init__(self, batch: TweetBatch, row: int) -> None:
+        self.batch = batch
+        self.row = row
+
+    @property
+    def id(self) -> int:
+        return int(self.batch.ids[self.row])
+
+    @property
+    def date(self) -> date:
+        return date.fromordinal(DAY_BASE + int(self.batch.days[self.row]))
+
+    @property
+    def username(self) -> str:
+        return self.batch.users[self.row]
+
+    @property
+    def content(self) -> str:
+        return self.batch.contents[self.row]
+
+    @property
+    def mentions(self) -> List[str]:
+        b = self.batch
+        return [b.mentions[i] for i in range(b.mention_offsets[self.row],
+                                             b.mention_offsets[self.row + 1])]
+
+    @property
+    def quoted(self) -> List['TweetView']:
+        """The quote chain, from the tweet quoted by this one to its end."""
+
+        b = self.batch
+        return [TweetView(b.quoted, i) for i in range(b.quote_offsets[self.row],
+                                                      b.quote_offsets[self.row + 1])]
+
+    def __repr__(self) -> str:
+        return f'TweetView(id={self.id}, username={self.username!r})'
+
+
+class BatchBuilder:
+    """Appends tweets to compact buffers, then builds the batch.
+
+    Parameters
+    ----------
+    quotes : bool, optional
+        Whether the quote chain of each tweet is appended to the quoted
+        batch. If False, the quoted tweets are ignored, by default True
+    """
+
+    def __init__(self, quotes: bool = True) -> None:
+        self.ids, self.days = array('q'), array('i')
+        self.users, self.user_offsets = bytearray(), array('q', [0])
+        self.contents, self.content_offsets = bytearray(), array('q', [0])
+        self.mentions, self.mention_ends = bytearray(), array('q', [0])
+        self.mention_offsets = array('q', [0])
+        self.quote_offsets = array('q', [0])
+        self.quoted = BatchBuilder(quotes=False) if quotes else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, tweet: dict) -> None:
+        self.ids.append(tweet['id'])
+        self.days.append(day_code(tweet['date']))
+        self.users += tweet['user']['username'].encode('utf-8')
+        self.user_offsets.append(len(self.users))
+        self.contents += tweet['content'].encode('utf-8')
+        self.content_offsets.append(len(self.contents))
+        for mention in tweet.get('mentionedUsers') or ():
+            self.mentions += mention['username'].encode('utf-8')
+            self.mention_ends.append(len(self.mentions))
+        self.mention_offsets.append(len(self.mention_ends) - 1)
+
+        if self.quoted is not None:
+            # each tweet quotes at most one tweet, the quotes form a chain
+            current = tweet.get('quotedTweet')
+            while current:
+                self.quoted.append(current)
+                current = current.get('quotedTweet')
+            self.quote_offsets.append(len(self.quoted))
+        else:
+            self.quote_offsets.append(0)
+
+    def build(self) -> TweetBatch:
+        def column(data, offsets):
+            return StringColumn(np.frombuffer(bytes(data), dtype=np.uint8),
+                                np.frombuffer(offsets, dtype=np.int64))
+
+        return TweetBatch(
+            np.frombuffer(self.ids, dtype=np.int64),
+            np.frombuffer(self.days, dtype=np.int32),
+            column(self.users, self.user_offsets),
+            column(self.contents, self.content_offsets),
+            np.frombuffer(self.mention_offsets, dtype=np.int64),
+            column(self.mentions, self.mention_ends),
+            np.frombuffer(self.quote_offsets, dtype=np.int64),
+            self.quoted.build() if self.quoted is not None else None,
+        )
+
+
+def read_batches(
+        file_path: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        ) -> Iterator[TweetBatch]:
+    """Read a tweets file as batches of main tweets.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    batch_size : int, optional
+        Main tweets of each batch, by default DEFAULT_BATCH_SIZE
+
+    Yields
+    ------
+    TweetBatch
+        The batches, with their quote chains, in the order of the lines.
+    """
+
+    builder = BatchBuilder()
+    with open(file_path, 'rb') as f:
+        for line in progress.lines(f, 'batch:read'):
+            builder.append(json.loads(line))
+            if len(builder) == batch_size:
+                yield builder.build()
+                builder = BatchBuilder()
+    if len(builder):
+        yield builder.build()
+
+
+def counted_tweets(batches: Iterable[TweetBatch]) -> Tuple[TweetBatch, np.ndarray]:
+    """The tweets counted by the `_memory` engines, in their order.
+
+    All the main tweets come first, in the order of the lines, and then the
+    quoted tweets whose id is not the id of a main tweet, each id once, in
+    the order of the chains.
+
+    The batches are deduplicated as they are read, carrying the ids of the
+    quoted tweets kept so far: each batch keeps its main tweets without
+    their quote chains, and the quoted tweets that are not in the previous
+    batches, so the repeated copies of the chains are never held together.
+    The quoted tweets that turn out to be main tweets of a later batch are
+    dropped at the end.
+
+    Parameters
+    ----------
+    batches : Iterable[TweetBatch]
+        The batches of `read_batches`.
+
+    Returns
+    -------
+    Tuple[TweetBatch, np.ndarray]
+        A batch without quotes, and a mask of its rows that are the first
+        copy of their id. q1 and q3 count a repeated main tweet on each
+        line, q2 only once.
+    """
+
+    mains, quoted = [], []
+    quoted_ids = np.zeros(0, dtype=np.int64)
+    for batch in batches:
+        mains.append(batch.take(np.arange(len(batch)), quotes=False))
+        if batch.quoted is None or not len(batch.quoted):
+            continue
+        # the first copy of each id of the batch that is new
+        ids = batch.quoted.ids
+        _, first = np.unique(ids, return_index=True)
+        first.sort()
+        rows = first[~np.isin(ids[first], quoted_ids)]
+        quoted.append(batch.quoted.take(rows, quotes=False))
+        quoted_ids = np.union1d(quoted_ids, ids[rows])
+
+    mains = TweetBatch.concat(mains)
+    quoted = TweetBatch.concat(quoted)
+    counted = np.flatnonzero(~np.isin(quoted.ids, mains.ids))
+
+    # the first copy of each main id
+    _, first_main = np.unique(mains.ids, return_index=True)
+    first_copy = np.zeros(len(mains) + len(counted), dtype=bool)
+    first_copy[first_main] = True
+    first_copy[len(mains):] = True
+
+    tweets = TweetBatch.concat([mains, quoted.take(counted, quotes=False)])
+    return tweets, first_copy
+
+
+def aggregate(tweets: TweetBatch, first_copy: np.ndarray) -> SharedCounts:
+    """Count the tweets of `counted_tweets`.
+
+    The position of each key is the position of the first tweet, or the
+    first mention or emoji, where it is counted, so the ties are sorted as
+    in the `_memory` engines.
+
+    Parameters
+    ----------
+    tweets : TweetBatch
+        The counted tweets, in order.
+    first_copy : np.ndarray
+        Mask of the tweets counted by q2.
+
+    Returns
+    -------
+    SharedCounts
+        The counters, which answer q1, q2 and q3.
+    """
+
+    def counts_and_first(codes: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        counts = np.bincount(codes, minlength=n).astype(np.int64)
+        first = np.full(n, NEVER, dtype=np.int64)
+        keys, positions = np.unique(codes, return_index=True)
+        first[keys] = positions
+        return counts, first
+
+    n_tweets = len(tweets)
+    days = tweets.days.astype(np.int64)
+    day_counts, day_first = counts_and_first(days, N_DAYS)
+
+    # a single vocabulary for the authors and the mentioned users
+    usernames, codes = StringColumn.concat([tweets.users, tweets.mentions]).encode()
+    users, mentions = codes[:n_tweets], codes[n_tweets:]
+    mention_counts, mention_first = counts_and_first(mentions, len(usernames))
+
+    n_users = max(len(usernames), 1)
+    pairs, pair_first, pair_counts = np.unique(
+        days * n_users + users, return_index=True, return_counts=True)
+
+    # the emojis are found in the text of each tweet, the only loop over
+    # the rows. Every emoji has a character that is not ASCII, the other
+    # texts are skipped
+    vocabulary = emoji_vocabulary()[1]
+    emojis = array('q')
+    contents = tweets.contents
+    for row in np.flatnonzero(first_copy & contents.non_ascii()):
+        emojis.extend(vocabulary[emj] for emj in extract_emojis(contents[row]))
+    emoji_counts, emoji_first = counts_and_first(
+        np.frombuffer(emojis, dtype=np.int64), len(vocabulary))
+
+    return SharedCounts(
+        day_counts, day_first, emoji_counts, emoji_first,
+        np.array(usernames, dtype=object), mention_counts, mention_first,
+        pairs // n_users, pairs % n_users, pair_counts.astype(np.int64),
+        pair_first.astype(np.int64))
+
+
+def count_file(file_path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> SharedCounts:
+    """Run the three stages on a file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    batch_size : int, optional
+        Main tweets of each batch, by default DEFAULT_BATCH_SIZE
+
+    Returns
+    -------
+    SharedCounts
+        The counters, which answer q1, q2 and q3.
+    """
+
+    return aggregate(*counted_tweets(read_batches(file_path, batch_size)))
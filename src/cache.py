@@ -0,0 +1,329 @@
+"""Cache the results of the q-functions.
+
+The q-functions scan the whole file on every call, which is wasteful when
+the same file is queried many times. The `cached` decorator keeps the
+results in a bounded in-process LRU and in a persistent on-disk store, so
+a warm call only costs a `stat` of the file and a dictionary lookup.
+
+The cache key is made of the function name, its parameters, the file
+fingerprint (path, size, modification time and, optionally, a hash of the
+contents) and the version of the code (`CACHE_VERSION` and a hash of the
+sources of the package and of the function's module). When the file or the
+code changes the key changes too, so stale results are never returned,
+also after an upgrade.
+
+Example
+-------
+>>> from src.cache import cached
+>>> from src.q1_memory import q1_memory
+>>> q1_cached = cached(q1_memory)
+>>> q1_cached("farmers-protest-tweets-2021-2-4.json")  # cold, scans the file
+>>> q1_cached("farmers-protest-tweets-2021-2-4.json")  # warm, from the LRU
+"""
+
+import copy
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+# Default folder of the on-disk store, can be changed with the
+# LATAM_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.environ.get(
+    'LATAM_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'latam-challenge'),
+)
+
+# Changed when the format of the entries changes, to drop the old entries
+CACHE_VERSION = 1
+
+# Sentinel to tell apart a missing entry from a cached None
+_MISSING = object()
+
+
+def file_fingerprint(file_path: str, hash_contents: bool = False) -> Tuple:
+    """Compute the fingerprint of a file, used to invalidate cached results.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the file.
+    hash_contents : bool, optional
+        If True, also hash the contents of the file with SHA-256. This
+        detects changes that keep the size and the modification time, at
+        the cost of reading the whole file, by default False
+
+    Returns
+    -------
+    Tuple
+        A tuple with the absolute path, the size in bytes, the modification
+        time in nanoseconds and the hex digest of the contents (or None).
+    """
+
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+
+    digest = None
+    if hash_contents:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            # read in blocks to avoid loading the whole file in memory
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+
+    return (path, stat.st_size, stat.st_mtime_ns, digest)
+
+
+@functools.lru_cache(maxsize=None)
+def _source_hash(module_path: Optional[str]) -> str:
+    # the q-functions call the other modules of the package, so all of
+    # them are hashed, once per process
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = sorted(entry.path for entry in os.scandir(package_dir)
+                   if entry.name.endswith('.py'))
+    if module_path is not None and os.path.abspath(module_path) not in paths:
+        paths.append(os.path.abspath(module_path))
+
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(os.path.basename(path).encode('utf-8'))
+        try:
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        except OSError:
+            pass
+    return sha.hexdigest()
+
+
+def code_version(func: Callable) -> Tuple[int, str]:
+    """The version of the code of a function, part of the cache keys.
+
+    Parameters
+    ----------
+    func : Callable
+        The cached function.
+
+    Returns
+    -------
+    Tuple[int, str]
+        `CACHE_VERSION` and the SHA-256 of the sources of the package and of
+        the module of the function.
+    """
+
+    module = sys.modules.get(func.__module__)
+    return (CACHE_VERSION, _source_hash(getattr(module, '__file__', None)))
+
+
+class ResultCache:
+    """Two level cache: a bounded in-process LRU backed by an on-disk store.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of entries kept in memory, by default 128
+    cache_dir : Optional[str], optional
+        Folder of the on-disk store. If None, only the in-memory LRU is
+        used, by default DEFAULT_CACHE_DIR
+    max_disk_bytes : int, optional
+        Maximum size of the on-disk store in bytes. The least recently
+        used files are removed when it is exceeded, by default 256 MB
+    """
+
+    def __init__(
+            self,
+            maxsize: int = 128,
+            cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+            max_disk_bytes: int = 256 * 1024 * 1024,
+            ) -> None:
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        # the LRU is shared by all the threads of a process
+        self._lock = threading.Lock()
+
+        if self.cache_dir is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError:
+                # the entries are then kept in memory only, see `put`
+                pass
+
+    def get(self, key: Tuple) -> Any:
+        """Return the cached value of `key`, or `_MISSING` if not cached.
+        A value found on disk is promoted to the in-memory LRU.
+        """
+
+        with self._lock:
+            if key in self._memory:
+                # mark as most recently used
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        if self.cache_dir is None:
+            return _MISSING
+
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+        # protect against hash collisions of the file name
+        if stored_key != key:
+            return _MISSING
+
+        # update the access time, which is used for the disk eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self._put_memory(key, value)
+        return value
+
+    def put(self, key: Tuple, value: Any) -> None:
+        """Store `value` under `key` in memory and on disk. An entry that
+        can't be written to disk, for example on a read-only or full disk,
+        is kept in memory only.
+        """
+
+        self._put_memory(key, value)
+
+        if self.cache_dir is None:
+            return
+
+        path = self._disk_path(key)
+        # write to a temporary file and rename it, so concurrent readers
+        # never see a partially written entry
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError:
+            # the cache is an optimization, the result is still returned
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Remove all the entries, in memory and on disk."""
+
+        with self._lock:
+            self._memory.clear()
+
+        if self.cache_dir is None:
+            return
+
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pkl'):
+                os.remove(entry.path)
+
+    def _put_memory(self, key: Tuple, value: Any) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            # drop the least recently used entries
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _disk_path(self, key: Tuple) -> str:
+        # the key only holds strings, numbers and tuples, so its repr is
+        # stable across processes
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.pkl')
+
+    def _evict_disk(self) -> None:
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.pkl'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+
+        # remove the least recently used files until the store fits
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def cached(
+        func: Optional[Callable] = None,
+        *,
+        cache: Optional[ResultCache] = None,
+        hash_contents: bool = False,
+        ) -> Callable:
+    """Decorate a q-function to cache its results.
+
+    The decorated function must take the path of the file as its first
+    argument. It can be used with or without arguments:
+
+    >>> q1_cached = cached(q1_memory)
+    >>> q2_cached = cached(q2_memory, cache=ResultCache(cache_dir=None))
+
+    Parameters
+    ----------
+    func : Optional[Callable], optional
+        The function to cache.
+    cache : Optional[ResultCache], optional
+        Where to store the results. A new `ResultCache` with the default
+        settings is created if None, by default None
+    hash_contents : bool, optional
+        Include a hash of the file contents in the fingerprint, see
+        `file_fingerprint`, by default False
+
+    Returns
+    -------
+    Callable
+        The decorated function. The cache is available in its `cache`
+        attribute.
+    """
+
+    if func is None:
+        return functools.partial(
+            cached, cache=cache, hash_contents=hash_contents)
+
+    if cache is None:
+        cache = ResultCache()
+
+    @functools.wraps(func)
+    def wrapper(file_path: str, *args, **kwargs):
+        key = (
+            code_version(func),
+            func.__module__,
+            func.__qualname__,
+            file_fingerprint(file_path, hash_contents),
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+
+        result = cache.get(key)
+        if result is _MISSING:
+            result = func(file_path, *args, **kwargs)
+            cache.put(key, result)
+
+        # return a copy so the caller can't modify the cached result
+        return copy.copy(result)
+
+    wrapper.cache = cache
+    return wrapper
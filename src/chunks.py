@@ -0,0 +1,90 @@
+"""Split a JSON lines file in chunks that can be processed independently.
+
+The chunks are byte ranges `[start, end)` aligned to the start of a line,
+so every line belongs to exactly one chunk, and a worker can read its chunk
+by seeking to `start`, without reading the rest of the file.
+"""
+
+import os
+from typing import Iterator, List, Tuple
+
+
+def align_to_line(f, offset: int) -> int:
+    """Return the offset of the first line that starts at or after `offset`.
+
+    Parameters
+    ----------
+    f : BinaryIO
+        The file, opened in binary mode.
+    offset : int
+        Any offset in the file.
+
+    Returns
+    -------
+    int
+        The offset of the start of a line, or the size of the file.
+    """
+
+    if offset <= 0:
+        return 0
+    # the line starts right after the newline, which can be the byte just
+    # before the offset
+    f.seek(offset - 1)
+    f.readline()
+    return f.tell()
+
+
+def split_file(file_path: str, n_chunks: int) -> List[Tuple[int, int]]:
+    """Split a file in at most `n_chunks` chunks of about the same size.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON lines file.
+    n_chunks : int
+        Number of chunks wanted. Fewer are returned if the file has fewer
+        lines.
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        The `(start, end)` byte range of each chunk, in order.
+    """
+
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        bounds = [align_to_line(f, size * i // n_chunks)
+                  for i in range(n_chunks)] + [size]
+
+    # long lines can make consecutive bounds equal, drop the empty chunks
+    return [(start, end) for start, end in zip(bounds, bounds[1:])
+            if start < end]
+
+
+def iter_chunk(file_path: str, start: int, end: int) -> Iterator[bytes]:
+    """Yield the lines of a chunk.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON lines file.
+    start : int
+        Offset of the first line of the chunk.
+    end : int
+        Offset where the chunk ends.
+
+    Yields
+    ------
+    bytes
+        Each line of the chunk, with its newline.
+    """
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                return
+            position += len(line)
+            yield line
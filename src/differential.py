@@ -0,0 +1,624 @@
+"""Differential harness: check that every engine agrees with the `_memory`
+engines on randomized inputs.
+
+`generate` builds random tweets made to hit the edge cases of the
+engines: deep quote chains, quoted tweets that are repeated or that are
+also main tweets, repeated main tweets, few dates, users and emojis so
+there are many ties, empty contents, mentions and quotes, and emojis of
+several code points (ZWJ sequences, flags, keycaps, skin tones). A tweet
+id always has the same tweet, as in the real data.
+
+`check_file` runs every engine on a file and compares the results with the
+ones of `q1_memory`, `q2_memory` and `q3_memory`:
+
+* strict engines must give the same lists, including the order of ties,
+* the other engines (the `_time` engines, built on pandas) must give the
+  same counts, but tied keys can be in any order, or be replaced at the
+  end of the top by other keys with the same count.
+
+The estimates of `preview` are checked apart, on a copy of each file
+without quoted tweets (their counts are biased by design): with a small
+budget, the true counts must be within the confidence intervals at about
+the confidence level, at least `MIN_COVERAGE` of the times.
+
+When an engine diverges, `minimize` reduces the input with the ddmin
+algorithm to a few lines that still show the divergence, to be used as a
+reproducer.
+
+Run it from the command line, it exits with an error on any divergence:
+
+    python -m src.differential --seeds 20 --lines 300
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from .index import TweetIndex
+from .q1_memory import q1_memory
+from .q2_memory import q2_memory
+from .q3_memory import q3_memory
+
+# Emojis of one or several code points, and texts without emojis
+EMOJIS = [
+    '\U0001f600',                                 # grinning face
+    '\U0001f6eb',                                 # airplane departure
+    '\u2764\ufe0f',                               # red heart
+    '\U0001f44d\U0001f3fd',                       # thumbs up, skin tone
+    '\U0001f1ee\U0001f1f3',                       # flag of India
+    '1\ufe0f\u20e3',                              # keycap 1
+    '\U0001f468\u200d\U0001f469\u200d\U0001f467',  # family, ZWJ sequence
+    '\U0001f3f3\ufe0f\u200d\U0001f308',           # rainbow flag
+    '\U0001f44d\U0001f3fd\u200d\U0001f600',       # non-RGI ZWJ sequence
+]
+WORDS = ['farmers', 'protest', '@user_1', '#tag', '\u00e1', '']
+
+# Longest quote chain generated
+MAX_DEPTH = 8
+
+# Previews of each file checked for coverage, their confidence level, and
+# the least fraction of intervals that must contain the true count. The
+# margin under the confidence absorbs the noise of the runs and the normal
+# approximation of the intervals on small samples
+PREVIEW_RUNS = 50
+PREVIEW_CONFIDENCE = 0.95
+MIN_COVERAGE = 0.85
+
+Results = Dict[str, list]
+
+
+def generate(
+        seed: int,
+        n_lines: int = 200,
+        duplicate_mains: bool = False,
+        quotes: bool = True,
+        ) -> List[dict]:
+    """Generate random main tweets, one per line.
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the random generator.
+    n_lines : int, optional
+        Number of lines, by default 200
+    duplicate_mains : bool, optional
+        Whether some main tweets are repeated in several lines. The `_time`
+        engines count them once, the `_memory` engines of q1 and q3 on
+        each line, by default False
+    quotes : bool, optional
+        Whether tweets can quote other tweets, by default True
+
+    Returns
+    -------
+    List[dict]
+        The main tweets.
+    """
+
+    rng = random.Random(seed)
+    # few values, so there are many ties
+    n_days = rng.randint(1, 12)
+    n_users = rng.randint(2, 8)
+    tweets = {}
+
+    def tweet(tweet_id: int) -> dict:
+        if tweet_id in tweets:
+            return tweets[tweet_id]
+        # quote an older tweet, so the chains never loop
+        quoted = None
+        if quotes and tweet_id > 1 and rng.random() < 0.6:
+            candidate = tweet(rng.randrange(1, tweet_id))
+            if candidate['depth'] < MAX_DEPTH:
+                quoted = candidate
+        content = ' '.join(rng.choice(EMOJIS + WORDS)
+                           for _ in range(rng.choice([0, 1, 2, 5])))
+        mentions = rng.choice([None, [], [f'user_{rng.randrange(n_users)}'
+                                          for _ in range(rng.randint(1, 3))]])
+        tweets[tweet_id] = {
+            'date': f'2021-02-{rng.randrange(n_days) + 1:02d}T'
+                    f'{rng.randrange(24):02d}:00:00+00:00',
+            'id': tweet_id,
+            'user': {'username': f'user_{rng.randrange(n_users)}'},
+            'content': content,
+            'mentionedUsers': (None if mentions is None else
+                               [{'username': u} for u in mentions]),
+            'quotedTweet': quoted,
+            'depth': 0 if quoted is None else quoted['depth'] + 1,
+        }
+        return tweets[tweet_id]
+
+    # main and quoted tweets share the ids, so quoted tweets are often
+    # main tweets too
+    space = range(1, 2 * n_lines + 2)
+    if duplicate_mains:
+        ids = [rng.choice(space) for _ in range(n_lines)]
+    else:
+        ids = rng.sample(space, n_lines)
+    return [tweet(tweet_id) for tweet_id in ids]
+
+
+def write_tweets(tweets: Sequence[dict], file_path: str) -> None:
+    """Write tweets as a JSON lines file, without the generator fields."""
+
+    def clean(t):
+        if t is None:
+            return None
+        t = {key: value for key, value in t.items() if key != 'depth'}
+        t['quotedTweet'] = clean(t['quotedTweet'])
+        return t
+
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for t in tweets:
+            f.write(json.dumps(clean(t)) + '\n')
+
+
+def _memory(path: str) -> Results:
+    return {'q1': q1_memory(path), 'q2': q2_memory(path), 'q3': q3_memory(path)}
+
+
+def _memory_variants(path: str) -> Results:
+    return {'q1': q1_memory(path, two_phase=True),
+            'q2': q2_memory(path, prefilter=False),
+            'q3': q3_memory(path, prefilter=False)}
+
+
+def _spill(path: str) -> Results:
+    # a tiny budget, so everything is spilled
+    return {'q1': q1_memory(path, max_memory_mb=0.001),
+            'q2': q2_memory(path, max_memory_mb=0.001),
+            'q3': q3_memory(path, max_memory_mb=0.001)}
+
+
+def _time(path: str) -> Results:
+    from .q1_time import q1_time
+    from .q2_time import q2_time
+    from .q3_time import q3_time
+    return {'q1': q1_time(path), 'q2': q2_time(path, workers=1), 'q3': q3_time(path)}
+
+
+def _time_workers(path: str) -> Results:
+    from . import emojis
+    from .q1_time import q1_time
+    from .q2_time import q2_time
+    from .q3_time import q3_time
+    # small batches, so the texts are split across the processes
+    previous = emojis.MIN_BATCH_SIZE
+    emojis.MIN_BATCH_SIZE = 16
+    try:
+        q2 = q2_time(path, workers=2, min_parallel=0)
+    finally:
+        emojis.MIN_BATCH_SIZE = previous
+    return {'q1': q1_time(path), 'q2': q2, 'q3': q3_time(path)}
+
+
+def _from_index(index) -> Results:
+    return {'q1': index.q1(), 'q2': index.q2(), 'q3': index.q3()}
+
+
+def _index(path: str) -> Results:
+    return _from_index(TweetIndex.from_file(path))
+
+
+def _state(path: str) -> Results:
+    from .chunks import iter_chunk, split_file
+    from .state import AggregateState, merge_states
+    with tempfile.TemporaryDirectory() as directory:
+        states = []
+        for i, (start, end) in enumerate(split_file(path, 3)):
+            shard = os.path.join(directory, f'shard-{i}.json')
+            with open(shard, 'wb') as f:
+                f.writelines(iter_chunk(path, start, end))
+            states.append(AggregateState.loads(
+                AggregateState.from_file(shard).dumps()))
+        return _from_index(merge_states(states).finalize())
+
+
+def _sqlite(path: str) -> Results:
+    from .sqlite_backend import SQLiteBackend
+    with tempfile.TemporaryDirectory() as directory:
+        with SQLiteBackend(os.path.join(directory, 'tweets.db')) as backend:
+            backend.ingest(path)
+            return _from_index(backend)
+
+
+def _shared_counts(path: str) -> Results:
+    from .shared_counts import SharedCounts
+    return _from_index(SharedCounts.from_file(path, workers=2))
+
+
+def _batch(path: str) -> Results:
+    from .batch import count_file
+    # small batches, so the tweets span several of them
+    return _from_index(count_file(path, batch_size=7))
+
+
+def _threads(path: str) -> Results:
+    return {'q1': q1_memory(path, mode='thread', workers=3),
+            'q2': q2_memory(path, mode='thread', workers=3),
+            'q3': q3_memory(path, mode='thread', workers=3)}
+
+
+def _quote_index(path: str) -> Results:
+    from . import quote_index
+    # the indexes of the random files are saved in a temporary folder
+    previous = quote_index.DEFAULT_INDEX_DIR
+    with tempfile.TemporaryDirectory() as directory:
+        quote_index.DEFAULT_INDEX_DIR = directory
+        try:
+            # the first call builds the index, the next ones load it
+            return {'q1': q1_memory(path, quote_index=True),
+                    'q2': q2_memory(path, quote_index=True),
+                    'q3': q3_memory(path, quote_index=True)}
+        finally:
+            quote_index.DEFAULT_INDEX_DIR = previous
+
+
+def _cached(path: str) -> Results:
+    from .cache import ResultCache, cached
+    with tempfile.TemporaryDirectory() as directory:
+        funcs = [cached(func, cache=ResultCache(cache_dir=directory))
+                 for func in (q1_memory, q2_memory, q3_memory)]
+        # the second call reads the result from the cache
+        for func in funcs:
+            func(path)
+        return dict(zip(('q1', 'q2', 'q3'), (func(path) for func in funcs)))
+
+
+def _preview(path: str) -> Results:
+    from .preview import preview
+    # with a large budget the preview ends with the exact answer
+    result = list(preview(path, time_budget=3600))[-1]
+    return {'q1': result.q1,
+            'q2': [(e.key, e.count) for e in result.q2],
+            'q3': [(e.key, e.count) for e in result.q3]}
+
+
+class Engine(NamedTuple):
+    """An engine under test: a function returning the results of q1, q2
+    and q3, and whether the order of the ties must be the same.
+    """
+
+    run: Callable[[str], Results]
+    strict: bool
+
+
+ENGINES = {
+    'memory_variants': Engine(_memory_variants, True),
+    'spill': Engine(_spill, True),
+    'index': Engine(_index, True),
+    'state': Engine(_state, True),
+    'sqlite': Engine(_sqlite, True),
+    'shared_counts': Engine(_shared_counts, True),
+    'batch': Engine(_batch, True),
+    'threads': Engine(_threads, True),
+    'quote_index': Engine(_quote_index, True),
+    'cached': Engine(_cached, True),
+    'preview': Engine(_preview, True),
+    'time': Engine(_time, False),
+    'time_workers': Engine(_time_workers, False),
+}
+
+
+class Divergence(NamedTuple):
+    """Results of an engine that differ from the `_memory` engines."""
+
+    engine: str
+    query: str
+    expected: list
+    actual: list
+    file_path: str
+
+
+def _same_counts(expected: list, actual: list, counts: Counter) -> bool:
+    # the same counts in the same order, and each key has its real count
+    return (len(expected) == len(actual)
+            and len({key for key, _ in actual}) == len(actual)
+            and [n for _, n in expected] == [n for _, n in actual]
+            and all(counts[key] == n for key, n in actual))
+
+
+def agree(
+        query: str,
+        expected: list,
+        actual: list,
+        index: TweetIndex,
+        strict: bool,
+        ) -> bool:
+    """Whether the results of an engine agree with the expected ones.
+
+    Parameters
+    ----------
+    query : str
+        'q1', 'q2' or 'q3'.
+    expected : list
+        Results of the `_memory` engine.
+    actual : list
+        Results of the engine under test.
+    index : TweetIndex
+        All the counts of the file, to check the ties.
+    strict : bool
+        Whether the ties must be in the same order.
+
+    Returns
+    -------
+    bool
+        True if they agree.
+    """
+
+    if strict or actual == expected:
+        return actual == expected
+
+    if query == 'q2':
+        return _same_counts(expected, actual, index.emoji_counts)
+    if query == 'q3':
+        return _same_counts(expected, actual, index.mention_counts)
+
+    # q1: the dates have the expected counts, and each user is one of the
+    # top users of its date
+    dates = index.date_counts
+    if not _same_counts([(d, dates[d]) for d, _ in expected],
+                        [(d, dates[d]) for d, _ in actual], dates):
+        return False
+    for day, username in actual:
+        users = index.user_counts[day]
+        if users[username] != max(users.values()):
+            return False
+    return True
+
+
+def check_file(
+        file_path: str,
+        engines: Optional[Sequence[str]] = None,
+        ) -> List[Divergence]:
+    """Run the engines on a file and compare them with the `_memory`
+    engines.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    engines : Optional[Sequence[str]], optional
+        Names of the engines of ENGINES to run. If None, all of them,
+        by default None
+
+    Returns
+    -------
+    List[Divergence]
+        The divergences found, empty if all the engines agree.
+    """
+
+    expected = _memory(file_path)
+    index = TweetIndex.from_file(file_path)
+
+    divergences = []
+    for name in engines or ENGINES:
+        engine = ENGINES[name]
+        actual = engine.run(file_path)
+        for query in ('q1', 'q2', 'q3'):
+            if not agree(query, expected[query], actual[query], index, engine.strict):
+                divergences.append(Divergence(
+                    name, query, expected[query], actual[query], file_path))
+    return divergences
+
+
+def preview_coverage(
+        file_path: str,
+        runs: int = PREVIEW_RUNS,
+        confidence: float = PREVIEW_CONFIDENCE,
+        ) -> Dict[str, float]:
+    """Fraction of the intervals of small previews of a file that contain
+    the true count.
+
+    Each preview has a single round of 64 lines, with a different seed.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    runs : int, optional
+        Number of previews, by default PREVIEW_RUNS
+    confidence : float, optional
+        Level of the intervals, by default PREVIEW_CONFIDENCE
+
+    Returns
+    -------
+    Dict[str, float]
+        The coverage of the estimates of the dates, of q2 and of q3.
+    """
+
+    from .preview import preview
+
+    index = TweetIndex.from_file(file_path)
+    counts = {'dates': index.date_counts, 'q2': index.emoji_counts,
+              'q3': index.mention_counts}
+    inside, total = Counter(), Counter()
+    for seed in range(runs):
+        result = next(preview(file_path, time_budget=0, confidence=confidence,
+                              initial_sample=64, seed=seed))
+        for name, true_counts in counts.items():
+            for e in getattr(result, name):
+                inside[name] += e.low <= true_counts[e.key] <= e.high
+                total[name] += 1
+    return {name: inside[name] / total[name] if total[name] else 1.0
+            for name in counts}
+
+
+def check_preview(file_path: str, runs: int = PREVIEW_RUNS) -> List[Divergence]:
+    """Check the coverage of the intervals of `preview` on a file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data, without quoted
+        tweets.
+    runs : int, optional
+        Number of previews, by default PREVIEW_RUNS
+
+    Returns
+    -------
+    List[Divergence]
+        A divergence of the engine `preview_coverage` for each estimate
+        whose coverage is under MIN_COVERAGE.
+    """
+
+    return [Divergence('preview_coverage', name, [MIN_COVERAGE], [coverage], file_path)
+            for name, coverage in preview_coverage(file_path, runs).items()
+            if coverage < MIN_COVERAGE]
+
+
+def ddmin(items: List, fails: Callable[[List], bool]) -> List:
+    """Reduce a list to a small sublist on which `fails` is still true,
+    with the ddmin algorithm of Zeller and Hildebrandt.
+
+    Parameters
+    ----------
+    items : List
+        The failing input, `fails(items)` must be true.
+    fails : Callable[[List], bool]
+        Whether a sublist still fails.
+
+    Returns
+    -------
+    List
+        A sublist, where removing any single item makes it pass.
+    """
+
+    n = 2
+    while len(items) >= 2:
+        size = math.ceil(len(items) / n)
+        subsets = [items[i:i + size] for i in range(0, len(items), size)]
+
+        for i, subset in enumerate(subsets):
+            complement = [item for j, s in enumerate(subsets) if j != i for item in s]
+            if fails(subset):
+                items, n = subset, 2
+                break
+            if len(subsets) > 2 and fails(complement):
+                items, n = complement, max(n - 1, 2)
+                break
+        else:
+            # no reduction, split in smaller subsets
+            if n >= len(items):
+                break
+            n = min(2 * n, len(items))
+    return items
+
+
+def minimize(divergence: Divergence, output_path: str) -> List[dict]:
+    """Reduce the input of a divergence to a few lines that still show it,
+    and write them as a reproducer.
+
+    Parameters
+    ----------
+    divergence : Divergence
+        A divergence found by `check_file`.
+    output_path : str
+        Path of the JSON lines file of the reproducer.
+
+    Returns
+    -------
+    List[dict]
+        The lines of the reproducer.
+    """
+
+    with open(divergence.file_path, 'r', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+
+    def fails(subset: List[dict]) -> bool:
+        write_tweets(subset, output_path)
+        return any(d.query == divergence.query
+                   for d in check_file(output_path, [divergence.engine]))
+
+    minimal = ddmin(lines, fails)
+    write_tweets(minimal, output_path)
+    return minimal
+
+
+def run(
+        seeds: Sequence[int],
+        n_lines: int = 200,
+        duplicate_mains: bool = False,
+        engines: Optional[Sequence[str]] = None,
+        directory: Optional[str] = None,
+        ) -> List[Divergence]:
+    """Check the engines on a random file for each seed.
+
+    Parameters
+    ----------
+    seeds : Sequence[int]
+        Seeds of the random files.
+    n_lines : int, optional
+        Number of lines of each file, by default 200
+    duplicate_mains : bool, optional
+        Whether the main tweets can be repeated, by default False
+    engines : Optional[Sequence[str]], optional
+        Names of the engines to run, by default all of them
+    directory : Optional[str], optional
+        Folder where the files are written, created if needed. The files
+        with divergences are kept there to reproduce them. If None, a
+        temporary folder removed before returning, by default None
+
+    Returns
+    -------
+    List[Divergence]
+        All the divergences found. The coverage of the previews is checked
+        too when `preview` is one of the engines.
+    """
+
+    if directory is None:
+        with tempfile.TemporaryDirectory(prefix='differential-') as directory:
+            return run(seeds, n_lines, duplicate_mains, engines, directory)
+
+    os.makedirs(directory, exist_ok=True)
+    divergences = []
+    for seed in seeds:
+        file_path = os.path.join(directory, f'seed-{seed}.json')
+        write_tweets(generate(seed, n_lines, duplicate_mains), file_path)
+        found = check_file(file_path, engines)
+        if not found:
+            os.remove(file_path)
+        divergences.extend(found)
+
+        if engines is None or 'preview' in engines:
+            file_path = os.path.join(directory, f'seed-{seed}-no-quotes.json')
+            write_tweets(generate(seed, n_lines, quotes=False), file_path)
+            found = check_preview(file_path)
+            if not found:
+                os.remove(file_path)
+            divergences.extend(found)
+    return divergences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seeds', type=int, default=20, help='number of random files')
+    parser.add_argument('--lines', type=int, default=200, help='lines of each file')
+    parser.add_argument('--duplicate-mains', action='store_true')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES))
+    parser.add_argument('--directory', default='differential-failures',
+                        help='folder of the files with divergences and their reproducers')
+    args = parser.parse_args()
+
+    divergences = run(range(args.seeds), args.lines, args.duplicate_mains,
+                      args.engines, args.directory)
+    reported = set()
+    for d in divergences:
+        print(f'{d.engine} {d.query} diverges on {d.file_path}\n'
+              f'  expected {d.expected}\n  actual   {d.actual}')
+        # one reproducer per engine and query, the coverage of the
+        # previews is a rate over many runs and is not reduced
+        if d.engine in ENGINES and (d.engine, d.query) not in reported:
+            reported.add((d.engine, d.query))
+            output_path = f'{d.file_path[:-5]}-{d.engine}-{d.query}-min.json'
+            lines = minimize(d, output_path)
+            print(f'  reproducer of {len(lines)} lines: {output_path}')
+
+    if not os.listdir(args.directory):
+        os.rmdir(args.directory)
+    print(f'{len(divergences)} divergences')
+    sys.exit(1 if divergences else 0)
@@ -0,0 +1,319 @@
+"""Precompiled emoji lookup table, optionally cached on disk.
+
+Importing the `emoji` package loads its whole Unicode database from JSON,
+and the first search builds a tree of all the emojis. Every process that
+runs q2, including each worker of a pool, pays for this again.
+
+This module compiles the data needed to find the emojis (the search tree,
+the set of emojis and the set of components, such as skin tones) once per
+process. The table is also written as a `marshal` file, keyed by the
+version of the `emoji` package, to a folder of the user cache
+(`cache.DEFAULT_CACHE_DIR`), and the next processes load it in a few
+milliseconds, without importing `emoji` at all. The
+`LATAM_EMOJI_TABLE_DIR` environment variable changes the folder, and an
+empty value disables the cache on disk.
+
+`EmojiTable.find` follows the algorithm of `emoji.emoji_list` in the
+versions of `TOKENIZER_VERSIONS`, so it finds exactly the same emojis,
+including the handling of the zero width joiners of the non-RGI emoji
+sequences. With other versions of `emoji`, `find_emojis` calls
+`emoji.emoji_list` instead.
+"""
+
+import importlib.util
+import marshal
+import os
+import re
+import sys
+from typing import Callable, FrozenSet, List, Optional
+
+from .cache import DEFAULT_CACHE_DIR
+
+# Default folder of the cached tables
+DEFAULT_TABLE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'emoji-table')
+
+# Versions (major.minor) of the `emoji` package whose tokenizer is
+# followed by `EmojiTable.find`
+TOKENIZER_VERSIONS = ('2.16',)
+
+# Marks the end of an emoji in the search tree. The keys of the tree are
+# single characters, so it never collides with them
+_END = ''
+_ZWJ = '\u200d'
+_VARIATION_SELECTORS = ('\ufe0e', '\ufe0f')
+
+
+class EmojiTable:
+    """The emojis of a version of the `emoji` package, ready to search.
+
+    Parameters
+    ----------
+    version : str
+        Version of the `emoji` package the table was built from.
+    tree : dict
+        Search tree, each level is keyed by the next character of the
+        emojis and `_END` marks a complete emoji.
+    emojis : FrozenSet[str]
+        All the emojis.
+    components : FrozenSet[str]
+        The emojis with the status `component`, such as skin tones.
+    """
+
+    __slots__ = ('version', 'tree', 'emojis', 'components')
+
+    def __init__(
+            self,
+            version: str,
+            tree: dict,
+            emojis: FrozenSet[str],
+            components: FrozenSet[str],
+            ) -> None:
+        self.version = version
+        self.tree = tree
+        self.emojis = emojis
+        self.components = components
+
+    @classmethod
+    def build(cls) -> 'EmojiTable':
+        """Build the table from the data of the `emoji` package."""
+
+        import emoji
+        from emoji.unicode_codes import EMOJI_DATA, STATUS
+
+        tree = {}
+        for emj in EMOJI_DATA:
+            sub_tree = tree
+            for char in emj:
+                sub_tree = sub_tree.setdefault(char, {})
+            sub_tree[_END] = True
+
+        components = frozenset(
+            emj for emj, data in EMOJI_DATA.items()
+            if data['status'] == STATUS['component'])
+
+        return cls(emoji.__version__, tree, frozenset(EMOJI_DATA), components)
+
+    def dumps(self) -> bytes:
+        """Serialize the table."""
+
+        return marshal.dumps(
+            (self.version, self.tree, self.emojis, self.components))
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'EmojiTable':
+        """Deserialize a table written by `dumps`."""
+
+        return cls(*marshal.loads(data))
+
+    def find(self, string: str) -> List[str]:
+        """Find the emojis in a string, the same as `emoji.emoji_list`.
+
+        This is `emoji.tokenizer.tokenize`, with `keep_zwj=False`, keeping
+        only the emojis.
+
+        Parameters
+        ----------
+        string : str
+            The text to search for emojis.
+
+        Returns
+        -------
+        List[str]
+            The emojis, in order of appearance.
+        """
+
+        tree = self.tree
+        emojis = self.emojis
+        found = []
+        # pending tokens (chars, is_emoji), they are final once a character
+        # that can't continue a zero width joiner sequence is found
+        result = []
+        # positions of the zero width joiners of non-RGI sequences
+        ignore = set()
+        i = 0
+        length = len(string)
+        while i < length:
+            consumed = False
+            char = string[i]
+            if i in ignore:
+                i += 1
+                continue
+
+            elif char in tree:
+                j = i + 1
+                sub_tree = tree[char]
+                while j < length and string[j] in sub_tree:
+                    if j in ignore:
+                        break
+                    sub_tree = sub_tree[string[j]]
+                    j += 1
+                if _END in sub_tree:
+                    result.append((string[i:j], True))
+                    i = j - 1
+                    consumed = True
+
+            elif (
+                char == _ZWJ
+                and result
+                and result[-1][0] in emojis
+                and i > 0
+                and string[i - 1] in tree
+            ):
+                # the zero width joiner follows an emoji, it is skipped and
+                # the emoji before it is searched again
+                ignore.add(i)
+                if result[-1][0] in self.components:
+                    i = i - sum(len(token[0]) for token in result[-2:])
+                    if string[i] == _ZWJ:
+                        i += 1
+                        del result[-1]
+                    else:
+                        del result[-2:]
+                else:
+                    i = i - len(result[-1][0])
+                    del result[-1]
+                continue
+
+            elif result:
+                found.extend(chars for chars, is_emoji in result if is_emoji)
+                result = []
+
+            if not consumed and char not in _VARIATION_SELECTORS:
+                result.append((char, False))
+            i += 1
+
+        found.extend(chars for chars, is_emoji in result if is_emoji)
+        return found
+
+
+def table_cache_dir() -> Optional[str]:
+    """Folder of the cached tables, DEFAULT_TABLE_DIR unless the
+    LATAM_EMOJI_TABLE_DIR environment variable is set. None, so the tables
+    are not cached on disk, if the variable is empty.
+    """
+
+    return os.environ.get('LATAM_EMOJI_TABLE_DIR', DEFAULT_TABLE_DIR) or None
+
+
+# Folder of the cached tables, None if they are not cached on disk
+TABLE_CACHE_DIR = table_cache_dir()
+
+
+def installed_version() -> Optional[str]:
+    """Version of the installed `emoji` package, read from its source
+    without importing it. None if it is not installed.
+    """
+
+    spec = importlib.util.find_spec('emoji')
+    if spec is None or spec.origin is None:
+        return None
+    with open(spec.origin, 'r', encoding='utf-8') as f:
+        match = re.search(r"^__version__ = ['\"]([^'\"]+)['\"]", f.read(), re.M)
+    return match.group(1) if match else None
+
+
+def table_path(version: str, cache_dir: str) -> str:
+    """Path of the cached table of an `emoji` version. The `marshal`
+    format depends on the Python version, so it is part of the name.
+    """
+
+    python = f'{sys.version_info.major}{sys.version_info.minor}'
+    return os.path.join(cache_dir, f'emoji-table-{version}-py{python}.marshal')
+
+
+def load_table(cache_dir: Optional[str] = TABLE_CACHE_DIR) -> EmojiTable:
+    """Load the table of the installed `emoji` package from the cache,
+    building and caching it first if needed.
+
+    Parameters
+    ----------
+    cache_dir : Optional[str], optional
+        Folder of the cached tables. If None, the table is built and not
+        cached, by default TABLE_CACHE_DIR
+
+    Returns
+    -------
+    EmojiTable
+        The table of the installed version.
+    """
+
+    if cache_dir is None:
+        return EmojiTable.build()
+
+    version = installed_version()
+    if version is not None:
+        path = table_path(version, cache_dir)
+        try:
+            with open(path, 'rb') as f:
+                table = EmojiTable.loads(f.read())
+            if table.version == version:
+                return table
+        except (OSError, EOFError, ValueError, TypeError):
+            # missing or corrupted, build it again
+            pass
+
+    table = EmojiTable.build()
+
+    path = table_path(table.version, cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file and rename it, so concurrent processes
+        # never read a partially written table
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(table.dumps())
+        os.replace(tmp_path, path)
+    except OSError:
+        # the cache is an optimization, a read-only folder is not an error
+        pass
+
+    return table
+
+
+# Table of the process and its search function, loaded on first use
+_table = None
+_find = None
+
+
+def process_table() -> EmojiTable:
+    """The table of the process, loaded with `load_table` on first use."""
+
+    global _table
+    if _table is None:
+        _table = load_table(TABLE_CACHE_DIR)
+    return _table
+
+
+def _finder() -> Callable[[str], List[str]]:
+    table = process_table()
+    if table.version.rsplit('.', 1)[0] in TOKENIZER_VERSIONS:
+        return table.find
+
+    # the tokenizer of this version may differ from the one of `find`
+    import emoji
+
+    def emoji_list(string: str) -> List[str]:
+        return [match['emoji'] for match in emoji.emoji_list(string)]
+    return emoji_list
+
+
+def find_emojis(string: str) -> List[str]:
+    """Find the emojis in a string, with the table of the process, or with
+    `emoji.emoji_list` if the version of `emoji` is not one of
+    TOKENIZER_VERSIONS.
+
+    Parameters
+    ----------
+    string : str
+        The text to search for emojis.
+
+    Returns
+    -------
+    List[str]
+        The emojis, in order of appearance.
+    """
+
+    global _find
+    if _find is None:
+        _find = _finder()
+    return _find(string)
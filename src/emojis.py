@@ -0,0 +1,230 @@
+"""Count the emojis of a list of texts, in parallel when it pays off.
+
+Searching the emojis is pure Python and holds the GIL, so threads don't help.
+The texts are split in batches that are processed by a pool of processes,
+each one returning a partial `Counter`. The partial counters are merged in
+the same order as the batches, so the result, including the order of the
+emojis with the same count, is the same as counting serially.
+
+The datasets have many repeated texts (copy-pasted slogans, quotes), so the
+emojis of each distinct text are memoized. Texts with only ASCII characters
+can't have emojis and skip the tokenizer altogether.
+
+The emojis are found with the precompiled table of `emoji_table`, loaded
+on the first text that needs the tokenizer, so importing this module is
+cheap.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+from .emoji_table import find_emojis
+
+# Below this number of texts the cost of starting the pool and sending the
+# texts to the workers is higher than the gain of the parallelism
+PARALLEL_MIN_TEXTS = 20_000
+# Batches are big enough to amortize the inter-process communication and
+# small enough to keep all the workers busy until the end
+MIN_BATCH_SIZE = 2_000
+BATCHES_PER_WORKER = 4
+# Maximum number of distinct texts kept in the memo
+MEMO_MAXSIZE = 65_536
+
+
+class EmojiMemo:
+    """Bounded LRU memo of the emojis found in each distinct text.
+
+    The texts are keyed by a hash of their contents, so the memo never
+    holds the texts themselves. The hits, misses and the estimated time
+    saved are reported in the `metrics` counters `emoji_memo_hits`,
+    `emoji_memo_misses` and `emoji_memo_seconds_saved`, and the texts that
+    skip the tokenizer in `emoji_ascii_skips`.
+
+    The memo can be shared by threads, as the workers of
+    `parallel.count_file`: the LRU order is only changed under a lock, the
+    tokenizer runs outside of it.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of texts to remember, by default MEMO_MAXSIZE
+    """
+
+    def __init__(self, maxsize: int = MEMO_MAXSIZE) -> None:
+        self.maxsize = maxsize
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        # time spent in the tokenizer, to estimate the time saved by a hit
+        self._miss_seconds = 0.0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._memo)
+
+    def extract(self, text: str) -> Tuple[str, ...]:
+        """Return the emojis in `text`, in order of appearance.
+
+        Parameters
+        ----------
+        text : str
+            The text to search for emojis.
+
+        Returns
+        -------
+        Tuple[str, ...]
+            The emojis found, the same as `emoji.emoji_list` would find.
+        """
+
+        # all the emojis have code points beyond ASCII
+        if text.isascii():
+            metrics.increment('emoji_ascii_skips')
+            return ()
+
+        # surrogatepass accepts lone surrogates, which json allows
+        key = hashlib.blake2b(
+            text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+        with self._lock:
+            found = self._memo.get(key)
+            if found is not None:
+                # mark as most recently used
+                self._memo.move_to_end(key)
+                saved = self._miss_seconds / self._misses
+        if found is not None:
+            metrics.increment('emoji_memo_hits')
+            metrics.increment('emoji_memo_seconds_saved', saved)
+            return found
+
+        start = time.perf_counter()
+        found = tuple(find_emojis(text))
+        elapsed = time.perf_counter() - start
+        metrics.increment('emoji_memo_misses')
+
+        with self._lock:
+            self._miss_seconds += elapsed
+            self._misses += 1
+            self._memo[key] = found
+            # drop the least recently used text
+            if len(self._memo) > self.maxsize:
+                self._memo.popitem(last=False)
+
+        return found
+
+
+# Memo shared by all the q2 functions of the process
+_memo = EmojiMemo()
+
+
+def extract_emojis(text: str) -> Tuple[str, ...]:
+    """Return the emojis in `text` using the memo of the process.
+
+    Parameters
+    ----------
+    text : str
+        The text to search for emojis.
+
+    Returns
+    -------
+    Tuple[str, ...]
+        The emojis found, in order of appearance.
+    """
+
+    return _memo.extract(text)
+
+
+def count_batch(texts: List[str]) -> Counter:
+    """Count the emojis in a batch of texts, serially.
+
+    Parameters
+    ----------
+    texts : List[str]
+        The texts to search for emojis.
+
+    Returns
+    -------
+    Counter
+        The count of each emoji, in order of first appearance.
+    """
+
+    return Counter(e for text in texts for e in extract_emojis(text))
+
+
+def _count_batch_worker(texts: List[str]) -> Tuple[Counter, Dict[str, float]]:
+    # count in a worker process and return the counters measured during
+    # this batch, so they can be added to the ones of the parent process
+    before = metrics.snapshot()
+    counts = count_batch(texts)
+    after = metrics.snapshot()
+    delta = {name: value - before.get(name, 0) for name, value in after.items()}
+    return counts, delta
+
+
+def batch_size(n_texts: int, workers: int) -> int:
+    """Number of texts sent to a worker at a time.
+
+    Parameters
+    ----------
+    n_texts : int
+        Total number of texts.
+    workers : int
+        Number of worker processes.
+
+    Returns
+    -------
+    int
+        The batch size, at least `MIN_BATCH_SIZE`.
+    """
+
+    return max(MIN_BATCH_SIZE, math.ceil(n_texts / (workers * BATCHES_PER_WORKER)))
+
+
+def count_emojis(
+        texts: List[str],
+        workers: Optional[int] = None,
+        min_parallel: int = PARALLEL_MIN_TEXTS,
+        ) -> Counter:
+    """Count the emojis in the texts, sharding them across a process pool.
+
+    Parameters
+    ----------
+    texts : List[str]
+        The texts to search for emojis.
+    workers : Optional[int], optional
+        Number of worker processes. If None, use the number of CPUs,
+        by default None
+    min_parallel : int, optional
+        Count serially if there are fewer texts than this,
+        by default PARALLEL_MIN_TEXTS
+
+    Returns
+    -------
+    Counter
+        The count of each emoji, in order of first appearance.
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # small inputs are faster without the pool
+    if workers <= 1 or len(texts) < min_parallel:
+        return count_batch(texts)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    size = batch_size(len(texts), workers)
+    batches = (texts[i:i + size] for i in range(0, len(texts), size))
+
+    counts = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map returns the partial counters in the order of the batches
+        for partial, delta in pool.map(_count_batch_worker, batches):
+            counts.update(partial)
+            metrics.merge(delta)
+
+    return counts
@@ -0,0 +1,153 @@
+"""Mentions of users extracted from the text of the tweets.
+
+Some archives have no `mentionedUsers`, or have it null, and q3 would find
+no mentions in them. The mentions can be read from the `@handle` tokens of
+the content instead, with the rules of Twitter for handles (as in its
+twitter-text library):
+
+* a handle is `@` or the fullwidth `\uff20`, followed by 1 to 15 ASCII
+  letters, digits or underscores,
+* it is not preceded by a letter, digit, underscore or one of `!#$%&*@`,
+  so e-mail addresses (`user@example.com`) are not mentions,
+* it is not followed by another letter, digit or underscore (the handle
+  would be too long), by `@`, by a Latin accented letter or by `://`,
+* a handle followed by `/` and a letter is a list (`@user/list`), not a
+  mention.
+
+The handles are returned as written, Twitter ignores their case but the
+`mentionedUsers` field has the case of the account.
+
+The source of the mentions of q3 is one of `MENTION_SOURCES`:
+
+* `field`: the `mentionedUsers` field,
+* `content`: the handles of the content,
+* `auto`: for each tweet, the field if it is present and not null, else the
+  handles of the content.
+"""
+
+import re
+from typing import Iterable, List, Sequence, Tuple
+
+# Valid values of the `mention_source` parameter of q3
+MENTION_SOURCES = ('field', 'content', 'auto')
+
+# Latin accented letters, a handle followed by them is not a mention
+_LATIN_ACCENTS = '\u00c0-\u00d6\u00d8-\u00f6\u00f8-\u00ff\u0100-\u024f'
+
+# The handle is the only group, so `findall` returns the handles. The
+# character before the at sign is checked after matching it, a pattern that
+# starts with a lookbehind is tried at every position of the text
+_AFTER = r'([A-Za-z0-9_]{1,15})(?![A-Za-z0-9_@\uff20' + _LATIN_ACCENTS + r']|://|/[A-Za-z])'
+HANDLE_PATTERN = r'[@\uff20](?<![A-Za-z0-9_!#$%&*@\uff20][@\uff20])' + _AFTER
+HANDLE_REGEX = re.compile(HANDLE_PATTERN)
+# The same for the texts without a fullwidth at sign, most of them. A
+# pattern that starts with a literal is searched much faster
+_ASCII_REGEX = re.compile(r'@(?<![A-Za-z0-9_!#$%&*@\uff20]@)' + _AFTER)
+
+# Bytes of the lines that can have a handle: `@`, and the fullwidth `@` in
+# UTF-8 and as JSON escapes
+_HANDLE_MARKS = (b'@', '\uff20'.encode('utf-8'), b'\\uff20', b'\\uFF20')
+
+
+def check_source(mention_source: str) -> None:
+    """Raise a ValueError if the source of the mentions is unknown."""
+
+    if mention_source not in MENTION_SOURCES:
+        raise ValueError(
+            f'mention_source must be one of {MENTION_SOURCES}, not {mention_source!r}')
+
+
+def extract_handles(text: str) -> List[str]:
+    """The handles mentioned in a text, in order, repeated handles included.
+
+    Parameters
+    ----------
+    text : str
+        The content of a tweet.
+
+    Returns
+    -------
+    List[str]
+        The handles, without the `@`.
+    """
+
+    if '\uff20' in text:
+        return HANDLE_REGEX.findall(text)
+    return _ASCII_REGEX.findall(text)
+
+
+def extract_batch(texts: Iterable[str]) -> List[List[str]]:
+    """The handles of each text of a batch, see `extract_handles`."""
+
+    return [extract_handles(text) for text in texts]
+
+
+def extract_flat(texts: Sequence[str]) -> Tuple[List[int], List[str]]:
+    """The handles of a batch of texts, flattened, with the position of
+    the text of each handle.
+
+    The texts are joined and scanned in a single search, which avoids a
+    call to the regular expression for each text.
+
+    Parameters
+    ----------
+    texts : Sequence[str]
+        The contents of the tweets.
+
+    Returns
+    -------
+    Tuple[List[int], List[str]]
+        The position in `texts` of the text of each handle, and the
+        handles, in order.
+    """
+
+    # a newline before or after a handle doesn't change it, so the handles
+    # of the joined texts are the handles of each text
+    joined = '\n'.join(texts)
+    regex = HANDLE_REGEX if '\uff20' in joined else _ASCII_REGEX
+    rows, found = [], []
+    # `end` is the position of the newline after the text `row`
+    row, end = 0, len(texts[0]) if texts else 0
+    for match in regex.finditer(joined):
+        start = match.start()
+        while start > end:
+            row += 1
+            end += len(texts[row]) + 1
+        rows.append(row)
+        found.append(match.group(1))
+    return rows, found
+
+
+def may_have_handles(line: bytes) -> bool:
+    """Whether a raw line can have a handle. If False, no text of the line
+    has one."""
+
+    return any(mark in line for mark in _HANDLE_MARKS)
+
+
+def uses_content(tweet: dict, mention_source: str) -> bool:
+    """Whether the mentions of a tweet are read from its content."""
+
+    return (mention_source == 'content'
+            or (mention_source == 'auto' and tweet.get('mentionedUsers') is None))
+
+
+def tweet_mentions(tweet: dict, mention_source: str = 'field') -> List[str]:
+    """The usernames mentioned by a tweet, from the source of the mentions.
+
+    Parameters
+    ----------
+    tweet : dict
+        The tweet, main or quoted.
+    mention_source : str, optional
+        One of MENTION_SOURCES, by default 'field'
+
+    Returns
+    -------
+    List[str]
+        The usernames, in order.
+    """
+
+    if uses_content(tweet, mention_source):
+        return extract_handles(tweet['content'])
+    return [mention['username'] for mention in tweet.get('mentionedUsers') or ()]
@@ -0,0 +1,109 @@
+"""Measure the startup cost of importing the q-function modules.
+
+Short-lived jobs pay the interpreter startup and the imports on every run,
+so the modules should stay cheap to import and the heavy dependencies
+(pandas, numpy, emoji) should only be loaded when they are used.
+
+Each module is imported in a fresh interpreter, `-X importtime` gives the
+cumulative import time and `resource` the peak RSS after the import. The
+results are the median of n runs, saved to `benchmark/import_time.txt`.
+"""
+
+import pathlib
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# root of the repository, the modules are imported as `src.<name>`
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+MODULES = [
+    'src.queries',
+    'src.q1_time',
+    'src.q1_memory',
+    'src.q2_time',
+    'src.q2_memory',
+    'src.q3_time',
+    'src.q3_memory',
+    'src.auto',
+]
+
+# heavy dependencies that must not be loaded by the import of the modules
+HEAVY_MODULES = ['pandas', 'numpy', 'emoji']
+
+# prints the peak RSS in KB, and the heavy dependencies that were loaded
+_SCRIPT = """
+import resource, sys
+import {module}
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+print(','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure_import(module: str) -> Tuple[float, float, List[str]]:
+    """Import a module in a fresh interpreter.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module to import.
+
+    Returns
+    -------
+    Tuple[float, float, List[str]]
+        The cumulative import time in ms, the peak RSS in MB and the heavy
+        dependencies loaded by the import.
+    """
+
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         _SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+    # lines are `import time: self [us] | cumulative | name`
+    import_us = 0
+    for line in process.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)', line)
+        if match and match.group(2) == module:
+            import_us = int(match.group(1))
+
+    rss_kb, heavy = process.stdout.splitlines()
+    return import_us / 1000, int(rss_kb) / 1024, [m for m in heavy.split(',') if m]
+
+
+def benchmark(n: int = 5) -> Dict[str, Tuple[float, float, List[str]]]:
+    """Median import time and peak RSS of each module over n runs."""
+
+    results = {}
+    for module in MODULES:
+        runs = [measure_import(module) for _ in range(n)]
+        results[module] = (
+            statistics.median(run[0] for run in runs),
+            statistics.median(run[1] for run in runs),
+            runs[0][2],
+        )
+    return results
+
+
+if __name__ == "__main__":
+    # number of runs
+    n = 5
+
+    # check if ../benchmark exists and create if not
+    benchmark_dir = ROOT / 'benchmark'
+    benchmark_dir.mkdir(exist_ok=True)
+    file_name = benchmark_dir / 'import_time.txt'
+
+    print(f"Measuring imports ({n} runs each)")
+    lines = [f'# Python {sys.version.split()[0]}, median of {n} runs',
+             'module, import_ms, peak_rss_mb, heavy_modules']
+    for module, (import_ms, rss_mb, heavy) in benchmark(n).items():
+        lines.append(f"{module}, {import_ms:.1f}, {rss_mb:.1f}, {' '.join(heavy) or 'none'}")
+        print(lines[-1])
+
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f"Saved to {file_name}")
@@ -0,0 +1,119 @@
+"""Aggregated index of a tweets file that answers q1, q2 and q3 at once.
+
+The q-functions scan the file every time they are called. `TweetIndex`
+reads the file once and keeps only the aggregates needed by the three
+questions, so any top-k can then be answered without reading the file
+again. The results are the same as the ones of the `_memory` engines,
+including the order of the ties.
+
+Example
+-------
+>>> index = TweetIndex.from_file("farmers-protest-tweets-2021-2-4.json")
+>>> index.q1()       # same as q1_memory
+>>> index.q3(k=20)   # top 20 most mentioned users
+"""
+
+import json
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import List, Tuple
+
+from . import progress
+from .emojis import extract_emojis
+
+
+class TweetIndex:
+    """Counters of dates, users, emojis and mentions of a tweets file.
+
+    Parameters
+    ----------
+    date_counts : Counter
+        Number of tweets of each date.
+    user_counts : defaultdict(Counter)
+        Number of tweets of each user, for each date.
+    emoji_counts : Counter
+        Number of times each emoji is used.
+    mention_counts : Counter
+        Number of mentions each user receives.
+    """
+
+    def __init__(
+            self,
+            date_counts: Counter,
+            user_counts: defaultdict,
+            emoji_counts: Counter,
+            mention_counts: Counter,
+            ) -> None:
+        self.date_counts = date_counts
+        self.user_counts = user_counts
+        self.emoji_counts = emoji_counts
+        self.mention_counts = mention_counts
+
+    @classmethod
+    def from_file(cls, file_path: str) -> 'TweetIndex':
+        """Read a tweets file and build its index.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the JSON file containing the tweets data.
+
+        Returns
+        -------
+        TweetIndex
+            The index of the file.
+        """
+
+        index = cls(Counter(), defaultdict(Counter), Counter(), Counter())
+        ids = set()
+
+        with open(file_path, 'r') as f:
+            for line in progress.lines(f, 'index:mains'):
+                tweet = json.loads(line)
+                # q1 and q3 count repeated main tweets again, q2 doesn't
+                index._add(tweet, count_emojis=tweet['id'] not in ids)
+                ids.add(tweet['id'])
+
+        # now read the quoted tweets that are not main tweets
+        with open(file_path, 'r') as f:
+            for line in progress.lines(f, 'index:quoted'):
+                tweet = json.loads(line)
+                current = tweet.get('quotedTweet')
+                # each tweet quotes at most one tweet, the quotes form a chain
+                while current:
+                    if current['id'] not in ids:
+                        index._add(current, count_emojis=True)
+                        ids.add(current['id'])
+                    current = current.get('quotedTweet')
+
+        return index
+
+    def _add(self, tweet: dict, count_emojis: bool) -> None:
+        date = datetime.fromisoformat(tweet['date']).date()
+        self.date_counts[date] += 1
+        self.user_counts[date][tweet['user']['username']] += 1
+
+        if count_emojis:
+            self.emoji_counts.update(extract_emojis(tweet['content']))
+
+        for mention in tweet.get('mentionedUsers') or ():
+            self.mention_counts[mention['username']] += 1
+
+    def q1(self, k: int = 10) -> List[Tuple[datetime.date, str]]:
+        """Top user of each of the top `k` dates with the most tweets."""
+
+        result = []
+        for date, _ in self.date_counts.most_common(k):
+            top_user = self.user_counts[date].most_common(1)[0][0]
+            result.append((date, top_user))
+        return result
+
+    def q2(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Top `k` emojis and their count."""
+
+        return self.emoji_counts.most_common(k)
+
+    def q3(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Top `k` most mentioned users and their count of mentions."""
+
+        return self.mention_counts.most_common(k)
@@ -0,0 +1,301 @@
+"""Attribute the memory of the q-functions to their structures and to the
+lines of code that allocate it.
+
+The files of `memory_profile.py` only have the RSS of the process over
+time. `attribute` runs a q-function with `tracemalloc` on and, at the end
+of each stage (each pass over the file, as named in `progress.lines`) and
+at the end of the function, records:
+
+* the memory traced and its peak during the stage,
+* the size of each local variable of the engine, such as `ids`,
+  `user_counts` or `queue`, found in the frames of the `src` package that
+  are running the stage. The size is the `sys.getsizeof` of the object and
+  of all the objects it contains, an object shared by two variables is
+  counted in both,
+* the lines of code holding the most memory, from the snapshot.
+
+Tracing the allocations slows the functions down several times, so the
+durations of an attribution run are meaningless.
+
+Run it from the root of the repository, it writes
+`benchmark/<q-function>_attribution.txt` next to the memory profiles:
+
+    python -m src.memory_attribution farmers-protest-tweets-2021-2-4.json
+"""
+
+import logging
+import os
+import pathlib
+import sys
+import sysconfig
+import time
+import tracemalloc
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from .progress import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+SRC_DIR = pathlib.Path(__file__).resolve().parent
+BENCHMARK_DIR = SRC_DIR.parent / 'benchmark'
+
+# Number of structures and of allocation sites reported for each stage
+DEFAULT_TOP = 10
+
+# Types whose items are counted in their size
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+class Structure(NamedTuple):
+    """A local variable of an engine and its size."""
+
+    name: str
+    type_name: str
+    length: Optional[int]
+    size: int
+
+
+class Site(NamedTuple):
+    """A line of code and the memory allocated by it that is still held."""
+
+    location: str
+    size: int
+    count: int
+
+
+class StageMemory(NamedTuple):
+    """The memory at the end of a stage.
+
+    Attributes
+    ----------
+    stage : str
+        Name of the stage, `result` for the end of the function.
+    traced : int
+        Bytes traced at the end of the stage.
+    peak : int
+        Peak of the bytes traced during the stage.
+    structures : List[Structure]
+        The largest local variables of the engine.
+    sites : List[Site]
+        The lines of code holding the most memory.
+    """
+
+    stage: str
+    traced: int
+    peak: int
+    structures: List[Structure]
+    sites: List[Site]
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Size in bytes of an object and of the objects it contains.
+
+    The dicts, lists, tuples and sets are traversed, each object is counted
+    once. Other objects count with their own `sys.getsizeof`, which for
+    pandas and NumPy objects includes their data.
+    """
+
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        try:
+            size += sys.getsizeof(current)
+        except TypeError:
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, _CONTAINERS):
+            stack.extend(current)
+    return size
+
+
+def _structure(name: str, value: Any) -> Structure:
+    try:
+        length = len(value)
+    except TypeError:
+        length = None
+    return Structure(name, type(value).__name__, length, deep_sizeof(value))
+
+
+def engine_structures(frame, top: int = DEFAULT_TOP) -> List[Structure]:
+    """The largest local variables of the frames of the `src` package, from
+    `frame` to the outermost one.
+
+    Parameters
+    ----------
+    frame : FrameType
+        Innermost frame.
+    top : int, optional
+        Number of variables, by default DEFAULT_TOP
+
+    Returns
+    -------
+    List[Structure]
+        The variables, named `<function>.<variable>`, largest first.
+    """
+
+    structures = []
+    while frame is not None:
+        path = pathlib.Path(frame.f_code.co_filename)
+        # the frames of this module and of the reporter are not the engine
+        if path.parent == SRC_DIR and path.name not in ('progress.py', 'memory_attribution.py'):
+            for name, value in frame.f_locals.items():
+                if callable(value) or type(value).__name__ == 'module':
+                    continue
+                structures.append(_structure(f'{frame.f_code.co_name}.{name}', value))
+        frame = frame.f_back
+    return sorted(structures, key=lambda s: -s.size)[:top]
+
+
+def top_sites(snapshot: tracemalloc.Snapshot, top: int = DEFAULT_TOP) -> List[Site]:
+    """The lines of code holding the most memory in a snapshot, without the
+    allocations of `tracemalloc` itself."""
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+    # the files of the repository are relative to its root, the ones of
+    # Python and of the installed packages to their folder
+    paths = sysconfig.get_paths()
+    prefixes = [(str(SRC_DIR.parent) + os.sep, ''),
+                (paths['purelib'] + os.sep, '<site-packages>/'),
+                (paths['stdlib'] + os.sep, '<stdlib>/')]
+    sites = []
+    for stat in snapshot.statistics('lineno')[:top]:
+        frame = stat.traceback[0]
+        filename = frame.filename
+        for prefix, name in prefixes:
+            if filename.startswith(prefix):
+                filename = name + filename[len(prefix):]
+                break
+        sites.append(Site(f'{filename}:{frame.lineno}', stat.size, stat.count))
+    return sites
+
+
+class _Attribution(ProgressReporter):
+    """Records the memory at the end of each stage, instead of reporting
+    the progress."""
+
+    def __init__(self, top: int) -> None:
+        # only the last report of each stage
+        super().__init__(interval=float('inf'))
+        self.top = top
+        self.stages = []
+
+    def record(self, stage: str, frame) -> None:
+        traced, peak = tracemalloc.get_traced_memory()
+        structures = engine_structures(frame, self.top)
+        sites = top_sites(tracemalloc.take_snapshot(), self.top)
+        self.stages.append(StageMemory(stage, traced, peak, structures, sites))
+        tracemalloc.reset_peak()
+
+    def emit(self, stage: str, *args, **kwargs) -> dict:
+        # called by `track` at the end of the stage, the frames above are
+        # the ones of the engine
+        self.record(stage, sys._getframe(1))
+        return {}
+
+
+def attribute(
+        func: Callable[[str], Any],
+        file_path: str,
+        top: int = DEFAULT_TOP,
+        ) -> List[StageMemory]:
+    """Run a q-function and attribute its memory at the end of each stage.
+
+    Parameters
+    ----------
+    func : Callable[[str], Any]
+        The q-function.
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    top : int, optional
+        Number of structures and of sites of each stage, by default
+        DEFAULT_TOP
+
+    Returns
+    -------
+    List[StageMemory]
+        The memory of each stage, and last the memory at the end of the
+        function, where the only structure is the result.
+    """
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        with _Attribution(top) as attribution:
+            result = func(file_path)
+        traced, peak = tracemalloc.get_traced_memory()
+        sites = top_sites(tracemalloc.take_snapshot(), top)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return attribution.stages + [
+        StageMemory('result', traced, peak, [_structure('result', result)], sites)]
+
+
+def _mb(size: int) -> str:
+    return f'{size / 2**20:10.3f} MB'
+
+
+def format_report(label: str, stages: List[StageMemory]) -> str:
+    """The report of a q-function as text."""
+
+    lines = [f'Memory attribution of {label}', '']
+    for s in stages:
+        lines.append(f'[{s.stage}] traced {_mb(s.traced).strip()}, '
+                     f'peak {_mb(s.peak).strip()}')
+        lines.append('  structures:')
+        for structure in s.structures:
+            length = '' if structure.length is None else f' of {structure.length}'
+            lines.append(f'    {_mb(structure.size)}  {structure.name} '
+                         f'({structure.type_name}{length})')
+        lines.append('  allocation sites:')
+        for site in s.sites:
+            lines.append(f'    {_mb(site.size)}  {site.location} ({site.count} blocks)')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def write_reports(
+        file_path: str,
+        funcs: List[Tuple[str, Callable[[str], Any]]],
+        directory: pathlib.Path = BENCHMARK_DIR,
+        top: int = DEFAULT_TOP,
+        ) -> List[pathlib.Path]:
+    """Write the report of each q-function to
+    `<directory>/<label>_attribution.txt`, after a comment line with the
+    input. Each report written is logged at INFO level."""
+
+    directory = pathlib.Path(directory)
+    directory.mkdir(exist_ok=True)
+    source = f'# {os.path.basename(file_path)} ({os.path.getsize(file_path) / 2**20:.0f} MB)'
+    paths = []
+    for label, func in funcs:
+        start = time.perf_counter()
+        report = format_report(label, attribute(func, file_path, top))
+        path = directory / f'{label}_attribution.txt'
+        path.write_text(f'{source}\n{report}\n')
+        logger.info('%s: %s (%.1f s)', label, path, time.perf_counter() - start)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    from . import queries
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'farmers-protest-tweets-2021-2-4.json'
+    labels = ['q1_time', 'q1_memory', 'q2_time', 'q2_memory', 'q3_time', 'q3_memory']
+    write_reports(file_path, [(label, getattr(queries, label)) for label in labels])
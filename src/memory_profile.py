@@ -10,16 +10,22 @@ script and save the memory profile of each function in that folder.
 
 import pathlib
 import gc
+import sys
 from typing import Callable, List, Any
 
 from memory_profiler import memory_usage
 
-from q1_time import q1_time
-from q1_memory import q1_memory
-from q2_time import q2_time
-from q2_memory import q2_memory
-from q3_time import q3_time
-from q3_memory import q3_memory
+# the q-functions are modules of the `src` package, add the root of the
+# repository to the path so they can be imported from this folder
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from src.q1_time import q1_time
+from src.q1_memory import q1_memory
+from src.q2_time import q2_time
+from src.q2_memory import q2_memory
+from src.q3_time import q3_time
+from src.q3_memory import q3_memory
+from src import differential
 
 
 def profile_function(
@@ -82,6 +88,13 @@ if __name__ == "__main__":
         'q3_memory': q3_memory
     }
 
+    # the engines must give the same results before their memory is
+    # compared, see `src/differential.py`
+    divergences = differential.run(range(5))
+    if divergences:
+        sys.exit(f"{len(divergences)} divergences between the engines, "
+                 "run `python -m src.differential` for reproducers")
+
     # check if ../benchmark exists and create if not
     pathlib.Path("../benchmark").mkdir(exist_ok=True)
 
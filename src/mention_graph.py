@@ -0,0 +1,238 @@
+"""Graph of who mentions whom, and influence rankings on it.
+
+q3 ranks the users by the number of mentions they receive, so an account
+that mentions the same user thousands of times makes it influential. The
+`MentionGraph` keeps the structure instead: an edge from the author of each
+tweet counted by `q3_memory` to each user it mentions, weighted by the
+number of mentions. On it:
+
+* `top_in_degree` is the weighted in-degree, the same ranking as q3,
+* `top_pagerank` is the weighted PageRank, where each author splits its
+  own rank among the users it mentions, so the mentions of an account
+  that nobody mentions are worth little, however many they are.
+
+The usernames are dictionary-encoded to int32 codes while the file is
+read, the edges are kept in compact arrays and then aggregated in CSR form
+(one row per author). The aggregation and the ranking are vectorized over
+the arrays with numpy, with no Python loop over the edges, so tens of
+millions of edges fit on a single machine.
+
+Example
+-------
+>>> graph = MentionGraph.from_file("farmers-protest-tweets-2021-2-4.json")
+>>> graph.top_pagerank(3)
+[('narendramodi', 0.0123...), ...]
+"""
+
+from array import array
+from typing import List, Tuple
+
+import numpy as np
+
+from .q3_memory import mentioning_tweets
+from .shared_counts import top_k
+
+# Damping factor of PageRank, the probability to follow a mention
+DAMPING = 0.85
+
+
+class MentionGraph:
+    """Weighted graph of mentions in CSR form.
+
+    Parameters
+    ----------
+    usernames : List[str]
+        Username of each user code.
+    indptr : np.ndarray
+        The edges of author `u` are at `indptr[u]:indptr[u + 1]`.
+    indices : np.ndarray
+        Mentioned user of each edge, sorted within each author.
+    weights : np.ndarray
+        Number of mentions of each edge.
+    first : np.ndarray
+        Position of the first mention of each user, to break the ties in
+        the order of `q3_memory`. Users never mentioned have the largest
+        int64.
+    """
+
+    def __init__(
+            self,
+            usernames: List[str],
+            indptr: np.ndarray,
+            indices: np.ndarray,
+            weights: np.ndarray,
+            first: np.ndarray,
+            ) -> None:
+        self.usernames = usernames
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.first = first
+
+    @property
+    def n_users(self) -> int:
+        return len(self.usernames)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def from_edges(
+            cls,
+            usernames: List[str],
+            sources: np.ndarray,
+            targets: np.ndarray,
+            ) -> 'MentionGraph':
+        """Build the graph from the list of mentions.
+
+        Parameters
+        ----------
+        usernames : List[str]
+            Username of each user code.
+        sources, targets : np.ndarray
+            Author and mentioned user of each mention, in the order they
+            are counted. A pair can be repeated, its mentions are summed.
+
+        Returns
+        -------
+        MentionGraph
+            The graph.
+        """
+
+        n = len(usernames)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        # the first mention of each user, before the pairs are sorted
+        first = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        mentioned, positions = np.unique(targets, return_index=True)
+        first[mentioned] = positions
+
+        # sorted unique pairs, as keys source * n + target, with the
+        # number of times each one is repeated
+        keys, weights = np.unique(sources * n + targets, return_counts=True)
+        rows, indices = np.divmod(keys, n) if n else (keys, keys)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+        return cls(usernames, indptr, indices.astype(np.int32),
+                   weights.astype(np.int64), first)
+
+    @classmethod
+    def from_file(
+            cls,
+            file_path: str,
+            prefilter: bool = True,
+            mention_source: str = 'field',
+            ) -> 'MentionGraph':
+        """Read the mentions of a tweets file, with the dedup of the quoted
+        tweets of `q3_memory`.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the JSON file containing the tweets data.
+        prefilter : bool, optional
+            Skip the JSON decoding of the lines without mentions, see
+            `q3_memory`, by default True
+        mention_source : str, optional
+            Where the mentions are read, see `q3_memory`, by default 'field'
+
+        Returns
+        -------
+        MentionGraph
+            The graph.
+        """
+
+        codes = {}
+        # int32 codes, 8 bytes per mention while the file is read
+        sources, targets = array('i'), array('i')
+
+        for tweet, usernames in mentioning_tweets(file_path, prefilter,
+                                                  mention_source=mention_source):
+            author = codes.setdefault(tweet['user']['username'], len(codes))
+            for username in usernames:
+                sources.append(author)
+                targets.append(codes.setdefault(username, len(codes)))
+
+        return cls.from_edges(list(codes),
+                              np.frombuffer(sources, dtype=np.int32),
+                              np.frombuffer(targets, dtype=np.int32))
+
+    def _rows(self) -> np.ndarray:
+        # the author of each edge
+        return np.repeat(np.arange(self.n_users), np.diff(self.indptr))
+
+    def in_degree(self) -> np.ndarray:
+        """Mentions received by each user."""
+
+        return np.bincount(self.indices, weights=self.weights,
+                           minlength=self.n_users).astype(np.int64)
+
+    def pagerank(
+            self,
+            damping: float = DAMPING,
+            tol: float = 1e-10,
+            max_iter: int = 100,
+            ) -> np.ndarray:
+        """Weighted PageRank of each user, by power iteration.
+
+        Each author passes its rank to the users it mentions, in proportion
+        to the weights of the edges. The rank of the users that mention
+        nobody is spread over all the users.
+
+        Parameters
+        ----------
+        damping : float, optional
+            Probability to follow a mention, by default DAMPING
+        tol : float, optional
+            The iteration stops when the L1 change is below it,
+            by default 1e-10
+        max_iter : int, optional
+            Maximum number of iterations, by default 100
+
+        Returns
+        -------
+        np.ndarray
+            Rank of each user, they sum to 1.
+        """
+
+        n = self.n_users
+        if n == 0:
+            return np.zeros(0)
+
+        rows = self._rows()
+        out_weight = np.bincount(rows, weights=self.weights, minlength=n)
+        dangling = out_weight == 0
+        # share of the rank of the author that goes through each edge
+        share = self.weights / np.where(dangling, 1, out_weight)[rows]
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            spread = (1 - damping + damping * rank[dangling].sum()) / n
+            new = spread + damping * np.bincount(
+                self.indices, weights=rank[rows] * share, minlength=n)
+            change = np.abs(new - rank).sum()
+            rank = new
+            if change < tol:
+                break
+        return rank
+
+    def top_in_degree(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Top `k` most mentioned users and their count of mentions, the
+        result of `q3_memory`."""
+
+        counts = self.in_degree()
+        return [(self.usernames[code], int(counts[code]))
+                for code in top_k(counts, self.first, k)]
+
+    def top_pagerank(self, k: int = 10, **kwargs) -> List[Tuple[str, float]]:
+        """Top `k` users by PageRank and their rank. Only the users that are
+        mentioned are ranked, the keyword arguments go to `pagerank`."""
+
+        rank = self.pagerank(**kwargs)
+        # the users never mentioned only get the teleport share
+        rank_of_mentioned = np.where(self.in_degree() > 0, rank, 0.0)
+        return [(self.usernames[code], float(rank[code]))
+                for code in top_k(rank_of_mentioned, self.first, k)]
@@ -0,0 +1,68 @@
+"""Instrumentation counters of the q-functions.
+
+The q-functions and their helpers increment named counters, for instance
+the hits of the emoji memo, that can be read after a run to understand
+where the time goes. The counters are process-wide and are never reset
+automatically. They can be incremented from several threads.
+
+Example
+-------
+>>> from src import metrics
+>>> metrics.reset()
+>>> q2_memory(file_path)
+>>> metrics.snapshot()
+{'emoji_ascii_skips': 80121, 'emoji_memo_misses': 36104, ...}
+"""
+
+import threading
+from collections import Counter
+from typing import Dict, Mapping, Union
+
+# All the counters, by name
+counters = Counter()
+# `counters[name] += value` is a read and a write, two threads could both
+# read the old value and one of the additions would be lost
+_lock = threading.Lock()
+
+
+def increment(name: str, value: Union[int, float] = 1) -> None:
+    """Add `value` to the counter `name`.
+
+    Parameters
+    ----------
+    name : str
+        Name of the counter.
+    value : Union[int, float], optional
+        Amount to add, by default 1
+    """
+
+    with _lock:
+        counters[name] += value
+
+
+def merge(values: Mapping[str, Union[int, float]]) -> None:
+    """Add a group of counters, for instance the ones measured by a
+    worker process.
+
+    Parameters
+    ----------
+    values : Mapping[str, Union[int, float]]
+        Amount to add to each counter, by name.
+    """
+
+    with _lock:
+        counters.update(values)
+
+
+def snapshot() -> Dict[str, Union[int, float]]:
+    """Return a copy of the current value of all the counters."""
+
+    with _lock:
+        return dict(counters)
+
+
+def reset() -> None:
+    """Set all the counters to zero."""
+
+    with _lock:
+        counters.clear()
@@ -0,0 +1,219 @@
+"""Aggregate q1, q2 and q3 with threads, processes or serially.
+
+The file is split in chunks aligned to lines (see `chunks.split_file`) and
+each chunk is aggregated as if it were a shard, into its own
+`state.AggregateState`. The states are merged in the order of the chunks,
+so the results are the ones of the `_memory` engines, ties included.
+
+Parsing JSON holds the GIL, so the threads of a regular CPython build run
+one at a time. On a free-threaded build (3.13t and later) with the GIL
+disabled they run in parallel, and they avoid the costs of a process
+pool: starting the workers and pickling their states back to the parent.
+The modes are:
+
+* `thread`: a thread pool, each thread aggregates a chunk,
+* `process`: a process pool, each process aggregates a chunk,
+* `serial`: one state for the whole file, in this thread,
+* `auto`: `thread` if the GIL is disabled, else `process` if there is more
+  than one worker, else `serial`. The mode chosen is logged.
+
+`q1_memory`, `q2_memory` and `q3_memory` use this module when they are
+called with a `mode`, one of `QUERY_MODES`: the modes above, or `batch`,
+the columnar pipeline of `batch.count_file` in this thread. The workers share the emoji memo and the `metrics`
+counters of the process, both are safe to use from several threads.
+
+To compare the modes on a file:
+
+    python -m src.parallel farmers-protest-tweets-2021-2-4.json
+"""
+
+import logging
+import os
+import pathlib
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .chunks import split_file
+from .index import TweetIndex
+from .state import AggregateState, merge_states
+
+logger = logging.getLogger(__name__)
+
+MODES = ('auto', 'thread', 'process', 'serial')
+
+# The modes of the `_memory` engines
+QUERY_MODES = MODES + ('batch',)
+
+
+def gil_enabled() -> bool:
+    """Whether the GIL is enabled in this interpreter. It is always enabled
+    before Python 3.13, and on the builds that are not free-threaded."""
+
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def choose_mode(workers: int) -> str:
+    """The mode of `auto` for a number of workers."""
+
+    if workers > 1 and not gil_enabled():
+        return 'thread'
+    if workers > 1:
+        return 'process'
+    return 'serial'
+
+
+def count_file(
+        file_path: str,
+        workers: Optional[int] = None,
+        mode: str = 'auto',
+        ) -> TweetIndex:
+    """Aggregate a tweets file in chunks.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    workers : Optional[int], optional
+        Number of threads or processes, and of chunks. If None, use the
+        number of CPUs, by default None
+    mode : str, optional
+        One of MODES, by default 'auto'
+
+    Returns
+    -------
+    TweetIndex
+        The counters of the file, which answer q1, q2 and q3.
+
+    Raises
+    ------
+    ValueError
+        If the mode is unknown.
+    """
+
+    if mode not in MODES:
+        raise ValueError(f'mode must be one of {MODES}, not {mode!r}')
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if mode == 'auto':
+        mode = choose_mode(workers)
+        logger.info('%s: %s mode with %d workers, GIL %s', file_path, mode,
+                    workers, 'enabled' if gil_enabled() else 'disabled')
+
+    if mode == 'serial':
+        return AggregateState.from_file(file_path).finalize()
+
+    chunks = split_file(file_path, workers)
+    if not chunks:
+        return AggregateState().finalize()
+
+    pool_class = ThreadPoolExecutor if mode == 'thread' else ProcessPoolExecutor
+    with pool_class(max_workers=len(chunks)) as pool:
+        # each worker fills its own state, map keeps the order of the chunks
+        states = pool.map(AggregateState.from_chunk,
+                          [file_path] * len(chunks),
+                          [start for start, _ in chunks],
+                          [end for _, end in chunks])
+        return merge_states(states).finalize()
+
+
+def run_query(
+        query: str,
+        file_path: str,
+        workers: Optional[int],
+        mode: str,
+        **options: Any,
+        ) -> List[Any]:
+    """Answer a query with `count_file`, for the `mode` argument of the
+    `_memory` engines.
+
+    Parameters
+    ----------
+    query : str
+        'q1', 'q2' or 'q3'.
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    workers : Optional[int]
+        Number of threads or processes, see `count_file`.
+    mode : str
+        One of QUERY_MODES. `batch` has no workers.
+    **options
+        The options of the engine that don't apply to the chunks, an
+        option that is not None or False raises a ValueError.
+
+    Returns
+    -------
+    List[Any]
+        The result of the query.
+    """
+
+    used = [name for name, value in options.items() if value is not None and value is not False]
+    if used:
+        raise ValueError(f'mode cannot be combined with {", ".join(used)}')
+    if mode == 'batch':
+        if workers is not None:
+            raise ValueError('the batch mode has no workers')
+        from .batch import count_file as count_batches
+        return getattr(count_batches(file_path), query)()
+    return getattr(count_file(file_path, workers, mode), query)()
+
+
+def benchmark(
+        file_path: str,
+        workers: Optional[int] = None,
+        n: int = 3,
+        ) -> Dict[str, float]:
+    """Best time in seconds of each mode, except `auto`.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    workers : Optional[int], optional
+        Number of threads or processes, by default the number of CPUs
+    n : int, optional
+        Number of runs of each mode, by default 3
+
+    Returns
+    -------
+    Dict[str, float]
+        Seconds of each mode.
+    """
+
+    results = {}
+    for mode in ('serial', 'thread', 'process'):
+        best = float('inf')
+        for _ in range(n):
+            start = time.perf_counter()
+            count_file(file_path, workers, mode)
+            best = min(best, time.perf_counter() - start)
+        results[mode] = best
+    return results
+
+
+if __name__ == '__main__':
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'farmers-protest-tweets-2021-2-4.json'
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    # check if ../benchmark exists and create if not
+    benchmark_dir = pathlib.Path(__file__).resolve().parent.parent / 'benchmark'
+    benchmark_dir.mkdir(exist_ok=True)
+    file_name = benchmark_dir / 'parallel.txt'
+
+    n_workers = workers or os.cpu_count() or 1
+    cpus = (len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity')
+            else os.cpu_count() or 1)
+    size_mb = os.path.getsize(file_path) / 2**20
+    lines = [f'# {os.path.basename(file_path)} ({size_mb:.0f} MB), Python {sys.version.split()[0]}, '
+             f'GIL {"enabled" if gil_enabled() else "disabled"}, {n_workers} workers, {cpus} CPU(s)',
+             'mode, seconds, speedup']
+    results = benchmark(file_path, workers)
+    for mode, seconds in results.items():
+        lines.append(f'{mode}, {seconds:.3f}, {results["serial"] / seconds:.2f}')
+        print(lines[-1])
+
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f'Saved to {file_name}')
@@ -0,0 +1,154 @@
+"""Cheap scans of the raw lines, to skip the JSON decoding of the tweets
+that can't change the result of a query.
+
+Decoding a line with `json.loads` is most of the time of the `_memory`
+engines, but many tweets only matter for their id: in q3 a tweet without
+mentions, in q2 a tweet without emojis, and in the second pass of both a
+tweet without a quoted tweet. These checks look at the raw bytes only.
+They are conservative: when a check can't decide, for instance on a file
+written with other separators, the line is decoded as before, so the
+results never change.
+
+The scans rely on the JSON escaping of the strings: a `"` inside a string
+is always written `\\"`, so a pattern such as `"quotedTweet":` can only be
+found at a key, never inside the content of a tweet.
+
+The lines read and skipped are added to the `metrics` counters
+`prefilter_lines` and `prefilter_skips`. To measure the skip rates and the
+speedups on a file:
+
+    python -m src.prefilter farmers-protest-tweets-2021-2-4.json
+"""
+
+import json
+import pathlib
+import sys
+import time
+from typing import Dict, Tuple, Union
+
+from . import metrics
+
+ID_KEY = b'"id":'
+QUOTED_KEY = b'"quotedTweet":'
+MENTIONS_KEY = b'"mentionedUsers":'
+
+# The empty values of the keys, as written by `json.dumps`
+_EMPTY_VALUES = {key: (key + b' null', key + b' []')
+                 for key in (QUOTED_KEY, MENTIONS_KEY)}
+
+
+def tweet_id(line: bytes) -> Union[int, str]:
+    """Id of the tweet of a raw line, decoding only the id when possible.
+
+    The quoted tweet and the user also have an `id`, so the first `id` key
+    is the one of the tweet only if no other object is opened before it.
+    Otherwise, or if the id is not a number, the whole line is decoded.
+
+    Parameters
+    ----------
+    line : bytes
+        A line of the JSON lines file.
+
+    Returns
+    -------
+    Union[int, str]
+        The id of the tweet.
+    """
+
+    position = line.find(ID_KEY)
+    if position > 0 and line.find(b'{', 1, position) < 0:
+        start = position + len(ID_KEY)
+        end = line.find(b',', start)
+        if end < 0:
+            end = line.find(b'}', start)
+        try:
+            # int ignores the spaces around the number
+            return int(line[start:end])
+        except ValueError:
+            pass
+    return json.loads(line)['id']
+
+
+def all_empty(line: bytes, key: bytes) -> bool:
+    """Whether every `key` of a raw line is null or an empty list, which is
+    also true when the key is missing.
+    """
+
+    n_keys = line.count(key)
+    if n_keys == 0:
+        return True
+    null, empty_list = _EMPTY_VALUES[key]
+    n_keys -= line.count(null)
+    return n_keys == 0 or n_keys == line.count(empty_list)
+
+
+def may_have_emojis(line: bytes) -> bool:
+    """Whether any text of a raw line may have emojis. A line without non
+    ASCII bytes and without escaped characters has only ASCII texts.
+    """
+
+    return not line.isascii() or b'\\u' in line
+
+
+def record(lines: int, skips: int) -> None:
+    """Add the lines read and skipped by a pass to the metrics."""
+
+    metrics.increment('prefilter_lines', lines)
+    metrics.increment('prefilter_skips', skips)
+
+
+def compare(file_path: str, n: int = 3) -> Dict[str, Tuple[float, float, float]]:
+    """Run q2_memory and q3_memory with and without the prefilter.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    n : int, optional
+        Number of runs, the best time is kept, by default 3
+
+    Returns
+    -------
+    Dict[str, Tuple[float, float, float]]
+        For each function, the time in seconds without and with the
+        prefilter, and the rate of lines skipped.
+    """
+
+    from .q2_memory import q2_memory
+    from .q3_memory import q3_memory
+
+    results = {}
+    for func in (q2_memory, q3_memory):
+        times = []
+        for prefilter in (False, True):
+            best = float('inf')
+            for _ in range(n):
+                before = metrics.snapshot()
+                start = time.perf_counter()
+                func(file_path, prefilter=prefilter)
+                best = min(best, time.perf_counter() - start)
+                after = metrics.snapshot()
+            times.append(best)
+        lines = after.get('prefilter_lines', 0) - before.get('prefilter_lines', 0)
+        skips = after.get('prefilter_skips', 0) - before.get('prefilter_skips', 0)
+        results[func.__name__] = (times[0], times[1], skips / lines if lines else 0.0)
+    return results
+
+
+if __name__ == '__main__':
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'farmers-protest-tweets-2021-2-4.json'
+
+    # check if ../benchmark exists and create if not
+    benchmark_dir = pathlib.Path(__file__).resolve().parent.parent / 'benchmark'
+    benchmark_dir.mkdir(exist_ok=True)
+    file_name = benchmark_dir / 'prefilter.txt'
+
+    lines = ['function, seconds_without, seconds_with, speedup, skip_rate']
+    for name, (without, with_, skip_rate) in compare(file_path).items():
+        lines.append(f'{name}, {without:.3f}, {with_:.3f}, '
+                     f'{without / with_:.2f}, {skip_rate:.3f}')
+        print(lines[-1])
+
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f'Saved to {file_name}')
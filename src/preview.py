@@ -0,0 +1,315 @@
+"""Anytime preview of q1, q2 and q3 from a sample of the file.
+
+On a big file the exact answers take minutes, but a dashboard can show
+estimates within a second. `preview` reads the lines at random byte
+offsets, one in each of equal byte ranges of the file (strata). A line is
+drawn with a probability proportional to its length, so each drawn line is
+weighted by the size of the file over its length, and the mean of the
+weighted counts estimates the counts of the whole file, number of lines
+included (the Hansen-Hurwitz estimator). The estimates have a confidence
+interval, and they are refined by doubling the sample on each round, until
+the time budget is spent. When the rest of the budget is enough to read the
+whole file, the exact answer is computed instead, with intervals of width
+zero.
+
+The estimates are approximations, in particular:
+
+* the intervals ignore the strata, which makes them a bit wider,
+* the quoted tweets are deduplicated within the sample only, so the counts
+  of the quoted tweets that are also main tweets are overestimated,
+* a repeated main tweet is counted on each of its lines, also by q2.
+
+Example
+-------
+>>> for result in preview("farmers-protest-tweets-2021-2-4.json", time_budget=2):
+...     print(result.exact, result.q2[:3])
+"""
+
+import json
+import math
+import os
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from .emojis import extract_emojis
+from .index import TweetIndex
+
+# Number of strata of the first round, doubled on each round
+INITIAL_SAMPLE = 256
+
+
+class Estimate(NamedTuple):
+    """Estimated count of a key, and its confidence interval."""
+
+    key: object
+    count: float
+    low: float
+    high: float
+
+
+class Preview(NamedTuple):
+    """The estimated answers after a round.
+
+    Attributes
+    ----------
+    q1 : List[Tuple[date, str]]
+        Top user of each of the estimated top dates.
+    dates : List[Estimate]
+        Estimated tweets of each of the top dates.
+    q2 : List[Estimate]
+        Estimated top emojis.
+    q3 : List[Estimate]
+        Estimated top mentioned users.
+    sample_lines : int
+        Number of lines sampled.
+    estimated_lines : float
+        Estimated number of lines of the file.
+    exact : bool
+        Whether the answers are exact.
+    elapsed : float
+        Seconds since the preview started.
+    """
+
+    q1: List[Tuple[date, str]]
+    dates: List[Estimate]
+    q2: List[Estimate]
+    q3: List[Estimate]
+    sample_lines: int
+    estimated_lines: float
+    exact: bool
+    elapsed: float
+
+
+class _Moments:
+    """Sum and sum of squares of the weighted count of each key per
+    sampled line."""
+
+    def __init__(self) -> None:
+        self.sums = Counter()
+        self.squares = Counter()
+
+    def add(self, counts: Counter, weight: float) -> None:
+        for key, count in counts.items():
+            self.sums[key] += count * weight
+            self.squares[key] += (count * weight) ** 2
+
+    def top(self, k: int, n: int, z: float) -> List[Estimate]:
+        """Estimates of the top `k` keys, the mean of the weighted counts
+        of the `n` sampled lines.
+        """
+
+        estimates = []
+        for key, total in self.sums.most_common(k):
+            mean = total / n
+            variance = max(self.squares[key] / n - mean * mean, 0.0)
+            margin = z * math.sqrt(variance / n)
+            estimates.append(Estimate(
+                key, mean, max(mean - margin, 0.0), mean + margin))
+        return estimates
+
+
+class _Sample:
+    """Counts of the sampled lines."""
+
+    def __init__(self) -> None:
+        self.n_lines = 0
+        self.n_bytes = 0
+        # sum of the weights, the estimated lines times the lines drawn
+        self.weights = 0.0
+        self.ids = set()
+        self.dates = _Moments()
+        self.users = defaultdict(Counter)
+        self.emojis = _Moments()
+        self.mentions = _Moments()
+
+    def add(self, line: bytes, weight: float) -> None:
+        self.n_lines += 1
+        self.n_bytes += len(line)
+        if not line.strip():
+            # a blank line counts nothing, but it was drawn
+            return
+        self.weights += weight
+        tweet = json.loads(line)
+
+        # the tweets of the line: the main tweet and the quoted tweets
+        # that are not in the sample yet
+        tweets = [tweet]
+        self.ids.add(tweet['id'])
+        current = tweet.get('quotedTweet')
+        while current:
+            if current['id'] not in self.ids:
+                self.ids.add(current['id'])
+                tweets.append(current)
+            current = current.get('quotedTweet')
+
+        dates, emojis, mentions = Counter(), Counter(), Counter()
+        for t in tweets:
+            day = datetime.fromisoformat(t['date']).date()
+            dates[day] += 1
+            self.users[day][t['user']['username']] += weight
+            emojis.update(extract_emojis(t['content']))
+            mentions.update(m['username'] for m in t.get('mentionedUsers') or ())
+        self.dates.add(dates, weight)
+        self.emojis.add(emojis, weight)
+        self.mentions.add(mentions, weight)
+
+    def preview(self, k: int, z: float, elapsed: float) -> Preview:
+        n = self.n_lines
+        dates = self.dates.top(k, n, z)
+        q1 = [(e.key, self.users[e.key].most_common(1)[0][0]) for e in dates]
+        return Preview(
+            q1, dates, self.emojis.top(k, n, z), self.mentions.top(k, n, z),
+            n, self.weights / n, False, elapsed)
+
+
+def line_at(f, offset: int, block_size: int = 1 << 16) -> bytes:
+    """The line that contains the byte at `offset`, with its newline.
+
+    Parameters
+    ----------
+    f : BinaryIO
+        The file, opened in binary mode.
+    offset : int
+        Offset of a byte of the file.
+    block_size : int, optional
+        Bytes read at a time looking back for the start of the line,
+        by default 64 KiB
+
+    Returns
+    -------
+    bytes
+        The line.
+    """
+
+    # the line starts after the last newline before the offset
+    start = end = offset
+    while end > 0:
+        start = max(end - block_size, 0)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b'\n')
+        if newline >= 0:
+            start += newline + 1
+            break
+        end = start
+    f.seek(start)
+    return f.readline()
+
+
+def sample_lines(
+        f, size: int, n: int, rng: random.Random) -> Iterator[Tuple[bytes, float]]:
+    """Read the line at a random offset of each of `n` equal byte ranges.
+
+    Parameters
+    ----------
+    f : BinaryIO
+        The file, opened in binary mode.
+    size : int
+        Size of the file.
+    n : int
+        Number of strata.
+    rng : random.Random
+        Source of the random offsets.
+
+    Yields
+    ------
+    Tuple[bytes, float]
+        The line that contains each offset, and its weight: the inverse of
+        the probability of drawing it, the size of the file over the length
+        of the line.
+    """
+
+    for i in range(n):
+        low, high = size * i // n, size * (i + 1) // n
+        if low >= high:
+            continue
+        line = line_at(f, rng.randrange(low, high))
+        yield line, size / len(line)
+
+
+def exact_preview(file_path: str, k: int, elapsed: float) -> Preview:
+    """The exact answers, as a preview with intervals of width zero."""
+
+    index = TweetIndex.from_file(file_path)
+
+    def exact(counts: List[Tuple[object, int]]) -> List[Estimate]:
+        return [Estimate(key, count, count, count) for key, count in counts]
+
+    with open(file_path, 'rb') as f:
+        n_lines = sum(1 for _ in f)
+
+    return Preview(
+        index.q1(k), exact(index.date_counts.most_common(k)),
+        exact(index.q2(k)), exact(index.q3(k)),
+        0, n_lines, True, elapsed)
+
+
+def preview(
+        file_path: str,
+        time_budget: float = 1.0,
+        k: int = 10,
+        confidence: float = 0.95,
+        initial_sample: int = INITIAL_SAMPLE,
+        seed: Optional[int] = None,
+        ) -> Iterator[Preview]:
+    """Yield estimates of q1, q2 and q3, more precise on each round.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    time_budget : float, optional
+        Seconds after which no new round starts, by default 1.0
+    k : int, optional
+        Number of keys of each top, by default 10
+    confidence : float, optional
+        Level of the confidence intervals, by default 0.95
+    initial_sample : int, optional
+        Number of lines sampled in the first round, by default
+        INITIAL_SAMPLE
+    seed : Optional[int], optional
+        Seed of the random offsets, by default None
+
+    Yields
+    ------
+    Preview
+        The estimates after each round. The last one is exact if the whole
+        file could be read within the budget.
+    """
+
+    start = time.perf_counter()
+    size = os.path.getsize(file_path)
+    if size == 0:
+        yield Preview([], [], [], [], 0, 0, True, 0.0)
+        return
+
+    rng = random.Random(seed)
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    sample = _Sample()
+    n = initial_sample
+
+    with open(file_path, 'rb') as f:
+        while True:
+            round_start, round_bytes = time.perf_counter(), sample.n_bytes
+            for line, weight in sample_lines(f, size, n, rng):
+                sample.add(line, weight)
+            now = time.perf_counter()
+            round_bytes = sample.n_bytes - round_bytes
+            remaining = time_budget - (now - start)
+
+            if sample.n_lines:
+                # the exact answer reads the file twice, at about the speed
+                # of the sample
+                exact_seconds = 2 * size * (now - round_start) / max(round_bytes, 1)
+                if exact_seconds <= remaining or sample.n_bytes >= size:
+                    yield exact_preview(file_path, k, time.perf_counter() - start)
+                    return
+                yield sample.preview(k, z, now - start)
+
+            # the next round reads twice as many lines
+            if 2 * (now - round_start) > remaining:
+                return
+            n *= 2
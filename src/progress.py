@@ -0,0 +1,245 @@
+"""Live progress and throughput of the q-functions.
+
+The engines read the file through `progress.lines`, which returns the file
+itself when no reporter is active, so there is no cost at all when the
+progress is off. When a `ProgressReporter` is active, the lines are
+counted and, at most every `interval` seconds, a report is built with:
+
+* the stage (engine and pass), the lines and the bytes read so far,
+* the lines per second and the MB per second of the stage,
+* the ETA of the stage, from the offset in the file,
+* the current RSS of the process,
+* the `metrics` counters, such as `quoted_resolved` and `dedup_hits`.
+
+Each report is passed to a callback and can be exported, for a scheduler
+that detects stalled or slow jobs, to a Prometheus textfile (the format of
+the node exporter textfile collector) or appended to a JSON lines log.
+
+Example
+-------
+>>> reporter = ProgressReporter(jsonl_path="progress.jsonl", interval=5)
+>>> with reporter:
+...     q1_memory("farmers-protest-tweets-2021-2-4.json")
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+from . import metrics
+
+# The time is checked every CHECK_EVERY lines only, not on every line
+CHECK_EVERY = 1024
+
+# Reporter of the process, None when the progress is off
+_active = None
+
+Line = TypeVar('Line', str, bytes)
+
+
+def current_rss_mb() -> float:
+    """Current resident memory of the process in MB. Where `/proc` is not
+    available, the peak resident memory is returned instead.
+    """
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, KB on Linux
+        return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+class ProgressReporter:
+    """Builds and exports the progress reports while it is active.
+
+    Parameters
+    ----------
+    callback : Optional[Callable[[dict], None]], optional
+        Called with each report, by default None
+    interval : float, optional
+        Minimum seconds between two reports of a stage, the last report of
+        each stage is always sent, by default 1.0
+    textfile_path : Optional[str], optional
+        Prometheus textfile, rewritten with each report, by default None
+    jsonl_path : Optional[str], optional
+        JSON lines log, each report is appended, by default None
+    """
+
+    def __init__(
+            self,
+            callback: Optional[Callable[[dict], None]] = None,
+            interval: float = 1.0,
+            textfile_path: Optional[str] = None,
+            jsonl_path: Optional[str] = None,
+            ) -> None:
+        self.callback = callback
+        self.interval = interval
+        self.textfile_path = textfile_path
+        self.jsonl_path = jsonl_path
+        self._previous = None
+
+    def __enter__(self) -> 'ProgressReporter':
+        global _active
+        self._previous, _active = _active, self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active
+        _active = self._previous
+
+    def track(
+            self,
+            f,
+            stage: str,
+            source: Optional[Iterable[Line]] = None,
+            ) -> Iterator[Line]:
+        """Yield the lines of an open file, reporting the progress.
+
+        Parameters
+        ----------
+        f : IO
+            The open file.
+        stage : str
+            Name of the stage, such as `q1_memory:mains`.
+        source : Optional[Iterable[Line]], optional
+            The lines of the file read by another reader, such as
+            `reader.file_lines`. The offset is then the size of the lines
+            yielded, by default None
+
+        Yields
+        ------
+        Line
+            The lines of the file.
+        """
+
+        fd = f.fileno()
+        total_bytes = os.fstat(fd).st_size
+        start = time.monotonic()
+        next_report = start + self.interval
+        n_lines = 0
+        # size of the lines yielded, with their newlines
+        consumed = 0
+
+        def report(now):
+            if source is None:
+                # the offset of the file descriptor is a bit ahead of the
+                # lines yielded, by the size of the read buffer
+                offset = os.lseek(fd, 0, os.SEEK_CUR)
+            else:
+                offset = min(consumed, total_bytes)
+            self.emit(stage, n_lines, offset, total_bytes, now - start)
+
+        for line in (f if source is None else source):
+            n_lines += 1
+            if source is not None:
+                consumed += len(line) + 1
+            if n_lines % CHECK_EVERY == 0:
+                now = time.monotonic()
+                if now >= next_report:
+                    report(now)
+                    next_report = now + self.interval
+            yield line
+
+        report(time.monotonic())
+
+    def emit(
+            self,
+            stage: str,
+            n_lines: int,
+            offset: int,
+            total_bytes: int,
+            elapsed: float,
+            ) -> dict:
+        """Build a report, pass it to the callback and export it."""
+
+        mb_per_second = offset / 2**20 / elapsed if elapsed > 0 else 0.0
+        remaining = max(total_bytes - offset, 0)
+        report = {
+            'time': time.time(),
+            'stage': stage,
+            'lines': n_lines,
+            'bytes': offset,
+            'total_bytes': total_bytes,
+            'elapsed_seconds': elapsed,
+            'lines_per_second': n_lines / elapsed if elapsed > 0 else 0.0,
+            'mb_per_second': mb_per_second,
+            'eta_seconds': (remaining / 2**20 / mb_per_second
+                            if mb_per_second > 0 else None),
+            'rss_mb': current_rss_mb(),
+            'metrics': metrics.snapshot(),
+        }
+
+        if self.callback is not None:
+            self.callback(report)
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, 'a') as f:
+                f.write(json.dumps(report) + '\n')
+        if self.textfile_path is not None:
+            write_textfile(self.textfile_path, report)
+        return report
+
+
+def write_textfile(path: str, report: dict) -> None:
+    """Write a report in the Prometheus text format. The file is replaced
+    atomically, so a collector never reads a partial file.
+    """
+
+    label = 'stage="{}"'.format(report['stage'].replace('"', r'\"'))
+    values = [
+        ('latam_progress_lines', report['lines']),
+        ('latam_progress_bytes', report['bytes']),
+        ('latam_progress_total_bytes', report['total_bytes']),
+        ('latam_progress_lines_per_second', report['lines_per_second']),
+        ('latam_progress_mb_per_second', report['mb_per_second']),
+        ('latam_progress_eta_seconds', report['eta_seconds']),
+        ('latam_progress_rss_mb', report['rss_mb']),
+        ('latam_progress_last_report_timestamp_seconds', report['time']),
+    ]
+    lines = [f'{name}{{{label}}} {value}' for name, value in values
+             if value is not None]
+    lines += [f'latam_metric{{{label},name="{name}"}} {value}'
+              for name, value in sorted(report['metrics'].items())]
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def is_active() -> bool:
+    """Whether a reporter is active. The engines then publish their
+    `metrics` counters as they go, instead of at the end of a pass, so
+    the reports see them."""
+
+    return _active is not None
+
+
+def lines(f: Iterable[Line], stage: str) -> Iterable[Line]:
+    """The lines of an open file, tracked by the active reporter if any.
+
+    Parameters
+    ----------
+    f : Iterable[Line]
+        The open file.
+    stage : str
+        Name of the stage, such as `q1_memory:mains`.
+
+    Returns
+    -------
+    Iterable[Line]
+        The file itself when the progress is off and the files are not
+        read in the background (see `reader.background`).
+    """
+
+    from . import reader
+
+    source = reader.file_lines(f) if reader.is_enabled() else None
+    if _active is None:
+        return f if source is None else source
+    return _active.track(f, stage, source)
@@ -1,11 +1,24 @@
-from typing import List, Tuple
-from datetime import datetime
+from typing import List, Optional, Tuple
+from datetime import date, datetime
 
 import json
+from array import array
+import tempfile
 from collections import defaultdict, Counter
 
+from . import metrics
+from . import progress
+from . import spill
 
-def q1_memory(file_path: str) -> List[Tuple[datetime.date, str]]:
+
+def q1_memory(
+        file_path: str,
+        max_memory_mb: Optional[float] = None,
+        two_phase: bool = False,
+        quote_index: bool = False,
+        mode: Optional[str] = None,
+        workers: Optional[int] = None,
+        ) -> List[Tuple[datetime.date, str]]:
     """Find the top user for each of the top 10 dates with the most activity.
 
     Note: For optimizing memory usage, we use Python objects, which doesn't
@@ -15,30 +28,81 @@ def q1_memory(file_path: str) -> List[Tuple[datetime.date, str]]:
     ----------
     file_path : str
         Path to the JSON file containing the tweets data.
+    max_memory_mb : Optional[float], optional
+        Memory budget in MB for the ids and the counters. When given, they
+        are spilled to disk as sorted runs when they pass the budget and
+        the exact result is obtained by merging the runs. It can't be
+        combined with `two_phase` or `quote_index`, by default None
+    two_phase : bool, optional
+        Count only the tweets of each date first, and then the users of the
+        top 10 dates only, so the counters of the users don't grow with the
+        number of dates. The ids are kept in arrays instead of sets. The
+        result is the same, by default False
+    quote_index : bool, optional
+        Read the quoted tweets to count from the saved `QuoteIndex` of the
+        file, built on the first call, instead of walking the quote chains
+        of every line. The result is the same, by default False
+    mode : Optional[str], optional
+        Aggregate the file with `parallel.run_query` in this mode, one of
+        `parallel.QUERY_MODES`, instead of the passes of this function.
+        The result is the same. It can't be combined with the
+        options above, by default None
+    workers : Optional[int], optional
+        Number of threads or processes of `mode`, by default the number
+        of CPUs
 
     Returns
     -------
     List[Tuple[datetime.date, str]]
         A list of tuples containing the date and the username of the top user
         for each of the top 10 dates with the most activity.
+
+    Raises
+    ------
+    ValueError
+        If `max_memory_mb` is given with `two_phase` or the quote index.
     """
 
+    if mode is not None:
+        from .parallel import run_query
+        return run_query('q1', file_path, workers, mode, max_memory_mb=max_memory_mb,
+                         two_phase=two_phase, quote_index=quote_index)
+    if max_memory_mb is not None:
+        if two_phase or quote_index:
+            raise ValueError(
+                'max_memory_mb is not supported with two_phase or the quote index')
+        return _q1_external(file_path, max_memory_mb)
+    if two_phase:
+        return _q1_two_phase(file_path)
+
     # Initialize counters for dates and users
     date_counts = Counter()
     user_counts = defaultdict(Counter)
     ids = set()
 
     with open(file_path, 'r') as f:
-        for line in f:
+        for line in progress.lines(f, 'q1_memory:mains'):
             tweet = json.loads(line)
             date = datetime.fromisoformat(tweet['date']).date()
             date_counts[date] += 1
             user_counts[date][tweet['user']['username']] += 1
             ids.add(tweet['id'])
 
-    # now read the quoted tweets
+    if quote_index:
+        # the quoted tweets that are not main tweets, from the index
+        from .quote_index import QuoteIndex
+        for current in QuoteIndex.for_file(file_path).counted_tweets():
+            date = current.date
+            date_counts[date] += 1
+            user_counts[date][current.username] += 1
+        return _top_users(date_counts, user_counts)
+
+    # now read the quoted tweets, counting the ones resolved and the ones
+    # that are already counted
+    resolved = dedup_hits = 0
+    live = progress.is_active()
     with open(file_path, 'r') as f:
-        for line in f:
+        for line in progress.lines(f, 'q1_memory:quoted'):
             tweet = json.loads(line)
             # create a queue to process the quoted tweets
             queue = []
@@ -47,17 +111,36 @@ def q1_memory(file_path: str) -> List[Tuple[datetime.date, str]]:
             while queue:
                 # pop the first tweet from the queue
                 current = queue.pop(0)
+                resolved += 1
                 # process the tweet if it hasn't been processed yet
                 if current['id'] not in ids:
                     date = datetime.fromisoformat(current['date']).date()
                     date_counts[date] += 1
                     user_counts[date][current['user']['username']] += 1
                     ids.add(current['id'])
+                else:
+                    dedup_hits += 1
                 # get the next quoted tweet if it exists
                 if current.get('quotedTweet'):
                     # append the quoted tweet to the queue
                     queue.append(current['quotedTweet'])
 
+            # published for each line with quotes when the progress is
+            # reported, so the reports of the pass see them
+            if live and resolved:
+                metrics.merge({'quoted_resolved': resolved, 'dedup_hits': dedup_hits})
+                resolved = dedup_hits = 0
+
+    metrics.merge({'quoted_resolved': resolved, 'dedup_hits': dedup_hits})
+    return _top_users(date_counts, user_counts)
+
+
+def _top_users(
+        date_counts: Counter,
+        user_counts: defaultdict,
+        ) -> List[Tuple[datetime.date, str]]:
+    """The top user of each of the top 10 dates of the counters."""
+
     # Get the top 10 most active dates
     top_dates = [date for date, _ in date_counts.most_common(10)]
 
@@ -76,3 +159,146 @@ def q1_memory(file_path: str) -> List[Tuple[datetime.date, str]]:
         result.append((date, top_user))
 
     return result
+
+
+def _q1_two_phase(file_path: str) -> List[Tuple[datetime.date, str]]:
+    """q1_memory counting the users of the top 10 dates only.
+
+    The ids are not kept in sets. Phase 1 records the id of each main tweet
+    and the id and date of each copy of a quoted tweet in compact arrays,
+    and the copies that are counted, the first copy of the quoted tweets
+    that are not main tweets, are then found with NumPy. Phase 2 only keeps
+    the positions of the copies counted on the top 10 dates, a copy being
+    numbered in the order the quote chains are walked.
+    """
+
+    import numpy as np
+
+    # Phase 1: count the tweets of each date, in a single pass. The quoted
+    # tweets are counted once the whole file is read, after the main ones
+    date_counts = Counter()
+    main_ids, quoted_ids, quoted_days = array('q'), array('q'), array('i')
+    with open(file_path, 'r') as f:
+        for line in progress.lines(f, 'q1_memory:dates'):
+            tweet = json.loads(line)
+            date_counts[datetime.fromisoformat(tweet['date']).date()] += 1
+            main_ids.append(tweet['id'])
+            # each tweet quotes at most one tweet, the quotes form a chain
+            current = tweet.get('quotedTweet')
+            while current:
+                quoted_ids.append(current['id'])
+                quoted_days.append(datetime.fromisoformat(current['date']).toordinal())
+                current = current.get('quotedTweet')
+
+    # the first copy of each quoted tweet, in the order they are found,
+    # that is not a main tweet
+    ids = np.frombuffer(quoted_ids, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+    first = np.empty(len(ids), dtype=bool)
+    first[:1] = True
+    np.not_equal(sorted_ids[1:], sorted_ids[:-1], out=first[1:])
+    del sorted_ids
+    counted = np.sort(order[first])
+    del order, first
+    counted = counted[~np.isin(ids[counted], np.frombuffer(main_ids, dtype=np.int64))]
+    del ids, quoted_ids, main_ids
+
+    # a date is added to the counter when its first quoted tweet is counted
+    days = np.frombuffer(quoted_days, dtype=np.int32)[counted]
+    values, first, counts = np.unique(days, return_index=True, return_counts=True)
+    for k in np.argsort(first, kind='stable'):
+        date_counts[date.fromordinal(int(values[k]))] += int(counts[k])
+
+    # The counts of the dates are exact, so the top 10 dates and the order
+    # of their ties are the same as with all the counters
+    top_dates = [day for day, _ in date_counts.most_common(10)]
+
+    # the copies counted on the top dates, in order
+    counted = counted[np.isin(days, [day.toordinal() for day in top_dates])]
+    del days, quoted_days
+
+    # Phase 2: count the users of the top dates in a single pass. The main
+    # tweets are counted before the quoted tweets in q1_memory, so each
+    # user keeps the position where it is first counted, to resolve the
+    # ties in the same order
+    user_counts = {day: Counter() for day in top_dates}
+    first_seen = {day: {} for day in top_dates}
+
+    def add(tweet, position):
+        day = datetime.fromisoformat(tweet['date']).date()
+        if day in user_counts:
+            username = tweet['user']['username']
+            user_counts[day][username] += 1
+            # the quoted tweets of a line are read before the main tweets
+            # of the next lines, but they are counted after them
+            first = first_seen[day]
+            if username not in first or position < first[username]:
+                first[username] = position
+
+    # number of the next copy of a quoted tweet, and of the next copy to
+    # count, counted[k]
+    copy = k = 0
+    next_counted = counted[0] if len(counted) else -1
+    with open(file_path, 'r') as f:
+        for n, line in enumerate(progress.lines(f, 'q1_memory:users')):
+            tweet = json.loads(line)
+            add(tweet, (0, n))
+            current = tweet.get('quotedTweet')
+            while current:
+                if copy == next_counted:
+                    add(current, (1, copy))
+                    k += 1
+                    next_counted = counted[k] if k < len(counted) else -1
+                copy += 1
+                current = current.get('quotedTweet')
+
+    result = []
+    for day in top_dates:
+        users = user_counts[day]
+        top_user = min(users, key=lambda u: (-users[u], first_seen[day][u]))
+        result.append((day, top_user))
+    return result
+
+
+def _q1_external(
+        file_path: str,
+        max_memory_mb: float,
+        ) -> List[Tuple[datetime.date, str]]:
+    """q1_memory with the ids and the counters spilled to disk."""
+
+    def project(tweet):
+        date = datetime.fromisoformat(tweet['date']).date()
+        return (date, tweet['user']['username'])
+
+    budget = spill.budget_bytes(max_memory_mb, 2)
+    with tempfile.TemporaryDirectory(prefix='q1-spill-') as directory:
+        # count the tweets of each user on each date
+        user_counts = spill.SpillCounter(budget, directory)
+        for seq, key in spill.counted_tweets(
+                file_path, project, budget, directory):
+            user_counts.add(key, (seq,))
+
+        # The merged counts are sorted by date, so the tweets of each date
+        # and its top user are found one date at a time. The number of
+        # dates is small, they are kept in memory
+        dates = []
+        top_user = {}
+        date, total = None, 0
+        for (current, username), count, first in user_counts.merged():
+            if current != date:
+                if date is not None:
+                    dates.append((date, total, date_first))
+                date, total, date_first = current, 0, first
+                best = None
+            total += count
+            date_first = min(date_first, first)
+            # ties are resolved by the first tweet, as in most_common
+            if best is None or (-count, first) < best:
+                best = (-count, first)
+                top_user[date] = username
+        if date is not None:
+            dates.append((date, total, date_first))
+
+    # Get the top 10 most active dates and their top user
+    return [(date, top_user[date]) for date, _ in spill.top_keys(dates, 10)]
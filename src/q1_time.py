@@ -2,7 +2,9 @@ from typing import List, Tuple
 from datetime import datetime
 
 import json
-import pandas as pd
+
+from . import progress
+
 
 def q1_time(file_path: str) -> List[Tuple[datetime.date, str]]:
     """Find the top user for each of the top 10 dates with the most activity.
@@ -22,6 +24,10 @@ def q1_time(file_path: str) -> List[Tuple[datetime.date, str]]:
         for each of the top 10 dates with the most activity.
     """
 
+    # pandas is imported here, it takes longer to import than the function
+    # takes to run on small files
+    import pandas as pd
+
     # Read and process the JSON file line by line
     # This is faster than using pd.read_json directly
     # because it avoids reading the entire file
@@ -33,7 +39,7 @@ def q1_time(file_path: str) -> List[Tuple[datetime.date, str]]:
     # consequently, it is also more memory efficient
     def row_generator():
         with open(file_path, 'r') as f:
-            for line in f:
+            for line in progress.lines(f, 'q1_time'):
                 tweet = json.loads(line)
                 yield (
                     tweet['date'],
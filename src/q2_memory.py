@@ -1,66 +1,184 @@
 import json
-from collections import defaultdict, Counter
-from typing import List, Tuple
-import emoji
+import tempfile
+from collections import Counter
+from typing import Iterator, List, Optional, Tuple
 
+from . import metrics
+from . import prefilter as raw
+from . import progress
+from . import spill
+from .emojis import extract_emojis
 
-def q2_memory(file_path: str) -> List[Tuple[str, int]]:
+
+def q2_memory(
+        file_path: str,
+        max_memory_mb: Optional[float] = None,
+        prefilter: bool = True,
+        quote_index: bool = False,
+        mode: Optional[str] = None,
+        workers: Optional[int] = None,
+        ) -> List[Tuple[str, int]]:
     """Find the top 10 emojis used in the main content of the tweets and
     the quoted content of the tweets. Only consider quoted content that
     is not a reply to another tweet, to avoid double counting.
 
     Note: For optimizing memory usage, we use Python objects, which doesn't
-    have big overhead like Pandas DataFrames.
+    have big overhead like Pandas DataFrames. The texts are never stored:
+    emojis are counted as soon as each distinct tweet is seen, so only the
+    tweet ids and the emoji counts are kept in memory.
+
+    A main tweet that appears in several lines is counted once, with the
+    content of its first line, as `q2_time` does. The first version of
+    this function kept the content of its last line instead, the results
+    differ only when the copies of a tweet have different contents.
 
     Parameters
     ----------
     file_path : str
         Path to the JSON file containing the tweets data.
+    max_memory_mb : Optional[float], optional
+        Memory budget in MB for the ids and the counters. When given, they
+        are spilled to disk as sorted runs when they pass the budget and
+        the exact result is obtained by merging the runs. It can't be
+        combined with `quote_index`, by default None
+    prefilter : bool, optional
+        Skip the JSON decoding of the lines without emojis, and of the
+        lines without quoted tweets in the second pass, deciding from the
+        raw bytes (see `prefilter`). The result is the same. It doesn't
+        apply with `max_memory_mb`, by default True
+    quote_index : bool, optional
+        Read the quoted tweets to count from the saved `QuoteIndex` of the
+        file, built on the first call, instead of walking the quote chains
+        of every line. The result is the same, by default False
+    mode : Optional[str], optional
+        Aggregate the file with `parallel.run_query` in this mode, one of
+        `parallel.QUERY_MODES`, instead of the passes of this function.
+        The result is the same. It can't be combined with
+        `max_memory_mb` or `quote_index`, and the prefilter doesn't apply,
+        by default None
+    workers : Optional[int], optional
+        Number of threads or processes of `mode`, by default the number
+        of CPUs
 
     Returns
     -------
     List[Tuple[str, int]]
         A list of tuples where each tuple contains an emoji and its count.
         The list is sorted in descending order of the count.
+
+    Raises
+    ------
+    ValueError
+        If `max_memory_mb` is given with the quote index.
     """
 
-    # Initialize dictionaries to store the main and quoted content
-    content = defaultdict(str)
-
-    with open(file_path, 'r') as f:
-        for line in f:
-            tweet = json.loads(line)
-            content[tweet['id']] = tweet['content']
-
-    # remove quotes that are replies, that is, there exists a main tweet
-    # with the same id as the quoted tweet. This avoids duplicates
-    ids = set(content.keys())
-
-    # now read the quoted tweets
-    with open(file_path, 'r') as f:
-        for line in f:
-            tweet = json.loads(line)
-            queue = []
-            # create a queue to process the quoted tweets
-            if tweet.get('quotedTweet'):
-                queue = [tweet.get('quotedTweet')]
-            while queue:
-                # pop the first tweet from the queue
-                current = queue.pop(0)
-                # process the tweet if it hasn't been processed yet
-                if current['id'] not in ids:
-                    content[current['id']] = current['content']
-                    ids.add(current['id'])
-                # get the next quoted tweet if it exists
-                if current.get('quotedTweet'):
-                    # append the quoted tweet to the queue
-                    queue.append(current['quotedTweet'])
-
-    # Get all the texts from tweets
-    texts = list(content.values())
-
-    # Make a list of all the emojis in the texts
-    emojis_flat = [e['emoji'] for text in texts for e in emoji.emoji_list(text)]
+    if mode is not None:
+        from .parallel import run_query
+        return run_query('q2', file_path, workers, mode, max_memory_mb=max_memory_mb,
+                         quote_index=quote_index)
+    if max_memory_mb is not None:
+        if quote_index:
+            raise ValueError('max_memory_mb is not supported with the quote index')
+        return _q2_external(file_path, max_memory_mb)
+
+    # Ids of the tweets whose content has already been counted
+    ids = set()
+
+    def distinct_texts() -> Iterator[str]:
+        """Yield the content of each distinct tweet exactly once, main
+        tweets first and then the quoted tweets that are not main tweets.
+        """
+        lines = skips = resolved = dedup_hits = 0
+        live = progress.is_active()
+        with open(file_path, 'rb') as f:
+            for line in progress.lines(f, 'q2_memory:mains'):
+                lines += 1
+                # a line without emojis only adds the id of its tweet
+                if prefilter and not raw.may_have_emojis(line):
+                    ids.add(raw.tweet_id(line))
+                    skips += 1
+                    continue
+                tweet = json.loads(line)
+                # skip repeated main tweets, their content is already counted
+                if tweet['id'] not in ids:
+                    ids.add(tweet['id'])
+                    yield tweet['content']
+
+        if quote_index:
+            # the quoted tweets that are not main tweets, from the index
+            from .quote_index import QuoteIndex
+            for current in QuoteIndex.for_file(file_path).counted_tweets():
+                yield current.content
+            if prefilter:
+                raw.record(lines, skips)
+            return
+
+        # now read the quoted tweets. Every main tweet id is already in
+        # `ids`, so quotes that are replies are skipped, avoiding duplicates
+        with open(file_path, 'rb') as f:
+            for line in progress.lines(f, 'q2_memory:quoted'):
+                lines += 1
+                # nothing to do for a line without quoted tweets
+                if prefilter and raw.all_empty(line, raw.QUOTED_KEY):
+                    skips += 1
+                    continue
+                tweet = json.loads(line)
+                queue = []
+                # create a queue to process the quoted tweets
+                if tweet.get('quotedTweet'):
+                    queue = [tweet.get('quotedTweet')]
+                while queue:
+                    # pop the first tweet from the queue
+                    current = queue.pop(0)
+                    resolved += 1
+                    # process the tweet if it hasn't been processed yet
+                    if current['id'] not in ids:
+                        ids.add(current['id'])
+                        yield current['content']
+                    else:
+                        dedup_hits += 1
+                    # get the next quoted tweet if it exists
+                    if current.get('quotedTweet'):
+                        # append the quoted tweet to the queue
+                        queue.append(current['quotedTweet'])
+
+                # published for each line with quotes when the progress is
+                # reported, so the reports of the pass see them
+                if live and resolved:
+                    metrics.merge({'quoted_resolved': resolved, 'dedup_hits': dedup_hits})
+                    resolved = dedup_hits = 0
+
+        metrics.merge({'quoted_resolved': resolved, 'dedup_hits': dedup_hits})
+        if prefilter:
+            raw.record(lines, skips)
+
+    # Count the emojis of each text as it is read, the generator never
+    # holds more than one text at a time. The emojis of repeated texts
+    # are memoized
+    emoji_counts = Counter(
+        e for text in distinct_texts() for e in extract_emojis(text)
+    )
 
     # Return the top 10 emojis and its count
-    return Counter(emojis_flat).most_common(10)
+    return emoji_counts.most_common(10)
+
+
+def _q2_external(file_path: str, max_memory_mb: float) -> List[Tuple[str, int]]:
+    """q2_memory with the ids and the counters spilled to disk. Every line
+    is decoded, without the prefilter. A repeated main tweet is counted
+    with the content of its first line."""
+
+    def project(tweet):
+        return extract_emojis(tweet['content'])
+
+    budget = spill.budget_bytes(max_memory_mb, 2)
+    with tempfile.TemporaryDirectory(prefix='q2-spill-') as directory:
+        emoji_counts = spill.SpillCounter(budget, directory)
+        # the content of a repeated main tweet is counted only once
+        for seq, emojis in spill.counted_tweets(
+                file_path, project, budget, directory, repeated_mains=False):
+            for position, e in enumerate(emojis):
+                emoji_counts.add(e, (seq, position))
+
+        # Return the top 10 emojis and its count
+        return spill.top_keys(emoji_counts.merged(), 10)
@@ -1,13 +1,16 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import json
-from collections import Counter
 
-import pandas as pd
-import emoji
+from . import progress
+from .emojis import PARALLEL_MIN_TEXTS, count_emojis
 
 
-def q2_time(file_path: str) -> List[Tuple[str, int]]:
+def q2_time(
+        file_path: str,
+        workers: Optional[int] = None,
+        min_parallel: int = PARALLEL_MIN_TEXTS,
+        ) -> List[Tuple[str, int]]:
     """Find the top 10 emojis used in the main content of the tweets and
     the quoted content of the tweets. Only consider quoted content that
     is not a reply to another tweet, to avoid double counting.
@@ -19,6 +22,12 @@ def q2_time(file_path: str) -> List[Tuple[str, int]]:
     ----------
     file_path : str
         Path to the JSON file containing the tweets data.
+    workers : Optional[int], optional
+        Number of processes used to extract the emojis. If None, use the
+        number of CPUs, by default None
+    min_parallel : int, optional
+        The texts are processed serially if there are fewer than this,
+        by default `emojis.PARALLEL_MIN_TEXTS`
 
     Returns
     -------
@@ -27,13 +36,17 @@ def q2_time(file_path: str) -> List[Tuple[str, int]]:
         The list is sorted in descending order of the count.
     """
 
+    # pandas is imported here, it takes longer to import than the function
+    # takes to run on small files
+    import pandas as pd
+
     # Use generator to avoid storing full list in memory
     # This is faster than using pd.read_json directly
     # because it avoids reading the entire file
     # consequently, it is also more memory efficient
     def row_generator():
         with open(file_path, 'r') as f:
-            for line in f:
+            for line in progress.lines(f, 'q2_time'):
                 tweet = json.loads(line)
                 yield (
                     tweet['content'],
@@ -77,8 +90,9 @@ def q2_time(file_path: str) -> List[Tuple[str, int]]:
     # Get all the texts from the main content and quoted content
     texts = df['content'].tolist()
 
-    # Make a list of all the emojis in the texts
-    emojis_flat = [e['emoji'] for text in texts for e in emoji.emoji_list(text)]
+    # Count the emojis in the texts, the texts are split in batches
+    # that are processed in parallel
+    emoji_counts = count_emojis(texts, workers=workers, min_parallel=min_parallel)
 
     # Return the top 10 emojis and its count
-    return Counter(emojis_flat).most_common(10)
+    return emoji_counts.most_common(10)
@@ -1,11 +1,25 @@
-from typing import List, Tuple
+from typing import Iterator, List, Optional, Tuple
 
-import re
 import json
-from collections import defaultdict, Counter
+import tempfile
+from collections import Counter
 
+from . import handles
+from . import metrics
+from . import prefilter as raw
+from . import progress
+from . import spill
 
-def q3_memory(file_path: str) -> List[Tuple[str, int]]:
+
+def q3_memory(
+        file_path: str,
+        max_memory_mb: Optional[float] = None,
+        prefilter: bool = True,
+        quote_index: bool = False,
+        mention_source: str = 'field',
+        mode: Optional[str] = None,
+        workers: Optional[int] = None,
+        ) -> List[Tuple[str, int]]:
     """Finds the historical top 10 most influential users (username)
     based on the count of mentions (@) each one receives.
 
@@ -17,32 +31,163 @@ def q3_memory(file_path: str) -> List[Tuple[str, int]]:
     ----------
     file_path : str
         Path to the JSON file containing the tweets data.
+    max_memory_mb : Optional[float], optional
+        Memory budget in MB for the ids and the counters. When given, they
+        are spilled to disk as sorted runs when they pass the budget and
+        the exact result is obtained by merging the runs. It can't be
+        combined with `quote_index`, by default None
+    prefilter : bool, optional
+        Skip the JSON decoding of the lines without mentions, and of the
+        lines without quoted tweets in the second pass, deciding from the
+        raw bytes (see `prefilter`). The result is the same. It doesn't
+        apply with `max_memory_mb`, by default True
+    quote_index : bool, optional
+        Read the quoted tweets to count from the saved `QuoteIndex` of the
+        file, built on the first call, instead of walking the quote chains
+        of every line. The result is the same, by default False
+    mention_source : str, optional
+        Where the mentions of a tweet are read, one of
+        `handles.MENTION_SOURCES`: the `mentionedUsers` field, the
+        `@handles` of the content, or the field when it is present and not
+        null and else the content (`auto`), by default 'field'
+    mode : Optional[str], optional
+        Aggregate the file with `parallel.run_query` in this mode, one of
+        `parallel.QUERY_MODES`, instead of the passes of this function.
+        The result is the same. It can't be combined with
+        `max_memory_mb`, `quote_index` or a mention_source other than
+        `field`, and the prefilter doesn't apply, by default None
+    workers : Optional[int], optional
+        Number of threads or processes of `mode`, by default the number
+        of CPUs
 
     Returns
     -------
     List[Tuple[str, int]]
         A list of tuples containing the top 10 most influential users
         and the count of mentions each one receives.
+
+    Raises
+    ------
+    ValueError
+        If the source of the mentions is unknown, or is `auto` with the
+        quote index, which doesn't tell a null field from an empty one, or
+        if `max_memory_mb` is given with the quote index.
     """
 
-    # Initialize dictionaries to store the main and quoted content
+    _check_source(mention_source, quote_index)
+    if mode is not None:
+        from .parallel import run_query
+        return run_query('q3', file_path, workers, mode, max_memory_mb=max_memory_mb,
+                         quote_index=quote_index,
+                         mention_source=None if mention_source == 'field' else mention_source)
+    if max_memory_mb is not None:
+        if quote_index:
+            raise ValueError('max_memory_mb is not supported with the quote index')
+        return _q3_external(file_path, max_memory_mb, mention_source)
+
+    # Count the mentions of the counted tweets
     mentioned = Counter()
+    for _, usernames in mentioning_tweets(file_path, prefilter, quote_index, mention_source):
+        mentioned.update(usernames)
+
+    # Count the mentions and select the top 10
+    return mentioned.most_common(10)
+
+
+def _check_source(mention_source: str, quote_index: bool) -> None:
+    handles.check_source(mention_source)
+    if quote_index and mention_source == 'auto':
+        raise ValueError("mention_source 'auto' is not supported with the quote index")
+
+
+def _no_mentions(line: bytes, mention_source: str) -> bool:
+    """Whether no tweet of a raw line has mentions from the source."""
+
+    if mention_source == 'field':
+        return raw.all_empty(line, raw.MENTIONS_KEY)
+    if mention_source == 'content':
+        return not handles.may_have_handles(line)
+    return raw.all_empty(line, raw.MENTIONS_KEY) and not handles.may_have_handles(line)
+
+
+def mentioning_tweets(
+        file_path: str,
+        prefilter: bool = True,
+        quote_index: bool = False,
+        mention_source: str = 'field',
+        ) -> Iterator[Tuple[dict, List[str]]]:
+    """Yield the tweets counted by `q3_memory` that mention users, with
+    the usernames they mention.
+
+    The main tweets are yielded first, in the order of the lines, and then
+    the quoted tweets whose id is not the id of a main tweet or of a quoted
+    tweet already yielded.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    prefilter : bool, optional
+        Skip the JSON decoding of the lines without mentions, and of the
+        lines without quoted tweets in the second pass, by default True
+    quote_index : bool, optional
+        Read the quoted tweets from the saved `QuoteIndex` of the file
+        instead of the second pass. They are yielded with their user and
+        content only, by default False
+    mention_source : str, optional
+        Where the mentions are read, see `q3_memory`, by default 'field'
+
+    Yields
+    ------
+    Tuple[dict, List[str]]
+        The tweets, main or quoted, that mention users, and the usernames
+        they mention in order.
+    """
+
+    _check_source(mention_source, quote_index)
     ids = set()
+    lines = skips = 0
 
-    with open(file_path, 'r') as f:
-        for line in f:
+    with open(file_path, 'rb') as f:
+        for line in progress.lines(f, 'q3_memory:mains'):
+            lines += 1
+            # a line without mentions only adds the id of its tweet
+            if prefilter and _no_mentions(line, mention_source):
+                ids.add(raw.tweet_id(line))
+                skips += 1
+                continue
             tweet = json.loads(line)
             ids.add(tweet['id'])
-            # count mentions username
-            if tweet.get('mentionedUsers'):
-                for mention in tweet['mentionedUsers']:
-                    username = mention['username']
-                    mentioned[username] += 1
+            usernames = handles.tweet_mentions(tweet, mention_source)
+            if usernames:
+                yield tweet, usernames
 
+    if quote_index:
+        # the quoted tweets that are not main tweets, from the index
+        from .quote_index import QuoteIndex
+        for current in QuoteIndex.for_file(file_path).counted_tweets():
+            if mention_source == 'content':
+                usernames = handles.extract_handles(current.content)
+            else:
+                usernames = current.mentions
+            if usernames:
+                yield {'user': {'username': current.username},
+                       'content': current.content}, usernames
+        if prefilter:
+            raw.record(lines, skips)
+        return
 
-    # now read the quoted tweets
-    with open(file_path, 'r') as f:
-        for line in f:
+    # now read the quoted tweets, counting the ones resolved and the ones
+    # that are already counted
+    resolved = dedup_hits = 0
+    live = progress.is_active()
+    with open(file_path, 'rb') as f:
+        for line in progress.lines(f, 'q3_memory:quoted'):
+            lines += 1
+            # nothing to do for a line without quoted tweets
+            if prefilter and raw.all_empty(line, raw.QUOTED_KEY):
+                skips += 1
+                continue
             tweet = json.loads(line)
             # create a queue to process the quoted tweets
             queue = []
@@ -51,17 +196,48 @@ def q3_memory(file_path: str) -> List[Tuple[str, int]]:
             while queue:
                 # pop the first element
                 current = queue.pop(0)
+                resolved += 1
                 if current['id'] not in ids:
-                    # count mentions username
-                    if current.get('mentionedUsers'):
-                        for mention in current['mentionedUsers']:
-                            username = mention['username']
-                            mentioned[username] += 1
+                    usernames = handles.tweet_mentions(current, mention_source)
+                    if usernames:
+                        yield current, usernames
                     ids.add(current['id'])
+                else:
+                    dedup_hits += 1
                 # add the quoted tweet of the current tweet to the queue
                 # if it exists
                 if current.get('quotedTweet'):
                     queue.append(current['quotedTweet'])
 
-    # Count the mentions and select the top 10
-    return mentioned.most_common(10)
+            # published for each line with quotes when the progress is
+            # reported, so the reports of the pass see them
+            if live and resolved:
+                metrics.merge({'quoted_resolved': resolved, 'dedup_hits': dedup_hits})
+                resolved = dedup_hits = 0
+
+    metrics.merge({'quoted_resolved': resolved, 'dedup_hits': dedup_hits})
+    if prefilter:
+        raw.record(lines, skips)
+
+
+def _q3_external(
+        file_path: str,
+        max_memory_mb: float,
+        mention_source: str = 'field',
+        ) -> List[Tuple[str, int]]:
+    """q3_memory with the ids and the counters spilled to disk. Every line
+    is decoded, without the prefilter."""
+
+    def project(tweet):
+        return tuple(handles.tweet_mentions(tweet, mention_source))
+
+    budget = spill.budget_bytes(max_memory_mb, 2)
+    with tempfile.TemporaryDirectory(prefix='q3-spill-') as directory:
+        mentioned = spill.SpillCounter(budget, directory)
+        for seq, usernames in spill.counted_tweets(
+                file_path, project, budget, directory):
+            for position, username in enumerate(usernames):
+                mentioned.add(username, (seq, position))
+
+        # Count the mentions and select the top 10
+        return spill.top_keys(mentioned.merged(), 10)
@@ -1,10 +1,11 @@
 from typing import List, Tuple
 import json
 
-import pandas as pd
+from . import handles
+from . import progress
 
 
-def q3_time(file_path: str) -> List[Tuple[str, int]]:
+def q3_time(file_path: str, mention_source: str = 'field') -> List[Tuple[str, int]]:
     """Finds the historical top 10 most influential users (username)
     based on the count of mentions (@) each one receives.
 
@@ -12,89 +13,121 @@ def q3_time(file_path: str) -> List[Tuple[str, int]]:
     Double counting is avoided by removing the quoted content that is
     a reply to another tweet.
 
-    Note: For optimizing time, Pandas DataFrame is used to process the data
-    which is usually very fast due to its vectorized operations.
+    Note: For optimizing time, the usernames are extracted into flat arrays
+    while parsing, and then dictionary-encoded to integers and counted with
+    NumPy vectorized operations. No DataFrame of mentions is ever built.
+    The contents read for their `@handles` are only scanned once the
+    duplicates are removed, all together in a single search.
 
     Parameters
     ----------
     file_path : str
         Path to the JSON file containing the tweets data.
+    mention_source : str, optional
+        Where the mentions of a tweet are read, see `q3_memory`,
+        by default 'field'
 
     Returns
     -------
     List[Tuple[str, int]]
         A list of tuples containing the top 10 most influential users
         and the count of mentions each one receives.
+
+    Raises
+    ------
+    ValueError
+        If the source of the mentions is unknown.
     """
 
-    # Use generator to avoid storing full list in memory
-    # This is faster than using pd.read_json directly
-    # because it avoids reading the entire file
-    # consequently, it is also more memory efficient
-    def row_generator():
-        with open(file_path, 'r') as f:
-            for line in f:
-                tweet = json.loads(line)
-                yield (
-                    tweet['id'],
-                    tweet['mentionedUsers'],
-                    tweet['quotedTweet'],
-                )
-
-    # Create DataFrame from generator
-    df = pd.DataFrame(
-        row_generator(),
-        columns=[
-            'id',
-            'mentionedUsers',
-            'quotedTweet',
-            ]
-    )
-
-    # Flatten all nested quoted tweets using a queue
-    all_quoted = []
-    # Create a queue to process quoted tweets
-    queue = df['quotedTweet'].dropna().tolist()
-    while queue:
-        # Pop the first element from the queue
-        current = queue.pop(0)
-        # Add to the list of all quoted tweets
-        all_quoted.append(current)
-        # Get the next quoted tweet
-        quoted = current.get('quotedTweet')
-        # If there is a quoted tweet, add to the queue
-        if quoted is not None:
-            queue.append(quoted)
-
-    # Combine original and quoted tweets, removing duplicates
-    quoted_df = pd.DataFrame(all_quoted)
-
-    # keep only columns that are needed
-    if not quoted_df.empty:
-        quoted_df = quoted_df[['id', 'mentionedUsers', 'quotedTweet']]
-
-    # Combine original and quoted tweets, removing duplicates
-    df = pd.concat([df, quoted_df], ignore_index=True).drop_duplicates(subset='id')
-
-    # Transform mentionedUsers column, which is a list of dictionaries,
-    # into a dataframe and get the username column
-    username = pd.json_normalize(
-        df['mentionedUsers']
-        .dropna()
-        .explode()
-        .reset_index(drop=True)
-        )
-
-    # Get the username column
-    if not username.empty:
-        username = username['username']
+    handles.check_source(mention_source)
+
+    # numpy and pandas are imported here, they take longer to import than
+    # the function takes to run on small files
+    import numpy as np
+    import pandas as pd
+
+    # Flat arrays filled while parsing. For each tweet we keep its id and
+    # its number of mentions, the mentioned usernames are all kept in a
+    # single list. Main tweets and quoted tweets are kept apart so the
+    # main tweets come first when removing duplicates
+    ids, n_mentions, usernames = [], [], []
+    quoted_ids, quoted_n_mentions, quoted_usernames = [], [], []
+    # The tweets whose mentions are read from the content, with their
+    # position in the list of ids and their content
+    contents, quoted_contents = {}, {}
+
+    with open(file_path, 'r') as f:
+        for line in progress.lines(f, 'q3_time'):
+            tweet = json.loads(line)
+            if handles.uses_content(tweet, mention_source):
+                contents[len(ids)] = tweet['content']
+                mentions = ()
+            else:
+                mentions = tweet.get('mentionedUsers') or ()
+            ids.append(tweet['id'])
+            n_mentions.append(len(mentions))
+            usernames.extend(mention['username'] for mention in mentions)
+
+            # Each tweet quotes at most one tweet, so the nested quoted
+            # tweets form a chain
+            current = tweet.get('quotedTweet')
+            while current is not None:
+                if handles.uses_content(current, mention_source):
+                    quoted_contents[len(quoted_ids)] = current['content']
+                    mentions = ()
+                else:
+                    mentions = current.get('mentionedUsers') or ()
+                quoted_ids.append(current['id'])
+                quoted_n_mentions.append(len(mentions))
+                quoted_usernames.extend(
+                    mention['username'] for mention in mentions)
+                current = current.get('quotedTweet')
+
+    # Keep the first occurrence of each tweet, this removes the quoted
+    # tweets that are replies to a main tweet and the repeated quotes
+    keep_tweets = ~pd.Index(ids + quoted_ids).duplicated()
+    # Expand the mask from one value per tweet to one value per mention
+    n_mentions = n_mentions + quoted_n_mentions
+    keep = np.repeat(keep_tweets, n_mentions)
+
+    usernames = np.array(usernames + quoted_usernames, dtype=object)[keep]
+
+    if contents or quoted_contents:
+        # The contents of the kept tweets, and the position of their tweet,
+        # the quoted tweets after the main tweets
+        texts = list(contents.values()) + list(quoted_contents.values())
+        text_positions = np.array(
+            list(contents) + [len(ids) + i for i in quoted_contents], dtype=np.int64)
+        kept_texts = np.flatnonzero(keep_tweets[text_positions])
+        rows, found = handles.extract_flat([texts[i] for i in kept_texts])
+
+        # Merge the mentions of the fields and of the contents in the
+        # order of the tweets, a tweet has mentions from one source only,
+        # so a stable sort by tweet keeps the order inside each tweet
+        positions = np.concatenate([
+            np.repeat(np.arange(len(n_mentions)), n_mentions)[keep],
+            text_positions[kept_texts[np.array(rows, dtype=np.int64)]]])
+        order = np.argsort(positions, kind='stable')
+        usernames = np.concatenate([usernames, np.array(found, dtype=object)])[order]
     # If no usernames are found, return empty list
-    else:
+    if len(usernames) == 0:
         return []
 
-    # Count the number of mentions for each username
-    # and get the top 10
-    top_mentions = username.value_counts().head(10).reset_index()
+    # Dictionary-encode the usernames, the codes follow the order of
+    # first appearance, and count the mentions of each code
+    codes, uniques = pd.factorize(usernames)
+    counts = np.bincount(codes)
+
+    # Select the top 10 without sorting all the users. All the users with
+    # the count of the 10th are candidates, so ties are resolved by the
+    # order of first appearance, as in `Counter.most_common`
+    n = 10
+    if len(counts) > n:
+        threshold = np.partition(counts, -n)[-n]
+        candidates = np.flatnonzero(counts >= threshold)
+    else:
+        candidates = np.arange(len(counts))
+    top = candidates[np.argsort(-counts[candidates], kind='stable')][:n]
 
     # Convert to list of tuples and return
-    return top_mentions.to_records(index=False).tolist()
+    return [(uniques[i], int(counts[i])) for i in top]
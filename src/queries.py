@@ -0,0 +1,50 @@
+"""Lightweight entry point to all the q-functions.
+
+Importing this module doesn't import any of the q-functions, nor pandas or
+emoji. Each function is imported the first time it is used, so short jobs
+only pay for the modules they need.
+
+Example
+-------
+>>> from src import queries
+>>> queries.q3_memory("farmers-protest-tweets-2021-2-4.json")
+"""
+
+import importlib
+from typing import Any, List
+
+__all__ = [
+    'q1_time',
+    'q1_memory',
+    'q2_time',
+    'q2_memory',
+    'q3_time',
+    'q3_memory',
+    'q1_auto',
+    'q2_auto',
+    'q3_auto',
+]
+
+# the functions that don't live in the module of the same name
+_MODULES = {
+    'q1_auto': 'auto',
+    'q2_auto': 'auto',
+    'q3_auto': 'auto',
+}
+
+
+def __getattr__(name: str) -> Any:
+    # each function lives in the module of the same name, except the
+    # ones of _MODULES
+    if name not in __all__:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    module = _MODULES.get(name, name)
+    func = getattr(importlib.import_module(f'.{module}', __package__), name)
+    # keep it, next time it is found without calling __getattr__
+    globals()[name] = func
+    return func
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
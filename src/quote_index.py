@@ -0,0 +1,282 @@
+"""Persisted index of the quoted tweets of a file.
+
+Each `_memory` engine reads the file a second time to walk the quote
+chains, and a popular tweet is found again in every chain that quotes it.
+The `QuoteIndex` is built in a single pass and saved next to the cached
+results, keyed by the fingerprint of the file (see `cache`). It keeps:
+
+* the records of the distinct quoted tweets, in the order the `_memory`
+  engines find them, as a `batch.TweetBatch`: date, username, content and
+  mentions,
+* for each quoted tweet, the id of the tweet it quotes in turn (its
+  parent up the chain, -1 at the end of the chain), and the number of
+  times it is quoted,
+* the ids of the main tweets, line by line.
+
+While building, the walk of a chain stops at the first tweet already
+indexed, because the rest of its chain is indexed too. With the index,
+the quoted tweets counted by the engines, the ones that are not main
+tweets, are found with one vectorized set difference, `np.isin`, instead
+of a walk of every chain on every run.
+
+Example
+-------
+>>> index = QuoteIndex.for_file("farmers-protest-tweets-2021-2-4.json")
+>>> index.stats()['max_depth']
+>>> q1_memory("farmers-protest-tweets-2021-2-4.json", quote_index=True)
+"""
+
+import hashlib
+import json
+import os
+from array import array
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from . import prefilter as raw
+from . import progress
+from .batch import BatchBuilder, StringColumn, TweetBatch, TweetView
+from .cache import DEFAULT_CACHE_DIR, file_fingerprint
+
+# Default folder of the saved indexes
+DEFAULT_INDEX_DIR = os.path.join(DEFAULT_CACHE_DIR, 'quote-index')
+
+# Version of the format of the saved indexes
+VERSION = 1
+
+# Parent of the quoted tweets that quote no tweet
+NO_PARENT = -1
+
+
+class QuoteIndex:
+    """Distinct quoted tweets of a file and their chains.
+
+    Parameters
+    ----------
+    main_ids : np.ndarray
+        Id of the main tweet of each line.
+    records : TweetBatch
+        The distinct quoted tweets, in the order they are first found.
+    parents : np.ndarray
+        Id of the tweet quoted by each quoted tweet, or NO_PARENT.
+    references : np.ndarray
+        Number of tweets that quote each quoted tweet, a repeated main
+        tweet counts on each line.
+    fingerprint : tuple, optional
+        Fingerprint of the file, by default ()
+    """
+
+    def __init__(
+            self,
+            main_ids: np.ndarray,
+            records: TweetBatch,
+            parents: np.ndarray,
+            references: np.ndarray,
+            fingerprint: tuple = (),
+            ) -> None:
+        self.main_ids = main_ids
+        self.records = records
+        self.parents = parents
+        self.references = references
+        self.fingerprint = fingerprint
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Id of each quoted tweet."""
+        return self.records.ids
+
+    @classmethod
+    def from_file(cls, file_path: str) -> 'QuoteIndex':
+        """Build the index of a file, in one pass.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the JSON file containing the tweets data.
+
+        Returns
+        -------
+        QuoteIndex
+            The index.
+        """
+
+        fingerprint = file_fingerprint(file_path)
+        main_ids, parents, references = array('q'), array('q'), array('q')
+        records = BatchBuilder(quotes=False)
+        positions = {}
+
+        with open(file_path, 'rb') as f:
+            for line in progress.lines(f, 'quote_index:build'):
+                # a line without quoted tweets only adds the id of its tweet
+                if raw.all_empty(line, raw.QUOTED_KEY):
+                    main_ids.append(raw.tweet_id(line))
+                    continue
+                tweet = json.loads(line)
+                main_ids.append(tweet['id'])
+                current = tweet.get('quotedTweet')
+                while current:
+                    position = positions.get(current['id'])
+                    if position is not None:
+                        # the rest of the chain is already indexed
+                        references[position] += 1
+                        break
+                    positions[current['id']] = len(parents)
+                    records.append(current)
+                    current = current.get('quotedTweet')
+                    parents.append(current['id'] if current else NO_PARENT)
+                    references.append(1)
+
+        return cls(np.frombuffer(main_ids, dtype=np.int64), records.build(),
+                   np.frombuffer(parents, dtype=np.int64),
+                   np.frombuffer(references, dtype=np.int64), fingerprint)
+
+    @classmethod
+    def for_file(
+            cls,
+            file_path: str,
+            index_dir: Optional[str] = None,
+            ) -> 'QuoteIndex':
+        """The saved index of a file, built and saved if there is none or
+        if the file changed.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the JSON file containing the tweets data.
+        index_dir : Optional[str], optional
+            Folder of the saved indexes. If None, DEFAULT_INDEX_DIR,
+            by default None
+
+        Returns
+        -------
+        QuoteIndex
+            The index.
+        """
+
+        fingerprint = file_fingerprint(file_path)
+        key = hashlib.sha256(repr(fingerprint).encode('utf-8')).hexdigest()[:32]
+        path = os.path.join(index_dir or DEFAULT_INDEX_DIR, f'{key}.npz')
+
+        if os.path.exists(path):
+            try:
+                index = cls.load(path)
+            except (OSError, ValueError, KeyError):
+                # a corrupted or older index is built again
+                index = None
+            if index is not None and index.fingerprint == fingerprint:
+                return index
+
+        index = cls.from_file(file_path)
+        index.save(path)
+        return index
+
+    def save(self, path: str) -> None:
+        """Save the index as a NumPy `.npz` file, atomically."""
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        r = self.records
+        arrays = {
+            'main_ids': self.main_ids,
+            'parents': self.parents,
+            'references': self.references,
+            'ids': r.ids,
+            'days': r.days,
+            'mention_offsets': r.mention_offsets,
+        }
+        for name in ('users', 'contents', 'mentions'):
+            column = getattr(r, name)
+            arrays[f'{name}_data'] = column.data
+            arrays[f'{name}_offsets'] = column.offsets
+        header = {'version': VERSION, 'fingerprint': list(self.fingerprint)}
+        arrays['header'] = np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8)
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'QuoteIndex':
+        """Load an index saved by `save`.
+
+        Raises
+        ------
+        ValueError
+            If the index has another version of the format.
+        """
+
+        with np.load(path) as data:
+            header = json.loads(data['header'].tobytes())
+            if header['version'] != VERSION:
+                raise ValueError(f'unsupported quote index version: {header["version"]}')
+            columns = {name: StringColumn(data[f'{name}_data'], data[f'{name}_offsets'])
+                       for name in ('users', 'contents', 'mentions')}
+            records = TweetBatch(
+                data['ids'], data['days'], columns['users'], columns['contents'],
+                data['mention_offsets'], columns['mentions'],
+                np.zeros(len(data['ids']) + 1, dtype=np.int64))
+            return cls(data['main_ids'], records, data['parents'],
+                       data['references'], tuple(header['fingerprint']))
+
+    def counted(self) -> np.ndarray:
+        """Positions of the quoted tweets counted by the `_memory` engines,
+        the ones that are not main tweets, in the order of the engines."""
+
+        return np.flatnonzero(~np.isin(self.ids, self.main_ids))
+
+    def counted_tweets(self) -> Iterator[TweetView]:
+        """The quoted tweets counted by the `_memory` engines, in order."""
+
+        for position in self.counted():
+            yield TweetView(self.records, int(position))
+
+    def depths(self) -> np.ndarray:
+        """Number of tweets quoted below each quoted tweet in its chain."""
+
+        n = len(self.ids)
+        order = np.argsort(self.ids, kind='stable')
+        has_parent = self.parents != NO_PARENT
+        # the parent of a quoted tweet is always indexed
+        parent_positions = order[np.searchsorted(self.ids, self.parents, sorter=order)
+                                 .clip(max=max(n - 1, 0))]
+
+        depths = np.where(has_parent, -1, 0)
+        # one level of the chains at a time
+        pending = np.flatnonzero(has_parent)
+        while len(pending):
+            ready = depths[parent_positions[pending]] >= 0
+            if not ready.any():
+                # a loop of quotes, only in malformed data, stays at -1
+                break
+            depths[pending[ready]] = depths[parent_positions[pending[ready]]] + 1
+            pending = pending[~ready]
+        return depths
+
+    def stats(self) -> Dict[str, object]:
+        """Statistics of the quote chains.
+
+        Returns
+        -------
+        Dict[str, object]
+            `quoted` distinct quoted tweets, `counted` the ones that are
+            not main tweets, `max_depth` and `mean_depth` of the chains
+            below the quoted tweets, `depth_histogram` the number of
+            quoted tweets of each depth, `looped` the quoted tweets whose
+            chain has a loop, without a depth, `max_references` the times
+            the most quoted tweet is quoted.
+        """
+
+        depths = self.depths()
+        # the tweets in or above a loop of quotes have no depth
+        looped = depths < 0
+        depths = depths[~looped]
+        return {
+            'quoted': len(self.ids),
+            'counted': len(self.counted()),
+            'max_depth': int(depths.max()) if len(depths) else 0,
+            'mean_depth': float(depths.mean()) if len(depths) else 0.0,
+            'depth_histogram': np.bincount(depths).tolist(),
+            'looped': int(looped.sum()),
+            'max_references': int(self.references.max()) if len(self.ids) else 0,
+        }
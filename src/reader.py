@@ -0,0 +1,307 @@
+"""Read a JSON lines file in a background thread.
+
+`for line in f` reads and parses in the same thread, so on slow storage
+(network-attached disks, compressed files) the CPU waits for the reads
+and the disk waits for the CPU. `read_lines` moves the reads to a
+background thread: it fills a preallocated buffer with `readinto`, splits
+the block in lines and puts the batch of lines in a bounded queue, while
+the caller parses the previous batch. The reads release the GIL, so they
+overlap with the parsing.
+
+The queue holds at most `max_batches` batches, so the memory used is
+bounded by about `(max_batches + 2) * block_size`, whatever the size of
+the file, plus the longest line.
+
+The engines read their files through `progress.lines`. Inside `background`
+it reads them with `read_lines` instead of `for line in f`, so every pass
+of every engine overlaps its reads with its parsing.
+
+Example
+-------
+>>> for line in read_lines("farmers-protest-tweets-2021-2-4.json"):
+...     tweet = json.loads(line)
+>>> with background():
+...     q1_memory("farmers-protest-tweets-2021-2-4.json")
+
+To compare it with `for line in f`, on cold and warm page cache:
+
+    python -m src.reader farmers-protest-tweets-2021-2-4.json
+"""
+
+import contextlib
+import gzip
+import io
+import json
+import os
+import pathlib
+import queue
+import sys
+import threading
+import time
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+# Size of the blocks read from the file
+DEFAULT_BLOCK_SIZE = 1 << 20
+# Number of batches of lines that can wait in the queue
+DEFAULT_MAX_BATCHES = 4
+
+# Marks the end of the file in the queue
+_DONE = None
+
+# Whether `progress.lines` reads the files with `read_lines`
+_enabled = False
+
+
+def _open(file_path: str):
+    # gzip files are decompressed by the background thread too
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rb')
+    return open(file_path, 'rb', buffering=0)
+
+
+def _read_batches(
+        file_path: str,
+        block_size: int,
+        batches: queue.Queue,
+        stop: threading.Event,
+        start: int = 0,
+        ) -> None:
+    """Body of the background thread: put the lines of each block in the
+    queue, then `_DONE`, or the exception raised while reading.
+    """
+
+    def put(item) -> bool:
+        # wait for room in the queue, unless the reader is closed
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        buffer = bytearray(block_size)
+        view = memoryview(buffer)
+        # the pieces of the line that continues in the next block, joined
+        # once when it ends, so a line longer than a block is copied once
+        pending = []
+        with _open(file_path) as f:
+            if start:
+                f.seek(start)
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                end = buffer.rfind(b'\n', 0, n)
+                if end < 0:
+                    pending.append(bytes(view[:n]))
+                    continue
+                pending.append(view[:end])
+                lines = b''.join(pending).split(b'\n')
+                pending = [bytes(view[end + 1:n])]
+                if not put(lines):
+                    return
+        # the last line may have no newline
+        tail = b''.join(pending)
+        if tail and not put([tail]):
+            return
+        put(_DONE)
+    except BaseException as error:
+        put(error)
+
+
+def iter_batches(
+        file_path: str,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        max_batches: int = DEFAULT_MAX_BATCHES,
+        start: int = 0,
+        ) -> Iterator[List[bytes]]:
+    """Yield the lines of a file in batches, read in a background thread.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON lines file, it can be compressed with gzip.
+    block_size : int, optional
+        Size of the blocks read from the file, by default DEFAULT_BLOCK_SIZE
+    max_batches : int, optional
+        Number of batches that can be read ahead, by default
+        DEFAULT_MAX_BATCHES
+    start : int, optional
+        Offset where the reading starts, by default 0
+
+    Yields
+    ------
+    List[bytes]
+        The lines of a block, without the newlines.
+    """
+
+    batches = queue.Queue(maxsize=max_batches)
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_read_batches, args=(file_path, block_size, batches, stop, start),
+        name='background-reader', daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+    finally:
+        # also when the caller stops early, the thread must not stay
+        # blocked on a full queue
+        stop.set()
+        thread.join()
+
+
+def read_lines(
+        file_path: str,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        max_batches: int = DEFAULT_MAX_BATCHES,
+        start: int = 0,
+        ) -> Iterator[bytes]:
+    """Yield the lines of a file, read in a background thread. A drop-in
+    replacement of `for line in f` for `json.loads`, see `iter_batches`.
+    """
+
+    for batch in iter_batches(file_path, block_size, max_batches, start):
+        yield from batch
+
+
+@contextlib.contextmanager
+def background(enabled: bool = True) -> Iterator[None]:
+    """Read the files of the engines with `read_lines` inside the block.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Whether the background reader is used, False turns it off inside
+        the block, by default True
+    """
+
+    global _enabled
+    previous, _enabled = _enabled, enabled
+    try:
+        yield
+    finally:
+        _enabled = previous
+
+
+def is_enabled() -> bool:
+    """Whether the engines read their files with `read_lines`."""
+    return _enabled
+
+
+def file_lines(f: IO) -> Iterator[Union[str, bytes]]:
+    """The lines of an open file from its current offset, read with
+    `read_lines`, as str for a file opened in text mode.
+
+    The lines have no newline, `json.loads` doesn't need it.
+    """
+
+    if isinstance(f, io.TextIOBase):
+        encoding = f.encoding
+        start = f.buffer.tell()
+        for batch in iter_batches(f.name, start=start):
+            for line in batch:
+                yield line.decode(encoding)
+    else:
+        yield from read_lines(f.name, start=f.tell())
+
+
+def drop_page_cache(file_path: str) -> bool:
+    """Ask the kernel to drop the cached pages of a file, so the next read
+    comes from the storage. Returns False where it is not supported.
+    """
+
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _parse_all(lines: Iterable[bytes]) -> int:
+    # the work of the engines: decode every tweet
+    n = 0
+    for line in lines:
+        if line.strip():
+            json.loads(line)
+            n += 1
+    return n
+
+
+def _plain_lines(file_path: str) -> Iterator[bytes]:
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rb') as f:
+        yield from f
+
+
+def benchmark(file_path: str, n: int = 3) -> Dict[Tuple[str, str], Tuple[float, float, float]]:
+    """Parse a file with `for line in f` and with `read_lines`, on cold and
+    warm page cache.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON lines file.
+    n : int, optional
+        Number of runs of each case, the median is kept, by default 3
+
+    Returns
+    -------
+    Dict[Tuple[str, str], Tuple[float, float, float]]
+        For each (reader, cache), the seconds, the MB per second and the CPU
+        utilization, the CPU time of the process over the elapsed time.
+    """
+
+    readers: Dict[str, Callable[[str], Iterable[bytes]]] = {
+        'for_line_in_f': _plain_lines,
+        'read_lines': read_lines,
+    }
+    size_mb = os.path.getsize(file_path) / 2**20
+
+    results = {}
+    for cache in ('cold', 'warm'):
+        for name, reader in readers.items():
+            runs = []
+            for _ in range(n):
+                if cache == 'cold':
+                    drop_page_cache(file_path)
+                else:
+                    _parse_all(reader(file_path))
+                cpu, start = time.process_time(), time.perf_counter()
+                _parse_all(reader(file_path))
+                elapsed = time.perf_counter() - start
+                runs.append((elapsed, (time.process_time() - cpu) / elapsed))
+            elapsed, utilization = sorted(runs)[len(runs) // 2]
+            results[(name, cache)] = (elapsed, size_mb / elapsed, utilization)
+    return results
+
+
+if __name__ == '__main__':
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'farmers-protest-tweets-2021-2-4.json'
+
+    # check if ../benchmark exists and create if not
+    benchmark_dir = pathlib.Path(__file__).resolve().parent.parent / 'benchmark'
+    benchmark_dir.mkdir(exist_ok=True)
+    file_name = benchmark_dir / 'reader.txt'
+
+    lines = [f'# {os.path.basename(file_path)} ({os.path.getsize(file_path) / 2**20:.0f} MB), '
+             f'Python {sys.version.split()[0]}',
+             'reader, page_cache, seconds, mb_per_second, cpu_utilization']
+    for (name, cache), (elapsed, mb_s, utilization) in benchmark(file_path).items():
+        lines.append(f'{name}, {cache}, {elapsed:.3f}, {mb_s:.1f}, {utilization:.2f}')
+        print(lines[-1])
+
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f'Saved to {file_name}')
@@ -0,0 +1,227 @@
+"""Long-running local server that answers q1, q2 and q3 over HTTP.
+
+Short-lived scripts pay the interpreter startup, the imports and a full
+scan of the file on every call. The server reads the file once into a
+`TweetIndex` and then answers each query from memory. When the file
+changes, the index is rebuilt in a background thread while the requests
+are answered with the previous one, and it keeps the latency of every
+endpoint. If the changed file can't be read, the previous index is kept
+and the error is reported in the metrics.
+
+Run it from the root of the repository:
+
+    python -m src.server farmers-protest-tweets-2021-2-4.json --port 8000
+
+and query it with any HTTP client:
+
+    curl 'http://127.0.0.1:8000/q1'
+    curl 'http://127.0.0.1:8000/q3?k=20'
+    curl 'http://127.0.0.1:8000/metrics'
+
+Every answer is a JSON object with the `result` and the time spent in
+the server, in milliseconds.
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from .cache import file_fingerprint
+from .index import TweetIndex
+
+
+class QueryServer(ThreadingHTTPServer):
+    """HTTP server holding the index of a tweets file. Each request is
+    handled in its own thread.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    host : str, optional
+        Address to listen on, by default '127.0.0.1'
+    port : int, optional
+        Port to listen on, 0 picks a free port, by default 8000
+    reload_interval : float, optional
+        Minimum number of seconds between two checks for changes of the
+        file, by default 1.0
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            file_path: str,
+            host: str = '127.0.0.1',
+            port: int = 8000,
+            reload_interval: float = 1.0,
+            ) -> None:
+        self.file_path = file_path
+        self.reload_interval = reload_interval
+
+        self._fingerprint = file_fingerprint(file_path)
+        self._index = TweetIndex.from_file(file_path)
+        self._last_check = time.monotonic()
+        # only one thread rebuilds the index, the requests keep being
+        # answered with the previous index until the new one is ready
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self.reload_error = None
+
+        # latency of each endpoint: number of requests, total and maximum
+        # time in seconds
+        self._metrics_lock = threading.Lock()
+        self._latency = defaultdict(lambda: {'requests': 0,
+                                             'total_seconds': 0.0,
+                                             'max_seconds': 0.0})
+        self.reloads = 0
+
+        super().__init__((host, port), QueryHandler)
+
+    def index(self) -> TweetIndex:
+        """Return the index, and start rebuilding it in the background if
+        the file has changed."""
+
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return self._index
+
+        # a reload is in progress in another thread
+        if not self._reload_lock.acquire(blocking=False):
+            return self._index
+        self._last_check = now
+        try:
+            fingerprint = file_fingerprint(self.file_path)
+        except OSError as error:
+            # the file is being replaced, check it again later
+            self.reload_error = f'{type(error).__name__}: {error}'
+            fingerprint = self._fingerprint
+        if fingerprint == self._fingerprint:
+            self._reload_lock.release()
+            return self._index
+
+        # the thread releases the lock when the index is ready
+        self._reload_thread = threading.Thread(
+            target=self._reload, args=(fingerprint,), daemon=True)
+        self._reload_thread.start()
+        return self._index
+
+    def _reload(self, fingerprint: Tuple) -> None:
+        try:
+            self._index = TweetIndex.from_file(self.file_path)
+            self.reload_error = None
+            self.reloads += 1
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            # a malformed file, keep answering with the previous index
+            self.reload_error = f'{type(error).__name__}: {error}'
+        finally:
+            # a malformed file isn't read again until it changes
+            self._fingerprint = fingerprint
+            self._reload_lock.release()
+
+    def wait_reload(self, timeout: Optional[float] = None) -> None:
+        """Wait for the reload in progress, if any, to finish."""
+
+        thread = self._reload_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def record_latency(self, endpoint: str, seconds: float) -> None:
+        """Add the time spent answering a request to the endpoint metrics."""
+
+        with self._metrics_lock:
+            latency = self._latency[endpoint]
+            latency['requests'] += 1
+            latency['total_seconds'] += seconds
+            latency['max_seconds'] = max(latency['max_seconds'], seconds)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the latency of each endpoint, the number of reloads and
+        the error of the last reload, if it failed."""
+
+        with self._metrics_lock:
+            endpoints = {
+                endpoint: dict(
+                    latency,
+                    mean_ms=1000 * latency['total_seconds'] / latency['requests'],
+                    max_ms=1000 * latency['max_seconds'],
+                )
+                for endpoint, latency in self._latency.items()
+            }
+        return {'endpoints': endpoints, 'reloads': self.reloads,
+                'reload_error': self.reload_error}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers `GET /q1`, `/q2` and `/q3`, with an optional `k` parameter
+    for the number of results, and `GET /metrics`.
+    """
+
+    server: QueryServer
+
+    def do_GET(self) -> None:
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/')
+
+        try:
+            status, body = self._answer(endpoint, parse_qs(url.query))
+        except ValueError as error:
+            status, body = 400, {'error': str(error)}
+
+        elapsed = time.perf_counter() - start
+        body['elapsed_ms'] = 1000 * elapsed
+        self._send_json(status, body)
+
+        if status == 200:
+            self.server.record_latency(endpoint, elapsed)
+
+    def _answer(self, endpoint: str, params: Dict) -> Tuple[int, Dict]:
+        if endpoint == 'metrics':
+            return 200, self.server.metrics()
+
+        if endpoint not in ('q1', 'q2', 'q3'):
+            return 404, {'error': f'unknown endpoint {endpoint!r}'}
+
+        k = int(params.get('k', ['10'])[0])
+        if k < 1:
+            raise ValueError('k must be positive')
+
+        index = self.server.index()
+        result = getattr(index, endpoint)(k)
+        if endpoint == 'q1':
+            # dates are not JSON serializable
+            result = [(date.isoformat(), username) for date, username in result]
+        return 200, {'result': result}
+
+    def _send_json(self, status: int, body: Dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        # the latency is in the metrics, don't print every request
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('file_path', help='JSON file with the tweets data')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--reload-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = QueryServer(args.file_path, args.host, args.port,
+                         args.reload_interval)
+    print(f'Serving {args.file_path} on '
+          f'http://{server.server_address[0]}:{server.server_address[1]}')
+    server.serve_forever()
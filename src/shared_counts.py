@@ -0,0 +1,599 @@
+"""Parallel aggregation of q1, q2 and q3 with numeric counters in shared
+memory.
+
+The file is split in chunks aligned to lines (see `chunks.split_file`) and
+each chunk is scanned by a worker process. Instead of returning `Counter`s,
+that the parent would unpickle and merge one key at a time, the workers
+count dictionary-encoded keys in NumPy arrays. The codes found are
+appended to arrays and added to the counters by blocks of `FLUSH_SIZE`,
+with `np.bincount` and `np.minimum.at`:
+
+* days are encoded by their offset from `DAY_BASE`, and emojis by their
+  position in the sorted emojis of the emoji table, so both have the same
+  codes in every process. Each chunk owns a row of a matrix in a
+  `multiprocessing.shared_memory` block, where its worker adds its blocks
+  of codes directly, and the rows are summed at the end,
+* usernames have no fixed vocabulary, so each worker encodes them in the
+  order it finds them and returns its vocabulary with its count arrays.
+  The parent maps the local codes to global ones and adds them with
+  vectorized operations. The vocabularies are pickled back to the parent,
+  their size grows with the distinct users of each chunk.
+
+The deduplication of the tweets needs the ids of the whole file, so the
+scan has two phases, like the two passes of the `_memory` engines:
+
+1. the workers count the main tweets and return their ids and the ids of
+   their quoted tweets. The parent finds, with `np.unique`, the first copy
+   of each main tweet and the quoted tweets that are counted: the first
+   copy of each quoted id that is not a main tweet,
+2. the workers count the emojis of the first copies of the main tweets and
+   the quoted tweets selected by the parent.
+
+Along with each count, the workers keep the position of the first time the
+key is counted, in the order of the `_memory` engines. The top-k is found
+with `np.argpartition` and the ties are sorted by that position, so the
+results are exactly the ones of the `_memory` engines, ties included.
+
+Example
+-------
+>>> counts = SharedCounts.from_file("farmers-protest-tweets-2021-2-4.json")
+>>> counts.q1()       # same as q1_memory
+>>> counts.q2(k=20)   # top 20 emojis
+"""
+
+import json
+import os
+from array import array
+from datetime import date, datetime
+from functools import lru_cache
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .chunks import iter_chunk, split_file
+from .emoji_table import process_table
+from .emojis import extract_emojis
+
+# Days are encoded as their offset from DAY_BASE, dates from 1970 to 2069
+# are supported
+DAY_BASE = date(1970, 1, 1).toordinal()
+N_DAYS = date(2070, 1, 1).toordinal() - DAY_BASE
+
+# Positions of the first time a key is counted. A main tweet is at
+# `line << POSITION_BITS | index`, where index is the position of the key
+# in the tweet, and the counted quoted tweets come after all the main
+# tweets, in the order of the second pass
+POSITION_BITS = 16
+QUOTED = 1 << 62
+NEVER = np.iinfo(np.int64).max
+
+# Codes appended by a worker before they are added to its counters
+FLUSH_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=None)
+def emoji_vocabulary() -> Tuple[List[str], Dict[str, int]]:
+    """The emojis of the emoji table, sorted, and the code of each one.
+    The vocabulary is the same in every process.
+    """
+
+    emojis = sorted(process_table().emojis)
+    return emojis, {emj: code for code, emj in enumerate(emojis)}
+
+
+def day_code(iso_date: str) -> int:
+    """Encode the date of a tweet.
+
+    Raises
+    ------
+    ValueError
+        If the date is out of the supported range.
+    """
+
+    code = datetime.fromisoformat(iso_date).date().toordinal() - DAY_BASE
+    if not 0 <= code < N_DAYS:
+        raise ValueError(f'date out of the supported range: {iso_date}')
+    return code
+
+
+def _layout(n_emojis: int) -> List[Tuple[str, int]]:
+    # name and width of each matrix of the shared block, all int64 with a
+    # row per chunk
+    return [
+        ('day_counts', N_DAYS),
+        ('day_first', N_DAYS),
+        ('emoji_counts', n_emojis),
+        ('emoji_first', n_emojis),
+    ]
+
+
+def _block_size(n_chunks: int, n_emojis: int) -> int:
+    return sum(8 * n_chunks * width for _, width in _layout(n_emojis))
+
+
+def _views(buffer, n_chunks: int, n_emojis: int) -> Dict[str, np.ndarray]:
+    # the matrices of the shared block, as arrays
+    views, offset = {}, 0
+    for name, width in _layout(n_emojis):
+        views[name] = np.ndarray(
+            (n_chunks, width), dtype=np.int64, buffer=buffer, offset=offset)
+        offset += 8 * n_chunks * width
+    return views
+
+
+def _fold(
+        counts: np.ndarray,
+        first: np.ndarray,
+        codes: array,
+        positions: array,
+        ) -> None:
+    """Add a block of codes to counters, in place, the first positions
+    with a minimum, and empty the block."""
+
+    if codes:
+        values = np.frombuffer(codes, dtype=np.int64)
+        counts += np.bincount(values, minlength=len(counts))
+        np.minimum.at(first, values, np.frombuffer(positions, dtype=np.int64))
+        # the arrays must be released before the block is resized
+        del values
+    del codes[:], positions[:]
+
+
+class _Users:
+    """Counters of the usernames found by a worker, encoded in the order
+    they are found: the mentions of each user and the tweets of each
+    (day, user) pair, with the position where each one is first counted.
+    """
+
+    def __init__(self) -> None:
+        self.codes = {}
+        self.pairs = {}
+        self.mention_counts = np.zeros(0, dtype=np.int64)
+        self.mention_first = np.zeros(0, dtype=np.int64)
+        self.pair_counts = np.zeros(0, dtype=np.int64)
+        self.pair_first = np.zeros(0, dtype=np.int64)
+        # the codes not yet counted, and their positions
+        self._mentions, self._mention_positions = array('q'), array('q')
+        self._tweets, self._tweet_positions = array('q'), array('q')
+
+    def code(self, username: str) -> int:
+        code = self.codes.get(username)
+        if code is None:
+            code = self.codes[username] = len(self.codes)
+        return code
+
+    def add_tweet(self, day: int, username: str, position: int) -> None:
+        key = (day, self.code(username))
+        index = self.pairs.get(key)
+        if index is None:
+            index = self.pairs[key] = len(self.pairs)
+        self._tweets.append(index)
+        self._tweet_positions.append(position)
+        if len(self._tweets) >= FLUSH_SIZE:
+            self.flush()
+
+    def add_mentions(self, tweet: dict, position: int) -> None:
+        mentions = tweet.get('mentionedUsers') or ()
+        for i, mention in enumerate(mentions):
+            self._mentions.append(self.code(mention['username']))
+            self._mention_positions.append(position | i)
+        if len(self._mentions) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """Count the codes appended since the last flush."""
+
+        self.mention_counts, self.mention_first = _grow(
+            self.mention_counts, self.mention_first, len(self.codes))
+        self.pair_counts, self.pair_first = _grow(
+            self.pair_counts, self.pair_first, len(self.pairs))
+        _fold(self.mention_counts, self.mention_first,
+              self._mentions, self._mention_positions)
+        _fold(self.pair_counts, self.pair_first,
+              self._tweets, self._tweet_positions)
+
+    def arrays(self) -> Tuple:
+        """The vocabulary and the counters, as arrays."""
+
+        self.flush()
+        pairs = np.array(list(self.pairs), dtype=np.int64).reshape(-1, 2)
+        return (
+            list(self.codes),
+            self.mention_counts,
+            self.mention_first,
+            pairs[:, 0],
+            pairs[:, 1],
+            self.pair_counts,
+            self.pair_first,
+        )
+
+
+def _grow(counts: np.ndarray, first: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    # the counters of the codes added since the last flush
+    extra = size - len(counts)
+    if extra <= 0:
+        return counts, first
+    return (np.concatenate([counts, np.zeros(extra, dtype=np.int64)]),
+            np.concatenate([first, np.full(extra, NEVER, dtype=np.int64)]))
+
+
+class _Days:
+    """Counters of the days and the emojis found by a worker, with fixed
+    codes, in the row of its chunk in the shared block.
+
+    Parameters
+    ----------
+    shm_name : str
+        Name of the shared block.
+    n_chunks : int
+        Number of chunks, the rows of the block.
+    chunk : int
+        Row of the worker.
+    """
+
+    def __init__(self, shm_name: str, n_chunks: int, chunk: int) -> None:
+        self.emoji_codes = emoji_vocabulary()[1]
+        self._shm = SharedMemory(name=shm_name)
+        views = _views(self._shm.buf, n_chunks, len(self.emoji_codes))
+        self.rows = {name: view[chunk] for name, view in views.items()}
+        # the codes not yet counted, and their positions
+        self._days, self._day_positions = array('q'), array('q')
+        self._emojis, self._emoji_positions = array('q'), array('q')
+
+    def add_day(self, day: int, position: int) -> None:
+        self._days.append(day)
+        self._day_positions.append(position)
+        if len(self._days) >= FLUSH_SIZE:
+            self.flush()
+
+    def add_emojis(self, text: str, position: int) -> None:
+        for i, emj in enumerate(extract_emojis(text)):
+            self._emojis.append(self.emoji_codes[emj])
+            # the quoted tweets of a line come before the next main tweet
+            # in the scan, but after it in the order of the positions
+            self._emoji_positions.append(position | i)
+        if len(self._emojis) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """Add the codes appended since the last flush to the row."""
+
+        rows = self.rows
+        _fold(rows['day_counts'], rows['day_first'], self._days, self._day_positions)
+        _fold(rows['emoji_counts'], rows['emoji_first'], self._emojis, self._emoji_positions)
+
+    def close(self) -> None:
+        """Flush and detach from the shared block."""
+
+        self.flush()
+        # the arrays must be released before the block is closed
+        self.rows = None
+        self._shm.close()
+
+
+def _count_mains(task: Tuple) -> Tuple:
+    """Phase 1: count the dates, users and mentions of the main tweets of a
+    chunk. The positions are relative to the start of the chunk, the parent
+    moves them once the number of lines of each chunk is known.
+
+    Returns
+    -------
+    Tuple
+        The number of lines, the ids of the main tweets, the ids of the
+        quoted tweets in the order of the second pass, and the counters of
+        the usernames.
+    """
+
+    file_path, start, end, chunk, shm_name, n_chunks = task
+    days, users = _Days(shm_name, n_chunks, chunk), _Users()
+    main_ids, quoted_ids = array('q'), array('q')
+
+    n_lines = 0
+    for line in iter_chunk(file_path, start, end):
+        tweet = json.loads(line)
+        position = n_lines << POSITION_BITS
+        day = day_code(tweet['date'])
+        days.add_day(day, position)
+        users.add_tweet(day, tweet['user']['username'], position)
+        users.add_mentions(tweet, position)
+        main_ids.append(tweet['id'])
+
+        # each tweet quotes at most one tweet, the quotes form a chain
+        current = tweet.get('quotedTweet')
+        while current:
+            quoted_ids.append(current['id'])
+            current = current.get('quotedTweet')
+        n_lines += 1
+
+    days.close()
+    return (n_lines, np.frombuffer(main_ids, dtype=np.int64),
+            np.frombuffer(quoted_ids, dtype=np.int64), users.arrays())
+
+
+def _count_rest(task: Tuple) -> Tuple:
+    """Phase 2: count the emojis of the first copy of each main tweet of a
+    chunk, and the quoted tweets selected by the parent.
+
+    Returns
+    -------
+    Tuple
+        The counters of the usernames.
+    """
+
+    (file_path, start, end, chunk, shm_name, n_chunks,
+     first_line, first_copies, quoted_offset, counted_quotes) = task
+    days, users = _Days(shm_name, n_chunks, chunk), _Users()
+
+    n_quoted = 0
+    for i, line in enumerate(iter_chunk(file_path, start, end)):
+        tweet = json.loads(line)
+        if first_copies[i]:
+            days.add_emojis(tweet['content'],
+                            (first_line + i) << POSITION_BITS)
+
+        current = tweet.get('quotedTweet')
+        while current:
+            if counted_quotes[n_quoted]:
+                position = QUOTED | (quoted_offset + n_quoted) << POSITION_BITS
+                day = day_code(current['date'])
+                days.add_day(day, position)
+                users.add_tweet(day, current['user']['username'], position)
+                users.add_mentions(current, position)
+                days.add_emojis(current['content'], position)
+            n_quoted += 1
+            current = current.get('quotedTweet')
+
+    days.close()
+    return users.arrays()
+
+
+def first_occurrences(values: np.ndarray) -> np.ndarray:
+    """Mask of the first occurrence of each value of an array."""
+
+    mask = np.zeros(len(values), dtype=bool)
+    mask[np.unique(values, return_index=True)[1]] = True
+    return mask
+
+
+def top_k(counts: np.ndarray, first: np.ndarray, k: int) -> np.ndarray:
+    """Codes of the `k` keys with the highest counts, the ties are sorted
+    by their first position, as in `Counter.most_common`.
+
+    Parameters
+    ----------
+    counts : np.ndarray
+        Count of each code.
+    first : np.ndarray
+        Position where each code is first counted.
+    k : int
+        Number of codes.
+
+    Returns
+    -------
+    np.ndarray
+        The codes, sorted.
+    """
+
+    candidates = np.flatnonzero(counts)
+    if len(candidates) > k:
+        # all the codes with the count of the k-th are candidates, their
+        # order is decided by the first position
+        kth = np.argpartition(-counts[candidates], k - 1)[k - 1]
+        threshold = counts[candidates[kth]]
+        candidates = candidates[counts[candidates] >= threshold]
+    order = np.lexsort((first[candidates], -counts[candidates]))
+    return candidates[order[:k]]
+
+
+class SharedCounts:
+    """Encoded counters of a tweets file, which answer q1, q2 and q3.
+
+    Parameters
+    ----------
+    day_counts, day_first : np.ndarray
+        Tweets of each day code, and first position of each one.
+    emoji_counts, emoji_first : np.ndarray
+        Uses of each emoji code, and first position of each one.
+    usernames : np.ndarray
+        Username of each user code.
+    mention_counts, mention_first : np.ndarray
+        Mentions of each user code, and first position of each one.
+    pair_days, pair_users, pair_counts, pair_first : np.ndarray
+        Day code, user code, number of tweets and first position of each
+        (day, user) pair.
+    """
+
+    def __init__(
+            self,
+            day_counts: np.ndarray,
+            day_first: np.ndarray,
+            emoji_counts: np.ndarray,
+            emoji_first: np.ndarray,
+            usernames: np.ndarray,
+            mention_counts: np.ndarray,
+            mention_first: np.ndarray,
+            pair_days: np.ndarray,
+            pair_users: np.ndarray,
+            pair_counts: np.ndarray,
+            pair_first: np.ndarray,
+            ) -> None:
+        self.day_counts = day_counts
+        self.day_first = day_first
+        self.emoji_counts = emoji_counts
+        self.emoji_first = emoji_first
+        self.usernames = usernames
+        self.mention_counts = mention_counts
+        self.mention_first = mention_first
+        self.pair_days = pair_days
+        self.pair_users = pair_users
+        self.pair_counts = pair_counts
+        self.pair_first = pair_first
+
+    @classmethod
+    def from_file(
+            cls,
+            file_path: str,
+            workers: Optional[int] = None,
+            ) -> 'SharedCounts':
+        """Count a tweets file in parallel.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the JSON file containing the tweets data.
+        workers : Optional[int], optional
+            Number of worker processes, and of chunks. If None, use the
+            number of CPUs. With one worker the chunk is counted in this
+            process, by default None
+
+        Returns
+        -------
+        SharedCounts
+            The counters of the file.
+        """
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        chunks = split_file(file_path, workers)
+        n_chunks = max(len(chunks), 1)
+        n_emojis = len(emoji_vocabulary()[0])
+
+        shm = SharedMemory(create=True, size=_block_size(n_chunks, n_emojis))
+        try:
+            views = _views(shm.buf, n_chunks, n_emojis)
+            for name in views:
+                views[name].fill(NEVER if name.endswith('_first') else 0)
+
+            if len(chunks) > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                pool = ProcessPoolExecutor(max_workers=len(chunks))
+                run = pool.map
+            else:
+                pool, run = None, map
+
+            try:
+                tasks = [(file_path, start, end, chunk, shm.name, n_chunks)
+                         for chunk, (start, end) in enumerate(chunks)]
+                # map returns the results in the order of the chunks
+                phase_1 = list(run(_count_mains, tasks))
+
+                # move the positions of the main tweets, relative to their
+                # chunk, after the lines of the previous chunks
+                n_lines = [n for n, _, _, _ in phase_1]
+                first_lines = np.cumsum([0] + n_lines[:-1])
+                parts = []
+                for chunk, (_, _, _, users) in enumerate(phase_1):
+                    shift = int(first_lines[chunk]) << POSITION_BITS
+                    _shift(views['day_first'][chunk], shift)
+                    mention_first = users[2].copy()
+                    _shift(mention_first, shift)
+                    parts.append(users[:2] + (mention_first,)
+                                 + users[3:6] + (users[6] + shift,))
+
+                main_ids = _concatenate([ids for _, ids, _, _ in phase_1])
+                quoted_ids = _concatenate([ids for _, _, ids, _ in phase_1])
+                # q2 counts the first copy of each main tweet, and all
+                # count the first copy of each quoted tweet that is not a
+                # main tweet
+                first_copies = first_occurrences(main_ids)
+                counted_quotes = (first_occurrences(quoted_ids)
+                                  & ~np.isin(quoted_ids, main_ids))
+
+                n_quoted = [len(ids) for _, _, ids, _ in phase_1]
+                main_bounds = np.cumsum([0] + n_lines)
+                quoted_bounds = np.cumsum([0] + n_quoted)
+                tasks = [
+                    task + (
+                        int(main_bounds[chunk]),
+                        first_copies[main_bounds[chunk]:main_bounds[chunk + 1]],
+                        int(quoted_bounds[chunk]),
+                        counted_quotes[quoted_bounds[chunk]:quoted_bounds[chunk + 1]],
+                    )
+                    for chunk, task in enumerate(tasks)
+                ]
+                parts.extend(run(_count_rest, tasks))
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
+            counts = cls._merge(views, parts)
+            # the arrays must be released before the block is closed
+            del views
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return counts
+
+    @classmethod
+    def _merge(cls, views: Dict[str, np.ndarray], parts: List[Tuple]) -> 'SharedCounts':
+        # sum the rows of the chunks, the first positions are the minimum
+        day_counts = views['day_counts'].sum(axis=0)
+        day_first = views['day_first'].min(axis=0)
+        emoji_counts = views['emoji_counts'].sum(axis=0)
+        emoji_first = views['emoji_first'].min(axis=0)
+
+        # map the local user codes of each part to global codes
+        vocabulary = [username for part in parts for username in part[0]]
+        usernames, codes = np.unique(
+            np.array(vocabulary, dtype=object), return_inverse=True)
+        offsets = np.cumsum([0] + [len(part[0]) for part in parts])
+        local_codes = [codes[offsets[i]:offsets[i + 1]] for i in range(len(parts))]
+
+        mention_counts = np.zeros(len(usernames), dtype=np.int64)
+        mention_first = np.full(len(usernames), NEVER, dtype=np.int64)
+        np.add.at(mention_counts, codes, _concatenate([p[1] for p in parts]))
+        np.minimum.at(mention_first, codes, _concatenate([p[2] for p in parts]))
+
+        # encode the (day, user) pairs as day * n_users + user
+        pair_keys = _concatenate([
+            part[3] * len(usernames) + local_codes[i][part[4]]
+            for i, part in enumerate(parts)])
+        keys, pair_codes = np.unique(pair_keys, return_inverse=True)
+        pair_counts = np.zeros(len(keys), dtype=np.int64)
+        pair_first = np.full(len(keys), NEVER, dtype=np.int64)
+        np.add.at(pair_counts, pair_codes, _concatenate([p[5] for p in parts]))
+        np.minimum.at(pair_first, pair_codes, _concatenate([p[6] for p in parts]))
+
+        return cls(day_counts, day_first, emoji_counts, emoji_first,
+                   usernames, mention_counts, mention_first,
+                   keys // max(len(usernames), 1), keys % max(len(usernames), 1),
+                   pair_counts, pair_first)
+
+    def q1(self, k: int = 10) -> List[Tuple[date, str]]:
+        """Top user of each of the top `k` dates with the most tweets."""
+
+        result = []
+        for day in top_k(self.day_counts, self.day_first, k):
+            pairs = np.flatnonzero(self.pair_days == day)
+            user = pairs[top_k(self.pair_counts[pairs], self.pair_first[pairs], 1)[0]]
+            result.append((date.fromordinal(DAY_BASE + int(day)),
+                           self.usernames[self.pair_users[user]]))
+        return result
+
+    def q2(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Top `k` emojis and their count."""
+
+        emojis = emoji_vocabulary()[0]
+        return [(emojis[code], int(self.emoji_counts[code]))
+                for code in top_k(self.emoji_counts, self.emoji_first, k)]
+
+    def q3(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Top `k` most mentioned users and their count of mentions."""
+
+        return [(self.usernames[code], int(self.mention_counts[code]))
+                for code in top_k(self.mention_counts, self.mention_first, k)]
+
+
+def _shift(first: np.ndarray, shift: int) -> None:
+    # move the first positions that are set, in place
+    first[first != NEVER] += shift
+
+
+def _concatenate(arrays: List[np.ndarray]) -> np.ndarray:
+    # np.concatenate fails on an empty list
+    if not arrays:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(arrays)
@@ -0,0 +1,338 @@
+"""External aggregation of the tweets under a hard memory budget.
+
+The `_memory` q-functions keep a set with the id of every tweet and exact
+counters, which can still be too big for very large files. When they are
+called with `max_memory_mb`, they use the structures of this module, that
+are spilled to a temporary folder as sorted runs when they grow past the
+budget. The exact results are then obtained by a k-way merge of the runs.
+At most `MAX_FAN_IN` runs are read at the same time: when there are more,
+groups of runs are first merged into new runs, in as many passes as
+needed, so the open files and the blocks read stay bounded. The runs are
+written in blocks sized from the budget, so the blocks of all the runs of
+a merge fit in the budget too.
+
+The deduplication of the tweets doesn't keep a set of ids. Every tweet
+found, main or quoted, is a record `(id, kind, seq, payload)`, where `seq`
+is the order in which the tweet was found. Sorting the records by id
+groups all the copies of a tweet, main copies first, so the copies that
+would be counted by the in-memory engines can be picked one group at a
+time. The order of the tweets is kept in `seq` to resolve ties the same
+way as `Counter.most_common`.
+"""
+
+import heapq
+import json
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from . import progress
+
+# Kinds of records, main tweets sort before the quoted tweets
+MAIN = 0
+QUOTED = 1
+
+# Rough size in bytes of a record and of each element of its payload, and
+# of an entry of a counter. These are estimates of the Python objects,
+# used to decide when to spill, not exact measures
+RECORD_BYTES = 150
+PAYLOAD_ITEM_BYTES = 60
+COUNTER_ENTRY_BYTES = 250
+
+# Maximum number of items pickled together in a run file
+BLOCK_SIZE = 4096
+
+# Maximum number of runs read at the same time by a merge
+MAX_FAN_IN = 64
+
+
+def block_size(budget_bytes: int, item_bytes: int) -> int:
+    """Items of each block of the runs, so that a block of each of
+    MAX_FAN_IN runs fits in the budget."""
+
+    return max(1, min(BLOCK_SIZE, budget_bytes // (item_bytes * MAX_FAN_IN)))
+
+
+def _write_run(items: Iterable[Any], directory: str, size: int = BLOCK_SIZE) -> str:
+    """Write sorted items to a new file in `directory` in blocks of `size`
+    items and return its path."""
+
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        block = []
+        for item in items:
+            block.append(item)
+            if len(block) == size:
+                pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+                block = []
+        if block:
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path: str) -> Iterator[Any]:
+    """Yield the items of a run file, one block in memory at a time."""
+
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+def _merge_runs(
+        runs: List[str],
+        directory: str,
+        size: int,
+        reduce: Optional[Callable[[Iterator[Any]], Iterator[Any]]] = None,
+        ) -> List[str]:
+    """Merge sorted runs in groups of MAX_FAN_IN runs, in as many passes as
+    needed, until fewer than MAX_FAN_IN runs are left. The merged runs are
+    removed.
+
+    Parameters
+    ----------
+    runs : List[str]
+        Paths of the runs.
+    directory : str
+        Folder where the new runs are written.
+    size : int
+        Items of each block of the new runs.
+    reduce : Optional[Callable[[Iterator[Any]], Iterator[Any]]], optional
+        Applied to the merged items of each group, for instance to add the
+        counts of the same key, by default None
+
+    Returns
+    -------
+    List[str]
+        Paths of the runs left, in sorted order once merged.
+    """
+
+    while len(runs) >= MAX_FAN_IN:
+        merged = []
+        for start in range(0, len(runs), MAX_FAN_IN):
+            group = runs[start:start + MAX_FAN_IN]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            stream = heapq.merge(*(_read_run(path) for path in group))
+            merged.append(_write_run(reduce(stream) if reduce else stream, directory, size))
+            for path in group:
+                os.remove(path)
+        runs = merged
+    return runs
+
+
+class SpillBuffer:
+    """A list of items that is spilled to disk as a sorted run every time
+    its estimated size passes the budget.
+
+    Parameters
+    ----------
+    budget_bytes : int
+        Estimated size of the items kept in memory before spilling.
+    directory : str
+        Folder where the runs are written.
+    """
+
+    def __init__(self, budget_bytes: int, directory: str) -> None:
+        self.budget_bytes = budget_bytes
+        self.directory = directory
+        self.block_size = block_size(budget_bytes, RECORD_BYTES)
+        self.runs = []
+        self._items = []
+        self._size = 0
+
+    def add(self, item: Any, size: int) -> None:
+        """Add an item whose estimated size is `size` bytes."""
+
+        self._items.append(item)
+        self._size += size
+        if self._size > self.budget_bytes:
+            self.spill()
+
+    def spill(self) -> None:
+        """Write the items in memory to a sorted run."""
+
+        if self._items:
+            self._items.sort()
+            self.runs.append(_write_run(self._items, self.directory, self.block_size))
+        self._items = []
+        self._size = 0
+
+    def merged(self) -> Iterator[Any]:
+        """Yield all the items, spilled or not, in sorted order."""
+
+        self._items.sort()
+        self.runs = _merge_runs(self.runs, self.directory, self.block_size)
+        return heapq.merge(
+            *(_read_run(path) for path in self.runs), iter(self._items))
+
+
+class SpillCounter:
+    """A counter that also keeps the first time each key was counted, and
+    is spilled to disk as a sorted run when it has too many keys.
+
+    Parameters
+    ----------
+    budget_bytes : int
+        Estimated size of the entries kept in memory before spilling.
+    directory : str
+        Folder where the runs are written.
+    """
+
+    def __init__(self, budget_bytes: int, directory: str) -> None:
+        self.max_entries = max(1, budget_bytes // COUNTER_ENTRY_BYTES)
+        self.directory = directory
+        self.block_size = block_size(budget_bytes, COUNTER_ENTRY_BYTES)
+        self.runs = []
+        # key -> [count, first]
+        self._entries = {}
+
+    def add(self, key: Hashable, first: Tuple) -> None:
+        """Count `key` once, `first` is the position where it was found.
+        Keys must be sortable, positions can be found in any order.
+        """
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [1, first]
+            if len(self._entries) >= self.max_entries:
+                self.spill()
+        else:
+            entry[0] += 1
+            entry[1] = min(entry[1], first)
+
+    def spill(self) -> None:
+        """Write the entries in memory to a run sorted by key."""
+
+        if self._entries:
+            items = sorted(
+                (key, count, first)
+                for key, (count, first) in self._entries.items())
+            self.runs.append(_write_run(items, self.directory, self.block_size))
+        self._entries = {}
+
+    def merged(self) -> Iterator[Tuple[Hashable, int, Tuple]]:
+        """Yield `(key, count, first)` for each key, sorted by key, adding
+        the counts of the runs and keeping the earliest position.
+        """
+
+        in_memory = sorted(
+            (key, count, first)
+            for key, (count, first) in self._entries.items())
+        self.runs = _merge_runs(self.runs, self.directory, self.block_size, _add_counts)
+        return _add_counts(heapq.merge(
+            *(_read_run(path) for path in self.runs), iter(in_memory)))
+
+
+def _add_counts(
+        stream: Iterator[Tuple[Hashable, int, Tuple]],
+        ) -> Iterator[Tuple[Hashable, int, Tuple]]:
+    """Add the counts of the consecutive entries with the same key, keeping
+    the earliest position."""
+
+    current = None
+    for key, count, first in stream:
+        if current is not None and current[0] == key:
+            current[1] += count
+            current[2] = min(current[2], first)
+        else:
+            if current is not None:
+                yield tuple(current)
+            current = [key, count, first]
+    if current is not None:
+        yield tuple(current)
+
+
+def top_keys(
+        entries: Iterator[Tuple[Hashable, int, Tuple]],
+        n: int = 10,
+        ) -> List[Tuple[Hashable, int]]:
+    """Select the `n` keys with the highest count from a stream of
+    `(key, count, first)`. Ties are resolved by the first position, as
+    `Counter.most_common` resolves them by order of insertion.
+    """
+
+    top = heapq.nsmallest(n, entries, key=lambda entry: (-entry[1], entry[2]))
+    return [(key, count) for key, count, _ in top]
+
+
+def counted_tweets(
+        file_path: str,
+        project: Callable[[dict], Tuple],
+        budget_bytes: int,
+        directory: str,
+        repeated_mains: bool = True,
+        ) -> Iterator[Tuple[int, Tuple]]:
+    """Yield the tweets that the in-memory engines would count.
+
+    The main tweets are always counted, repeated main tweets are counted
+    again only if `repeated_mains` is True. A quoted tweet is counted once,
+    and only if there is no main tweet with the same id.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the JSON file containing the tweets data.
+    project : Callable[[dict], Tuple]
+        Extract from a tweet the fields needed by the query.
+    budget_bytes : int
+        Estimated size of the records kept in memory before spilling.
+    directory : str
+        Folder where the runs are written.
+    repeated_mains : bool, optional
+        Count again the main tweets that appear more than once,
+        by default True
+
+    Yields
+    ------
+    Tuple[int, Tuple]
+        The position `seq` where the tweet was found and its projection.
+        They are yielded in order of id, not of position.
+    """
+
+    records = SpillBuffer(budget_bytes, directory)
+    seq = 0
+
+    # first the main tweets, then the quoted tweets, as the in-memory
+    # engines read them
+    with open(file_path, 'r') as f:
+        for line in progress.lines(f, 'spill:mains'):
+            tweet = json.loads(line)
+            payload = project(tweet)
+            records.add((tweet['id'], MAIN, seq, payload),
+                        RECORD_BYTES + PAYLOAD_ITEM_BYTES * len(payload))
+            seq += 1
+
+    with open(file_path, 'r') as f:
+        for line in progress.lines(f, 'spill:quoted'):
+            tweet = json.loads(line)
+            current = tweet.get('quotedTweet')
+            # each tweet quotes at most one tweet, the quotes form a chain
+            while current:
+                payload = project(current)
+                records.add((current['id'], QUOTED, seq, payload),
+                            RECORD_BYTES + PAYLOAD_ITEM_BYTES * len(payload))
+                seq += 1
+                current = current.get('quotedTweet')
+
+    # the records of each id are consecutive, main tweets first
+    current_id = None
+    counted = False
+    for tweet_id, kind, seq, payload in records.merged():
+        if tweet_id != current_id:
+            current_id = tweet_id
+            counted = False
+        if kind == MAIN and repeated_mains or not counted:
+            counted = True
+            yield seq, payload
+
+
+def budget_bytes(max_memory_mb: float, parts: int) -> int:
+    """Split a memory budget in MB in `parts` equal budgets in bytes."""
+
+    return max(1, int(max_memory_mb * 1024 * 1024) // parts)
@@ -0,0 +1,321 @@
+"""SQLite storage of the tweets, with q1, q2 and q3 as indexed SQL queries.
+
+The tweets are flattened (quoted tweets become rows like the main ones),
+deduplicated and bulk-loaded into a local SQLite database with the tables
+
+    users(id, username)
+    tweets(id, day, user_id, is_main, copies, seq)
+    mentions(tweet_id, pos, username)
+    emojis(tweet_id, pos, emoji)
+
+The questions are then answered with SQL, without reading the JSON file
+again. The results are the same as the ones of the `_memory` engines:
+
+* `copies` is the number of times a main tweet appears in the files. q1
+  and q3 count repeated main tweets again, q2 doesn't.
+* a quoted tweet is only stored if there is no main tweet with its id. If
+  a later file has it as a main tweet, the row is replaced.
+* `seq` is the order in which the engines would count the tweet: all the
+  main tweets in order of the lines, then all the quoted tweets. Ties are
+  resolved by this order, as `Counter.most_common` does.
+
+New files can be appended with more calls to `ingest`. The result is the
+same as the one of the concatenation of all the files ingested.
+
+Example
+-------
+>>> with SQLiteBackend("tweets.db") as db:
+...     db.ingest("farmers-protest-tweets-2021-2-4.json")
+...     db.q1()
+"""
+
+import json
+import sqlite3
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .emojis import extract_emojis
+
+# The quoted tweets are counted after all the main tweets, their `seq`
+# starts here. It leaves room for 2**40 main tweets
+QUOTED_SEQ_OFFSET = 2 ** 40
+# `seq` and the position of an emoji or a mention in the tweet are packed
+# in a single integer to find the first use of each one
+POSITION_BITS = 16
+# Number of rows inserted at a time. SQLite limits the number of
+# parameters of a query to 999 in old versions
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS tweets (
+    id INTEGER PRIMARY KEY,
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    is_main INTEGER NOT NULL,
+    copies INTEGER NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mentions (
+    tweet_id INTEGER NOT NULL REFERENCES tweets(id),
+    pos INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (tweet_id, pos)
+);
+CREATE TABLE IF NOT EXISTS emojis (
+    tweet_id INTEGER NOT NULL REFERENCES tweets(id),
+    pos INTEGER NOT NULL,
+    emoji TEXT NOT NULL,
+    PRIMARY KEY (tweet_id, pos)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tweets_day ON tweets(day, user_id);
+CREATE INDEX IF NOT EXISTS tweets_user ON tweets(user_id);
+CREATE INDEX IF NOT EXISTS mentions_username ON mentions(username);
+CREATE INDEX IF NOT EXISTS emojis_emoji ON emojis(emoji);
+"""
+
+Q1_SQL = """
+WITH top_days AS (
+    SELECT day, SUM(copies) AS n, MIN(seq) AS first
+    FROM tweets
+    GROUP BY day
+    ORDER BY n DESC, first
+    LIMIT ?
+),
+day_users AS (
+    SELECT t.day, t.user_id,
+           ROW_NUMBER() OVER (
+               PARTITION BY t.day
+               ORDER BY SUM(t.copies) DESC, MIN(t.seq)
+           ) AS rank
+    FROM tweets AS t
+    JOIN top_days AS d ON d.day = t.day
+    GROUP BY t.day, t.user_id
+)
+SELECT d.day, u.username
+FROM top_days AS d
+JOIN day_users AS du ON du.day = d.day AND du.rank = 1
+JOIN users AS u ON u.id = du.user_id
+ORDER BY d.n DESC, d.first
+"""
+
+Q2_SQL = f"""
+SELECT e.emoji, COUNT(*) AS n, MIN((t.seq << {POSITION_BITS}) + e.pos) AS first
+FROM emojis AS e
+JOIN tweets AS t ON t.id = e.tweet_id
+GROUP BY e.emoji
+ORDER BY n DESC, first
+LIMIT ?
+"""
+
+Q3_SQL = f"""
+SELECT m.username, SUM(t.copies) AS n,
+       MIN((t.seq << {POSITION_BITS}) + m.pos) AS first
+FROM mentions AS m
+JOIN tweets AS t ON t.id = m.tweet_id
+GROUP BY m.username
+ORDER BY n DESC, first
+LIMIT ?
+"""
+
+
+def _batches(items: Iterable, size: int = BATCH_SIZE) -> Iterator[List]:
+    """Split an iterable in lists of `size` items."""
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class SQLiteBackend:
+    """A SQLite database of tweets that answers q1, q2 and q3.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the database file, created if it doesn't exist.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        # write-ahead log: readers don't block the ingestion
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._user_ids = {}
+
+    def __enter__(self) -> 'SQLiteBackend':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+
+        self.conn.close()
+
+    def ingest(self, file_path: str) -> None:
+        """Append the tweets of a JSON file to the database.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the JSON file containing the tweets data.
+        """
+
+        with self.conn:
+            main_seq = self._get_meta('main_seq', 0)
+            quoted_seq = self._get_meta('quoted_seq', QUOTED_SEQ_OFFSET)
+
+            # first the main tweets, then the quoted tweets, as the
+            # `_memory` engines read them
+            with open(file_path, 'r') as f:
+                tweets = (json.loads(line) for line in f)
+                for batch in _batches(tweets):
+                    self._add_main(batch, main_seq)
+                    main_seq += len(batch)
+
+            with open(file_path, 'r') as f:
+                quoted = (current
+                          for line in f
+                          for current in self._quote_chain(json.loads(line)))
+                for batch in _batches(quoted):
+                    quoted_seq += self._add_quoted(batch, quoted_seq)
+
+            self._set_meta('main_seq', main_seq)
+            self._set_meta('quoted_seq', quoted_seq)
+
+    def q1(self, k: int = 10) -> List[Tuple[date, str]]:
+        """Top user of each of the top `k` dates with the most tweets."""
+
+        rows = self.conn.execute(Q1_SQL, (k,))
+        return [(date.fromisoformat(day), username) for day, username in rows]
+
+    def q2(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Top `k` emojis and their count."""
+
+        return [(e, n) for e, n, _ in self.conn.execute(Q2_SQL, (k,))]
+
+    def q3(self, k: int = 10) -> List[Tuple[str, int]]:
+        """Top `k` most mentioned users and their count of mentions."""
+
+        return [(u, n) for u, n, _ in self.conn.execute(Q3_SQL, (k,))]
+
+    @staticmethod
+    def _quote_chain(tweet: dict) -> Iterator[dict]:
+        # each tweet quotes at most one tweet, the quotes form a chain
+        current = tweet.get('quotedTweet')
+        while current:
+            yield current
+            current = current.get('quotedTweet')
+
+    def _add_main(self, batch: List[dict], seq: int) -> None:
+        existing = self._existing(tweet['id'] for tweet in batch)
+
+        new, repeated = [], []
+        for tweet in batch:
+            is_main = existing.get(tweet['id'])
+            if is_main:
+                # repeated main tweet, counted again by q1 and q3
+                repeated.append((tweet['id'],))
+            else:
+                if is_main is not None:
+                    # it was stored as a quoted tweet, the main tweet
+                    # replaces it
+                    self._delete((tweet['id'],))
+                new.append((tweet, seq))
+                existing[tweet['id']] = True
+            seq += 1
+
+        self._insert(new, is_main=True)
+        self.conn.executemany(
+            'UPDATE tweets SET copies = copies + 1 WHERE id = ?', repeated)
+
+    def _add_quoted(self, batch: List[dict], seq: int) -> int:
+        existing = self._existing(tweet['id'] for tweet in batch)
+
+        new = []
+        for tweet in batch:
+            # only the first copy of a tweet that is not a main tweet
+            if tweet['id'] not in existing:
+                new.append((tweet, seq + len(new)))
+                existing[tweet['id']] = False
+
+        self._insert(new, is_main=False)
+        return len(new)
+
+    def _insert(self, tweets: List[Tuple[dict, int]], is_main: bool) -> None:
+        user_ids = self._get_user_ids(tweet['user']['username']
+                                      for tweet, _ in tweets)
+
+        rows, mentions, emojis = [], [], []
+        for tweet, seq in tweets:
+            day = datetime.fromisoformat(tweet['date']).date().isoformat()
+            rows.append((tweet['id'], day, user_ids[tweet['user']['username']],
+                         int(is_main), 1, seq))
+            for pos, mention in enumerate(tweet.get('mentionedUsers') or ()):
+                mentions.append((tweet['id'], pos, mention['username']))
+            for pos, e in enumerate(extract_emojis(tweet['content'])):
+                emojis.append((tweet['id'], pos, e))
+
+        self.conn.executemany(
+            'INSERT INTO tweets (id, day, user_id, is_main, copies, seq) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.conn.executemany(
+            'INSERT INTO mentions (tweet_id, pos, username) VALUES (?, ?, ?)',
+            mentions)
+        self.conn.executemany(
+            'INSERT INTO emojis (tweet_id, pos, emoji) VALUES (?, ?, ?)',
+            emojis)
+
+    def _delete(self, ids: Tuple) -> None:
+        for table, column in (('mentions', 'tweet_id'), ('emojis', 'tweet_id'),
+                              ('tweets', 'id')):
+            self.conn.execute(f'DELETE FROM {table} WHERE {column} = ?', ids)
+
+    def _existing(self, ids: Iterable[int]) -> Dict[int, bool]:
+        """Return, for the ids already stored, whether they are main tweets."""
+
+        ids = list(set(ids))
+        placeholders = ', '.join('?' * len(ids))
+        rows = self.conn.execute(
+            f'SELECT id, is_main FROM tweets WHERE id IN ({placeholders})', ids)
+        return {tweet_id: bool(is_main) for tweet_id, is_main in rows}
+
+    def _get_user_ids(self, usernames: Iterable[str]) -> Dict[str, int]:
+        missing = {u for u in usernames if u not in self._user_ids}
+        if missing:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO users (username) VALUES (?)',
+                ((u,) for u in missing))
+            missing = list(missing)
+            for batch in _batches(missing):
+                placeholders = ', '.join('?' * len(batch))
+                self._user_ids.update(self.conn.execute(
+                    'SELECT username, id FROM users '
+                    f'WHERE username IN ({placeholders})', batch))
+        return self._user_ids
+
+    def _get_meta(self, key: str, default: int) -> int:
+        row = self.conn.execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, key: str, value: int) -> None:
+        self.conn.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            (key, value))
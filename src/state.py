@@ -0,0 +1,383 @@
+"""Mergeable aggregate state of q1, q2 and q3, to run on sharded files.
+
+When a dataset is split in several files (shards), possibly on several
+machines, each shard is aggregated into an `AggregateState`. The states
+are serialized, sent to a coordinator and merged. The merged state gives
+exactly the results of the `_memory` engines on the concatenation of the
+shards, in the same order.
+
+The deduplication of the quoted tweets is what makes this harder than
+adding counters: a tweet quoted in one shard can be a main tweet of
+another. So the state keeps the contributions of the main tweets, already
+counted, apart from the contributions of the quoted tweets, which stay
+pending until all the shards are merged:
+
+* the counters of dates, users and mentions of the main tweets,
+* the emojis of each main tweet, because q2 counts a repeated main tweet
+  only once, also when the copies are in different shards,
+* the ids of all the main tweets,
+* the date, user, emojis and mentions of the first copy of each quoted
+  tweet that is not a main tweet.
+
+Merging is associative, so the states can be merged in any grouping, as
+long as the order of the shards is kept.
+
+Build the state of a shard and run a coordinator from the command line:
+
+    python -m src.state build shard-1.json > shard-1.state
+    python -m src.state run shard-1.json shard-2.json
+    python -m src.state run shard-1.json shard-2.json \\
+        --command "ssh worker python -m src.state build {path}"
+"""
+
+import argparse
+import gzip
+import json
+import shlex
+import subprocess
+import sys
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .emojis import extract_emojis
+from .index import TweetIndex
+
+# Identifies the serialized states, and the version of their format
+FORMAT = 'latam-challenge/aggregate-state'
+VERSION = 1
+
+# Root of the repository, where `python -m src.state` is run
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class AggregateState:
+    """Aggregates of a shard of tweets, that can be merged with the
+    aggregates of the next shards.
+    """
+
+    def __init__(self) -> None:
+        # counters of the main tweets, repeated main tweets count again
+        self.date_counts = Counter()
+        self.user_counts = defaultdict(Counter)
+        self.mention_counts = Counter()
+        # emojis of the first copy of each main tweet, by id
+        self.main_emojis = OrderedDict()
+        self.main_ids = set()
+        # (date, username, emojis, mentions) of the first copy of each
+        # quoted tweet that is not a main tweet, by id
+        self.pending = OrderedDict()
+
+    @classmethod
+    def from_file(cls, file_path: str) -> 'AggregateState':
+        """Aggregate a shard.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the JSON file containing the tweets data.
+
+        Returns
+        -------
+        AggregateState
+            The state of the shard.
+        """
+
+        def lines():
+            with open(file_path, 'r') as f:
+                yield from f
+
+        return cls.from_lines(lines)
+
+    @classmethod
+    def from_chunk(cls, file_path: str, start: int, end: int) -> 'AggregateState':
+        """Aggregate the lines of a file between two offsets, aligned to
+        lines (see `chunks.split_file`), as if they were a shard."""
+
+        from .chunks import iter_chunk
+        return cls.from_lines(lambda: iter_chunk(file_path, start, end))
+
+    @classmethod
+    def from_lines(cls, lines: Callable[[], Iterable]) -> 'AggregateState':
+        """Aggregate a shard given as lines.
+
+        Parameters
+        ----------
+        lines : Callable[[], Iterable]
+            Returns a new iterator over the lines of the shard, as str or
+            bytes, it is called once for each of the two passes.
+
+        Returns
+        -------
+        AggregateState
+            The state of the shard.
+        """
+
+        state = cls()
+
+        for line in lines():
+            tweet = json.loads(line)
+            day = datetime.fromisoformat(tweet['date']).date()
+            state.date_counts[day] += 1
+            state.user_counts[day][tweet['user']['username']] += 1
+            for mention in tweet.get('mentionedUsers') or ():
+                state.mention_counts[mention['username']] += 1
+            if tweet['id'] not in state.main_ids:
+                state.main_ids.add(tweet['id'])
+                emojis = extract_emojis(tweet['content'])
+                if emojis:
+                    state.main_emojis[tweet['id']] = emojis
+
+        # now read the quoted tweets that are not main tweets
+        for line in lines():
+            tweet = json.loads(line)
+            current = tweet.get('quotedTweet')
+            # each tweet quotes at most one tweet, the quotes form a chain
+            while current:
+                tweet_id = current['id']
+                if (tweet_id not in state.main_ids
+                        and tweet_id not in state.pending):
+                    state.pending[tweet_id] = (
+                        datetime.fromisoformat(current['date']).date(),
+                        current['user']['username'],
+                        extract_emojis(current['content']),
+                        tuple(mention['username'] for mention
+                              in current.get('mentionedUsers') or ()),
+                    )
+                current = current.get('quotedTweet')
+
+        return state
+
+    def merge(self, other: 'AggregateState') -> 'AggregateState':
+        """Merge with the state of the next shard.
+
+        Parameters
+        ----------
+        other : AggregateState
+            The state of the shard that comes after this one.
+
+        Returns
+        -------
+        AggregateState
+            A new state, the same as the state of both shards together.
+        """
+
+        merged = AggregateState()
+
+        for state in (self, other):
+            merged.date_counts.update(state.date_counts)
+            for day, users in state.user_counts.items():
+                merged.user_counts[day].update(users)
+            merged.mention_counts.update(state.mention_counts)
+            for tweet_id, emojis in state.main_emojis.items():
+                merged.main_emojis.setdefault(tweet_id, emojis)
+            merged.main_ids |= state.main_ids
+
+        # a quoted tweet stops being pending if any shard has it as a main
+        # tweet, the first copy found is kept
+        for state in (self, other):
+            for tweet_id, contribution in state.pending.items():
+                if (tweet_id not in merged.main_ids
+                        and tweet_id not in merged.pending):
+                    merged.pending[tweet_id] = contribution
+
+        return merged
+
+    def finalize(self) -> TweetIndex:
+        """Count the pending quoted tweets and return the index with the
+        final counters, which answers q1, q2 and q3.
+        """
+
+        index = TweetIndex(Counter(), defaultdict(Counter), Counter(), Counter())
+
+        index.date_counts.update(self.date_counts)
+        for day, users in self.user_counts.items():
+            index.user_counts[day].update(users)
+        for emojis in self.main_emojis.values():
+            index.emoji_counts.update(emojis)
+        index.mention_counts.update(self.mention_counts)
+
+        for day, username, emojis, mentions in self.pending.values():
+            index.date_counts[day] += 1
+            index.user_counts[day][username] += 1
+            index.emoji_counts.update(emojis)
+            index.mention_counts.update(mentions)
+
+        return index
+
+    def dumps(self) -> bytes:
+        """Serialize the state as gzipped JSON. The order of all the
+        counters is kept, it is needed to resolve ties.
+        """
+
+        data = {
+            'format': FORMAT,
+            'version': VERSION,
+            'dates': [[d.isoformat(), n] for d, n in self.date_counts.items()],
+            'users': [[d.isoformat(), list(users.items())]
+                      for d, users in self.user_counts.items()],
+            'mentions': list(self.mention_counts.items()),
+            'main_emojis': list(self.main_emojis.items()),
+            'main_ids': list(self.main_ids),
+            'pending': [[tweet_id, d.isoformat(), username, emojis, mentions]
+                        for tweet_id, (d, username, emojis, mentions)
+                        in self.pending.items()],
+        }
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        return gzip.compress(text.encode('utf-8'))
+
+    @classmethod
+    def loads(cls, payload: bytes) -> 'AggregateState':
+        """Deserialize a state written by `dumps`.
+
+        Raises
+        ------
+        ValueError
+            If the payload is not a state or its version is not supported.
+        """
+
+        try:
+            data = json.loads(gzip.decompress(payload))
+        except (OSError, ValueError) as error:
+            raise ValueError(f'not a serialized state: {error}') from error
+        if not isinstance(data, dict) or data.get('format') != FORMAT:
+            raise ValueError('not a serialized state')
+        if data['version'] != VERSION:
+            raise ValueError(f"unsupported state version {data['version']}")
+
+        state = cls()
+        for d, n in data['dates']:
+            state.date_counts[date.fromisoformat(d)] = n
+        for d, users in data['users']:
+            state.user_counts[date.fromisoformat(d)] = Counter(dict(users))
+        state.mention_counts = Counter(dict(data['mentions']))
+        state.main_emojis = OrderedDict(
+            (tweet_id, tuple(emojis)) for tweet_id, emojis in data['main_emojis'])
+        state.main_ids = set(data['main_ids'])
+        for tweet_id, d, username, emojis, mentions in data['pending']:
+            state.pending[tweet_id] = (
+                date.fromisoformat(d), username, tuple(emojis), tuple(mentions))
+        return state
+
+
+def merge_states(states: Iterable[AggregateState]) -> AggregateState:
+    """Merge the states of the shards, in order."""
+
+    merged = AggregateState()
+    for state in states:
+        merged = merged.merge(state)
+    return merged
+
+
+def build_shard(
+        file_path: str,
+        command: Optional[str] = None,
+        ) -> AggregateState:
+    """Build the state of a shard in another process and read it back.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the shard, as seen by the process that builds the state.
+    command : Optional[str], optional
+        Command that writes the serialized state to its standard output,
+        with `{path}` replaced by `file_path`, for instance to run it on a
+        remote machine with ssh. If None, run `python -m src.state build`
+        locally, by default None
+
+    Returns
+    -------
+    AggregateState
+        The state of the shard.
+
+    Raises
+    ------
+    RuntimeError
+        If the command fails.
+    """
+
+    if command is None:
+        args = [sys.executable, '-m', 'src.state', 'build', file_path]
+    else:
+        args = shlex.split(command.format(path=shlex.quote(file_path)))
+
+    process = subprocess.run(args, cwd=ROOT, capture_output=True)
+    if process.returncode != 0:
+        raise RuntimeError(
+            f'building the state of {file_path} failed: '
+            f'{process.stderr.decode(errors="replace").strip()}')
+    return AggregateState.loads(process.stdout)
+
+
+def run_shards(
+        file_paths: List[str],
+        command: Optional[str] = None,
+        max_parallel: Optional[int] = None,
+        ) -> TweetIndex:
+    """Build the states of all the shards in parallel and merge them.
+
+    Parameters
+    ----------
+    file_paths : List[str]
+        Paths to the shards, in the order of the full dataset.
+    command : Optional[str], optional
+        Command that builds the state of a shard, see `build_shard`,
+        by default None
+    max_parallel : Optional[int], optional
+        Maximum number of shards built at the same time. If None, all of
+        them, by default None
+
+    Returns
+    -------
+    TweetIndex
+        The index of the full dataset, which answers q1, q2 and q3.
+    """
+
+    with ThreadPoolExecutor(max_workers=max_parallel or len(file_paths) or 1) as pool:
+        # map keeps the order of the shards
+        states = pool.map(lambda path: build_shard(path, command), file_paths)
+        return merge_states(states).finalize()
+
+
+def _results(index: TweetIndex) -> Dict[str, List[Tuple]]:
+    return {
+        'q1': [(d.isoformat(), username) for d, username in index.q1()],
+        'q2': index.q2(),
+        'q3': index.q3(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    build = subparsers.add_parser(
+        'build', help='write the state of a shard to the standard output')
+    build.add_argument('file_path')
+
+    merge = subparsers.add_parser(
+        'merge', help='merge serialized states and print the results')
+    merge.add_argument('state_paths', nargs='+')
+
+    run = subparsers.add_parser(
+        'run', help='build the states of the shards, merge them and print '
+                    'the results')
+    run.add_argument('file_paths', nargs='+')
+    run.add_argument('--command', help='command that builds the state of a '
+                                       'shard, {path} is replaced by its path')
+    run.add_argument('--max-parallel', type=int)
+
+    args = parser.parse_args()
+
+    if args.action == 'build':
+        sys.stdout.buffer.write(AggregateState.from_file(args.file_path).dumps())
+    elif args.action == 'merge':
+        states = (AggregateState.loads(Path(path).read_bytes())
+                  for path in args.state_paths)
+        print(json.dumps(_results(merge_states(states).finalize()),
+                         ensure_ascii=False))
+    else:
+        index = run_shards(args.file_paths, args.command, args.max_parallel)
+        print(json.dumps(_results(index), ensure_ascii=False))
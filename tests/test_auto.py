@@ -0,0 +1,173 @@
+import unittest
+import os
+import tempfile
+import json
+import gzip
+from unittest import mock
+
+from src import auto, progress, queries
+from src.auto import Profile, calibrate, input_size_mb, measure, plan, save_profiles
+from src.differential import generate, write_tweets
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestAuto(unittest.TestCase):
+    """Test suite for the choice of the engines.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.test_data = [
+            {'date': f'2025-01-0{i % 3 + 1}T00:00:00', 'id': i,
+             'user': {'username': f'user_{i % 4}'}, 'content': '😀 text',
+             'mentionedUsers': [{'username': f'user_{i % 5}'}],
+             'quotedTweet': None}
+            for i in range(200)]
+        self.test_file_path = self.create_test_file(self.test_data)
+        # 1 MB of memory for each MB of input for the `_time` engines,
+        # 0.1 MB for the `_memory` engines and 0.2 MB for their chunks
+        self.profiles = {
+            f'{q}_{engine}': Profile(ratio, 0.01)
+            for q in ('q1', 'q2', 'q3')
+            for engine, ratio in (('time', 1.0), ('memory', 0.1), ('chunks', 0.2))}
+        self.input_mb = os.path.getsize(self.test_file_path) / 2**20
+
+    def create_test_file(self, test_data):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'test.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def plan(self, query, available_mb, allow_time=True, cpus=4):
+        """Helper method to plan with the test profiles and 4 CPUs."""
+        return plan(query, self.test_file_path, available_mb=available_mb,
+                    cpus=cpus, memory_fraction=1.0, profiles=self.profiles,
+                    allow_time=allow_time)
+
+    def test_choice(self):
+        """Test that the fastest engine that fits in memory is chosen."""
+        plenty = self.plan('q2', available_mb=10 * self.input_mb)
+        self.assertEqual((plenty.engine, plenty.kwargs), ('q2_time', {'workers': 4}))
+        self.assertEqual(self.plan('q1', 10 * self.input_mb).kwargs, {})
+        # by default only the `_memory` engines, which give the same results
+        exact = self.plan('q2', 10 * self.input_mb, allow_time=False)
+        self.assertEqual((exact.engine, exact.kwargs),
+                         ('q2_memory', {'mode': 'process', 'workers': 4}))
+        # the states of the chunks, their copies and the merged state
+        self.assertAlmostEqual(exact.predicted_peak_mb - progress.current_rss_mb(),
+                               3 * 0.2 * self.input_mb, delta=1.0)
+        self.assertAlmostEqual(exact.predicted_seconds, 0.01 * self.input_mb / 4)
+        single = self.plan('q2', 10 * self.input_mb, allow_time=False, cpus=1)
+        self.assertEqual((single.engine, single.kwargs), ('q2_memory', {}))
+
+        scarce = self.plan('q3', available_mb=0.5 * self.input_mb)
+        self.assertEqual((scarce.engine, scarce.kwargs), ('q3_memory', {}))
+
+        # the counters are spilled with the memory that is left
+        tiny = self.plan('q1', available_mb=0.01 * self.input_mb)
+        self.assertEqual(tiny.engine, 'q1_memory')
+        self.assertAlmostEqual(tiny.kwargs['max_memory_mb'], 0.01 * self.input_mb)
+        self.assertAlmostEqual(tiny.predicted_seconds, 0.01 * self.input_mb)
+
+        with self.assertRaises(ValueError):
+            self.plan('q4', 1.0)
+
+    def test_results_and_log(self):
+        """Test that the auto functions give the results of the engines and
+        log their choice."""
+        with self.assertLogs('src.auto', level='INFO') as logs:
+            self.assertEqual(queries.q1_auto(self.test_file_path),
+                             q1_memory(self.test_file_path))
+            self.assertEqual(auto.q2_auto(self.test_file_path, available_mb=0.0),
+                             q2_memory(self.test_file_path))
+            self.assertEqual(auto.q3_auto(self.test_file_path),
+                             q3_memory(self.test_file_path))
+            self.assertEqual(auto.q1_auto(self.test_file_path, cpus=2, available_mb=1e6),
+                             q1_memory(self.test_file_path))
+        self.assertEqual(len(logs.output), 4)
+        self.assertIn('q1: q1_memory with mode=process, workers=2', logs.output[3])
+        self.assertIn('q2: q2_memory with max_memory_mb=0', logs.output[1])
+        self.assertIn('predicted peak', logs.output[0])
+
+    def test_same_results(self):
+        """Test that by default the results don't depend on the memory, and
+        that the `_time` engines count the repeated main tweets once."""
+        repeated = dict(self.test_data[9], id=1000)
+        self.create_test_file(self.test_data + [repeated] * 100)
+
+        for query, func in (('q1', q1_memory), ('q3', q3_memory)):
+            with self.subTest(query=query):
+                expected = func(self.test_file_path)
+                for available_mb in (None, 0.0, 1e6):
+                    self.assertEqual(auto.run(query, self.test_file_path,
+                                              available_mb=available_mb), expected)
+                time_result = auto.run(query, self.test_file_path, available_mb=1e6,
+                                       allow_time=True)
+                self.assertEqual(time_result, getattr(queries, f'{query}_time')(
+                    self.test_file_path))
+                self.assertNotEqual(time_result, expected)
+
+    def test_calibrate(self):
+        """Test the profiles saved and read back."""
+        path = os.path.join(self.test_dir.name, 'auto_profiles.txt')
+        save_profiles({'q1_time': Profile(2.0, 0.015)}, path)
+        profiles = calibrate(path)
+
+        self.assertEqual(profiles['q1_time'], Profile(2.0, 0.015))
+        self.assertEqual(profiles['q2_time'], auto.DEFAULT_PROFILES['q2_time'])
+        self.assertEqual(calibrate(os.path.join(self.test_dir.name, 'missing.txt')),
+                         auto.DEFAULT_PROFILES)
+
+        save_profiles({'q1_time': Profile(3.0, 0.015)}, path, source='test file')
+        with open(path, 'r') as f:
+            self.assertEqual(f.readline(), '# test file\n')
+        self.assertEqual(calibrate(path)['q1_time'], Profile(3.0, 0.015))
+
+    def test_committed_profiles(self):
+        """Test that the default profiles are the committed measurements."""
+        self.assertEqual(calibrate(auto.PROFILES_FILE), auto.DEFAULT_PROFILES)
+
+    def test_measure(self):
+        """Test that an engine run in a fresh interpreter grows the memory."""
+        write_tweets(generate(0, 2000), self.test_file_path)
+        for engine in ('q3_memory', 'q3_chunks'):
+            with self.subTest(engine=engine):
+                profile = measure(engine, self.test_file_path)
+                self.assertGreater(profile.mb_per_input_mb, 0.0)
+                self.assertGreater(profile.seconds_per_input_mb, 0.0)
+
+    def test_spill_large_input(self):
+        """Test that a large input with little memory is spilled, with the
+        default profiles."""
+        with mock.patch.object(auto, 'input_size_mb', return_value=100_000.0):
+            for query in ('q1', 'q2', 'q3'):
+                with self.subTest(query=query):
+                    chosen = plan(query, self.test_file_path, available_mb=4000.0,
+                                  cpus=4, profiles=auto.DEFAULT_PROFILES)
+                    self.assertEqual(chosen.engine, f'{query}_memory')
+                    self.assertEqual(chosen.kwargs, {'max_memory_mb': 2000.0})
+
+    def test_gzip_rejected(self):
+        """Test that a gzip file is rejected before running an engine."""
+        gz_path = self.test_file_path + '.gz'
+        with open(self.test_file_path, 'rb') as f, gzip.open(gz_path, 'wb') as g:
+            g.write(f.read())
+        for func in (auto.q1_auto, auto.q2_auto, auto.q3_auto):
+            with self.assertRaises(ValueError):
+                func(gz_path)
+        self.assertAlmostEqual(input_size_mb(self.test_file_path), self.input_mb)
+
+if __name__ == '__main__':
+    unittest.main()
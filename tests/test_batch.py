@@ -0,0 +1,169 @@
+import unittest
+import os
+import tempfile
+import json
+from datetime import date
+from unittest import mock
+
+import numpy as np
+
+from src.batch import StringColumn, TweetBatch, count_file, counted_tweets, read_batches
+from src.differential import generate, write_tweets
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestBatch(unittest.TestCase):
+    """Test suite for the columnar batches of tweets.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        chain = None
+        for i in (300, 200, 100):
+            chain = {'date': '2021-02-01T10:00:00+00:00', 'id': i,
+                     'user': {'username': f'quoted_{i}'}, 'content': f'á {i}',
+                     'mentionedUsers': None, 'quotedTweet': chain}
+        self.test_data = [
+            {'date': f'2021-02-0{i % 3 + 1}T10:00:00+00:00', 'id': i,
+             'user': {'username': f'user_{i % 4}'},
+             'content': '\U0001f600 text' if i % 2 else '',
+             'mentionedUsers': [{'username': f'user_{j}'} for j in range(i % 3)],
+             'quotedTweet': chain if i % 5 == 0 else None}
+            for i in range(1, 21)]
+        self.test_file_path = self.create_test_file(self.test_data)
+
+    def create_test_file(self, test_data):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'test.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_views(self):
+        """Test that the views give back the fields of each tweet, across
+        batches."""
+        batches = list(read_batches(self.test_file_path, batch_size=6))
+        self.assertEqual([len(b) for b in batches], [6, 6, 6, 2])
+        batch = TweetBatch.concat(batches)
+
+        self.assertEqual(len(batch), len(self.test_data))
+        for view, tweet in zip(batch, self.test_data):
+            self.assertEqual(view.id, tweet['id'])
+            self.assertEqual(view.date, date(2021, 2, int(tweet['date'][9])))
+            self.assertEqual(view.username, tweet['user']['username'])
+            self.assertEqual(view.content, tweet['content'])
+            self.assertEqual(view.mentions,
+                             [m['username'] for m in tweet['mentionedUsers']])
+            chain = [q.id for q in view.quoted]
+            self.assertEqual(chain, [100, 200, 300] if tweet['quotedTweet'] else [])
+        self.assertEqual(batch[-1].id, 20)
+        self.assertEqual(batch[4].quoted[0].content, 'á 100')
+        with self.assertRaises(IndexError):
+            batch[len(self.test_data)]
+
+    def test_take(self):
+        """Test the selection of rows with their ragged fields."""
+        batch = TweetBatch.concat(list(read_batches(self.test_file_path)))
+        taken = batch.take(np.array([9, 2, 9]))
+
+        self.assertEqual([v.id for v in taken], [10, 3, 10])
+        self.assertEqual(taken[0].mentions, ['user_0'])
+        self.assertEqual([q.id for q in taken[2].quoted], [100, 200, 300])
+        self.assertEqual(taken.take(np.array([1]), quotes=False)[0].quoted, [])
+
+    def test_encode(self):
+        """Test the dictionary encoding of strings."""
+        column = StringColumn.from_strings(['b', 'á', '', 'b', 'ab'])
+        strings, codes = column.encode()
+
+        self.assertEqual([strings[c] for c in codes], ['b', 'á', '', 'b', 'ab'])
+        self.assertEqual(len(strings), 4)
+        self.assertEqual(StringColumn.from_strings([]).encode()[0], [])
+
+    def test_encode_blocks_and_collisions(self):
+        """Test that the encoding is exact across blocks, with long
+        strings, trailing NULs and hash collisions."""
+        values = ['a' * 50, 'b', 'a\x00', 'a', '', 'b', 'a' * 50, 'a\x00', 'á' * 9]
+        column = StringColumn.from_strings(values)
+        expected = sorted(set(values), key=lambda v: v.encode('utf-8'))
+
+        with mock.patch('src.batch.ENCODE_BLOCK', 4):
+            strings, codes = column.encode()
+        self.assertEqual(strings, expected)
+        self.assertEqual([strings[c] for c in codes], values)
+
+        # every string has the same hash
+        with mock.patch.object(StringColumn, '_hashes',
+                               lambda self, r0, r1, powers: np.zeros(r1 - r0, np.uint64)):
+            strings, codes = column.encode()
+        self.assertEqual(strings, expected)
+        self.assertEqual([strings[c] for c in codes], values)
+
+    def test_non_ascii(self):
+        """Test the mask of the strings with characters that are not
+        ASCII."""
+        column = StringColumn.from_strings(['a', '', '\u00e9', 'b\U0001f600c', 'ab'])
+        self.assertEqual(column.non_ascii().tolist(), [False, False, True, True, False])
+        self.assertEqual(StringColumn.from_strings([]).non_ascii().tolist(), [])
+
+    def test_dedup(self):
+        """Test that the quoted tweets are counted once, after the main
+        tweets."""
+        tweets, first_copy = counted_tweets(read_batches(self.test_file_path))
+
+        self.assertEqual(tweets.ids.tolist(), list(range(1, 21)) + [100, 200, 300])
+        self.assertTrue(first_copy.all())
+
+    def test_dedup_streaming(self):
+        """Test that the batches are deduplicated as they are read, the
+        quote chains of the batches are never concatenated."""
+        concat = TweetBatch.concat.__func__
+        joined = []
+
+        def spy(cls, batches):
+            joined.extend(batches)
+            return concat(cls, batches)
+
+        with mock.patch.object(TweetBatch, 'concat', classmethod(spy)):
+            tweets, first_copy = counted_tweets(
+                read_batches(self.test_file_path, batch_size=3))
+
+        self.assertEqual(tweets.ids.tolist(), list(range(1, 21)) + [100, 200, 300])
+        self.assertTrue(first_copy.all())
+        self.assertTrue(all(b.quoted is None for b in joined))
+        # the quoted tweets are kept once, not once for each chain
+        quoted = [b for b in joined if len(b) and b.ids.min() >= 100]
+        self.assertTrue(quoted)
+        self.assertTrue(all(len(b) <= 3 for b in quoted))
+
+    def test_results(self):
+        """Test that the counters give the results of the `_memory`
+        engines, with repeated main tweets."""
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                write_tweets(generate(seed, 200, duplicate_mains=True),
+                             self.test_file_path)
+                counts = count_file(self.test_file_path, batch_size=16)
+                self.assertEqual(counts.q1(), q1_memory(self.test_file_path))
+                self.assertEqual(counts.q2(), q2_memory(self.test_file_path))
+                self.assertEqual(counts.q3(), q3_memory(self.test_file_path))
+
+    def test_empty_file(self):
+        """Test the pipeline on an empty file."""
+        counts = count_file(self.create_test_file([]))
+        self.assertEqual((counts.q1(), counts.q2(), counts.q3()), ([], [], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
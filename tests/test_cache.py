@@ -0,0 +1,147 @@
+import unittest
+import os
+import tempfile
+import json
+from unittest import mock
+
+from src import cache as cache_module
+from src.cache import cached, ResultCache
+from src.q3_memory import q3_memory
+
+
+class TestCache(unittest.TestCase):
+    """Test suite for the results cache of the q-functions.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_data = []
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.calls = 0
+
+    def create_test_file(self, test_data):
+        """Helper method to create a temporary JSON file for each test."""
+        with tempfile.NamedTemporaryFile(delete=False, mode='w',
+                                         newline='',
+                                         encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+            self.test_data.append(f.name)
+            return f.name  # Return the file path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        for file in self.test_data:
+            os.remove(file)
+        self.cache_dir.cleanup()
+
+    def counted_q3(self, file_path):
+        """q3_memory that counts how many times it is called."""
+        self.calls += 1
+        return q3_memory(file_path)
+
+    def test_warm_call_does_not_scan(self):
+        """Test that a second call is answered from the cache."""
+        test_data = [
+            {"mentionedUsers": [{"username": "user1"}], "id": 1,
+             "quotedTweet": None},
+        ]
+        file_path = self.create_test_file(test_data)
+        q3_cached = cached(
+            self.counted_q3, cache=ResultCache(cache_dir=self.cache_dir.name))
+
+        self.assertEqual(q3_cached(file_path), [('user1', 1)])
+        self.assertEqual(q3_cached(file_path), [('user1', 1)])
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidate_when_file_changes(self):
+        """Test that a changed file is scanned again."""
+        test_data = [
+            {"mentionedUsers": [{"username": "user1"}], "id": 1,
+             "quotedTweet": None},
+        ]
+        file_path = self.create_test_file(test_data)
+        q3_cached = cached(
+            self.counted_q3, cache=ResultCache(cache_dir=self.cache_dir.name))
+
+        self.assertEqual(q3_cached(file_path), [('user1', 1)])
+
+        # append a new tweet to the file
+        with open(file_path, 'a') as f:
+            f.write(json.dumps({"mentionedUsers": [{"username": "user2"}],
+                                "id": 2, "quotedTweet": None}) + '\n')
+
+        self.assertEqual(q3_cached(file_path), [('user1', 1), ('user2', 1)])
+        self.assertEqual(self.calls, 2)
+
+    def test_persisted_on_disk(self):
+        """Test that the results survive a new in-memory cache."""
+        test_data = [
+            {"mentionedUsers": [{"username": "user1"}], "id": 1,
+             "quotedTweet": None},
+        ]
+        file_path = self.create_test_file(test_data)
+
+        q3_cached = cached(
+            self.counted_q3, cache=ResultCache(cache_dir=self.cache_dir.name))
+        q3_cached(file_path)
+
+        # a new cache, as in a new process, reading the same folder
+        q3_cached = cached(
+            self.counted_q3, cache=ResultCache(cache_dir=self.cache_dir.name))
+        self.assertEqual(q3_cached(file_path), [('user1', 1)])
+        self.assertEqual(self.calls, 1)
+
+    def test_bounded_size(self):
+        """Test that the LRU and the disk store are bounded."""
+        cache = ResultCache(maxsize=2, cache_dir=self.cache_dir.name,
+                            max_disk_bytes=0)
+        for i in range(5):
+            cache.put(('key', i), [i])
+
+        self.assertEqual(list(cache._memory), [('key', 3), ('key', 4)])
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_invalidate_when_code_changes(self):
+        """Test that the entries of an older version of the code are not
+        returned."""
+        test_data = [
+            {"mentionedUsers": [{"username": "user1"}], "id": 1,
+             "quotedTweet": None},
+        ]
+        file_path = self.create_test_file(test_data)
+        q3_cached = cached(
+            self.counted_q3, cache=ResultCache(cache_dir=self.cache_dir.name))
+        q3_cached(file_path)
+
+        with mock.patch.object(cache_module, 'CACHE_VERSION',
+                               cache_module.CACHE_VERSION + 1):
+            q3_cached = cached(
+                self.counted_q3, cache=ResultCache(cache_dir=self.cache_dir.name))
+            self.assertEqual(q3_cached(file_path), [('user1', 1)])
+        self.assertEqual(self.calls, 2)
+
+    def test_disk_errors_are_not_fatal(self):
+        """Test that a result that can't be written to disk is still
+        returned, and kept in memory."""
+        test_data = [
+            {"mentionedUsers": [{"username": "user1"}], "id": 1,
+             "quotedTweet": None},
+        ]
+        file_path = self.create_test_file(test_data)
+        q3_cached = cached(
+            self.counted_q3, cache=ResultCache(cache_dir=self.cache_dir.name))
+
+        with mock.patch('os.replace', side_effect=OSError('disk full')):
+            self.assertEqual(q3_cached(file_path), [('user1', 1)])
+            self.assertEqual(q3_cached(file_path), [('user1', 1)])
+        self.assertEqual(self.calls, 1)
+        # the temporary file is removed
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
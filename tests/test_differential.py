@@ -0,0 +1,142 @@
+import unittest
+import os
+import tempfile
+import json
+from collections import Counter, defaultdict
+from unittest import mock
+
+from src import differential
+from src.differential import (
+    Engine, agree, check_preview, ddmin, generate, minimize, preview_coverage, run,
+    write_tweets)
+from src.index import TweetIndex
+from src.preview import Estimate
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+
+
+def _without_quotes(path):
+    """A broken engine: q3 ignores the mentions of the quoted tweets."""
+    mentions = Counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            tweet = json.loads(line)
+            mentions.update(m['username'] for m in tweet['mentionedUsers'] or ())
+    return {'q1': q1_memory(path), 'q2': q2_memory(path),
+            'q3': mentions.most_common(10)}
+
+
+class TestDifferential(unittest.TestCase):
+    """Test suite for the differential harness.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_engines_agree(self):
+        """Test that all the engines agree on random files."""
+        divergences = run(range(3), 120, directory=self.test_dir.name)
+        self.assertEqual(divergences, [])
+
+    def test_generated_edge_cases(self):
+        """Test that the random tweets have quote chains, quoted tweets
+        that are also main tweets and empty fields."""
+        tweets = generate(0, 300)
+        main_ids = {t['id'] for t in tweets}
+        self.assertEqual(len(main_ids), len(tweets))
+        self.assertGreater(max(t['depth'] for t in tweets), 2)
+        quoted = [t['quotedTweet'] for t in tweets if t['quotedTweet']]
+        self.assertTrue(any(q['id'] in main_ids for q in quoted))
+        self.assertTrue(any(t['mentionedUsers'] is None for t in tweets))
+        self.assertTrue(any(t['mentionedUsers'] == [] for t in tweets))
+        self.assertTrue(any(t['content'] == '' for t in tweets))
+
+    def test_ddmin(self):
+        """Test that ddmin keeps only the items needed to fail."""
+        self.assertEqual(ddmin(list(range(20)), lambda s: 3 in s and 7 in s), [3, 7])
+        self.assertEqual(ddmin([1], lambda s: True), [1])
+
+    def test_agree_ties(self):
+        """Test that only the strict engines must keep the order of ties."""
+        index = TweetIndex(Counter(), defaultdict(Counter), Counter(),
+                           Counter({'a': 2, 'b': 2, 'c': 1}))
+        expected = [('a', 2), ('b', 2)]
+
+        self.assertTrue(agree('q3', expected, [('b', 2), ('a', 2)], index, False))
+        self.assertFalse(agree('q3', expected, [('b', 2), ('a', 2)], index, True))
+        self.assertFalse(agree('q3', expected, [('b', 2), ('c', 2)], index, False))
+        self.assertFalse(agree('q3', expected, [('a', 2)], index, False))
+
+    def test_divergence_is_minimized(self):
+        """Test that a broken engine is detected and its input reduced to
+        a single line."""
+        engines = dict(differential.ENGINES, broken=Engine(_without_quotes, True))
+        with mock.patch.object(differential, 'ENGINES', engines):
+            divergences = run(range(2), 100, engines=['broken'],
+                              directory=self.test_dir.name)
+            self.assertTrue(divergences)
+            self.assertEqual({d.query for d in divergences}, {'q3'})
+
+            output_path = os.path.join(self.test_dir.name, 'min.json')
+            lines = minimize(divergences[0], output_path)
+
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(os.path.exists(output_path))
+        # the only line has a quoted tweet with mentions
+        quoted = lines[0]['quotedTweet']
+        while quoted and not quoted['mentionedUsers']:
+            quoted = quoted['quotedTweet']
+        self.assertIsNotNone(quoted)
+
+    def test_temporary_directory(self):
+        """Test that the files are removed when no folder is given."""
+        with mock.patch.object(tempfile, 'tempdir', self.test_dir.name):
+            run(range(1), 50, engines=['index'])
+        self.assertEqual(os.listdir(self.test_dir.name), [])
+
+    def test_preview_coverage(self):
+        """Test that the intervals of the preview contain the true counts
+        at about the confidence level, also on a file with a single date."""
+        tweets = generate(2, 200, quotes=False)
+        self.assertEqual(len({t['date'][:10] for t in tweets}), 1)
+        self.assertFalse(any(t['quotedTweet'] for t in tweets))
+        file_path = os.path.join(self.test_dir.name, 'no-quotes.json')
+        write_tweets(tweets, file_path)
+
+        coverage = preview_coverage(file_path)
+        self.assertEqual(set(coverage), {'dates', 'q2', 'q3'})
+        for name, value in coverage.items():
+            self.assertGreaterEqual(value, differential.MIN_COVERAGE, name)
+        self.assertEqual(check_preview(file_path), [])
+
+    def test_narrow_intervals_diverge(self):
+        """Test that intervals of width zero around estimates are
+        reported."""
+        file_path = os.path.join(self.test_dir.name, 'no-quotes.json')
+        write_tweets(generate(0, 100, quotes=False), file_path)
+        index = TweetIndex.from_file(file_path)
+
+        def narrow(*args, **kwargs):
+            def estimates(counts):
+                return [Estimate(key, n + 1, n + 1, n + 1)
+                        for key, n in counts.most_common(10)]
+            yield mock.Mock(dates=estimates(index.date_counts),
+                            q2=estimates(index.emoji_counts),
+                            q3=estimates(index.mention_counts))
+
+        with mock.patch('src.preview.preview', narrow):
+            divergences = check_preview(file_path, runs=3)
+        self.assertEqual({d.query for d in divergences}, {'dates', 'q2', 'q3'})
+        self.assertTrue(all(d.engine == 'preview_coverage' for d in divergences))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import os
+import random
+import tempfile
+from unittest import mock
+
+import emoji
+from emoji.unicode_codes import EMOJI_DATA
+
+from src import emoji_table
+from src.emoji_table import EmojiTable, find_emojis, load_table, table_path
+
+
+class TestEmojiTable(unittest.TestCase):
+    """Test suite for the precompiled emoji table.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.cache_dir.cleanup()
+
+    def test_same_emojis_as_emoji_list(self):
+        """Test with random texts mixing emojis, skin tones, zero width
+        joiners, variation selectors, keycaps and flags."""
+        table = EmojiTable.build()
+        emojis = list(EMOJI_DATA)
+        pieces = ['\u200d', '\ufe0f', '\ufe0e', '\U0001f3fd', 'a', ' ', '#',
+                  '1', '\u20e3', '\U0001f1ee', '\U0001f1f3', '\U0001f468',
+                  '\U0001f469', '\u2764', '\u2640']
+        random.seed(0)
+        for _ in range(5000):
+            text = ''.join(
+                random.choice(emojis) if random.random() < 0.4
+                else random.choice(pieces)
+                for _ in range(random.randint(1, 8)))
+            expected = [e['emoji'] for e in emoji.emoji_list(text)]
+            self.assertEqual(table.find(text), expected, repr(text))
+
+    def test_cached_on_disk(self):
+        """Test that the table is written once and then loaded."""
+        table = load_table(self.cache_dir.name)
+        path = table_path(emoji.__version__, self.cache_dir.name)
+        self.assertTrue(os.path.exists(path))
+
+        loaded = load_table(self.cache_dir.name)
+        self.assertEqual(loaded.tree, table.tree)
+        self.assertEqual(loaded.find('aa😀 👨‍👩‍👧'), ['😀', '👨‍👩‍👧'])
+
+    def test_corrupted_cache_is_rebuilt(self):
+        """Test with a corrupted file in the cache."""
+        path = table_path(emoji.__version__, self.cache_dir.name)
+        with open(path, 'wb') as f:
+            f.write(b'not a table')
+
+        table = load_table(self.cache_dir.name)
+        self.assertEqual(table.find('😀'), ['😀'])
+
+    def test_cache_folder(self):
+        """Test that the tables are cached in the user cache by default, in
+        the folder of the environment variable if it is set, and not cached
+        if it is empty."""
+        with mock.patch.dict(os.environ):
+            os.environ.pop('LATAM_EMOJI_TABLE_DIR', None)
+            self.assertEqual(emoji_table.table_cache_dir(), emoji_table.DEFAULT_TABLE_DIR)
+            os.environ['LATAM_EMOJI_TABLE_DIR'] = self.cache_dir.name
+            self.assertEqual(emoji_table.table_cache_dir(), self.cache_dir.name)
+            os.environ['LATAM_EMOJI_TABLE_DIR'] = ''
+            self.assertIsNone(emoji_table.table_cache_dir())
+
+    def test_not_cached_without_folder(self):
+        """Test that without a cache folder nothing is written."""
+        with mock.patch.object(emoji_table.os, 'replace') as replace:
+            table = load_table(None)
+        replace.assert_not_called()
+        self.assertEqual(table.find('a😀'), ['😀'])
+
+    def test_other_version_uses_emoji_list(self):
+        """Test that the texts are searched with `emoji.emoji_list` when
+        the version of `emoji` is not one of the tokenizer."""
+        table = EmojiTable.build()
+        table.version = '2.0.0'
+        with mock.patch.object(emoji_table, '_find', None), \
+                mock.patch.object(emoji_table, 'process_table', return_value=table), \
+                mock.patch.object(emoji, 'emoji_list', wraps=emoji.emoji_list) as emoji_list:
+            self.assertEqual(find_emojis('a😀 👨‍👩‍👧'), ['😀', '👨‍👩‍👧'])
+        emoji_list.assert_called_once_with('a😀 👨‍👩‍👧')
+
+
+if __name__ == "__main__":
+    unittest.main()
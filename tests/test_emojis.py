@@ -0,0 +1,107 @@
+import unittest
+import threading
+
+from src import metrics
+from src.emojis import count_emojis, count_batch, EmojiMemo
+
+
+class TestCountEmojis(unittest.TestCase):
+    """Test suite for the parallel emoji counting.
+    """
+
+    def test_parallel_equals_serial(self):
+        """Test that the process pool gives the same counts, in the same
+        order, as counting serially."""
+        texts = ['aa😀 a', '😋😋 🛫', 'no emoji', '❤️ 😀', '🛫'] * 1000
+
+        result_serial = count_batch(texts)
+        result_parallel = count_emojis(texts, workers=2, min_parallel=0)
+
+        self.assertEqual(list(result_parallel.items()),
+                         list(result_serial.items()))
+        self.assertEqual(result_parallel.most_common(2),
+                         [('😀', 2000), ('😋', 2000)])
+
+    def test_small_input_is_serial(self):
+        """Test with fewer texts than the parallel threshold."""
+        result = count_emojis(['😀😀', '😋'], workers=4)
+
+        self.assertEqual(result.most_common(), [('😀', 2), ('😋', 1)])
+
+    def test_empty(self):
+        """Test with no texts."""
+        result = count_emojis([], workers=2, min_parallel=0)
+
+        self.assertEqual(result.most_common(), [])
+
+
+class TestEmojiMemo(unittest.TestCase):
+    """Test suite for the memo of the emojis of each distinct text.
+    """
+
+    def setUp(self):
+        """Start every test with the counters at zero."""
+        metrics.reset()
+
+    def test_repeated_text_is_a_hit(self):
+        """Test that a repeated text doesn't call the tokenizer again."""
+        memo = EmojiMemo()
+
+        self.assertEqual(memo.extract('aa😀 ❤️'), ('😀', '❤️'))
+        self.assertEqual(memo.extract('aa😀 ❤️'), ('😀', '❤️'))
+
+        counters = metrics.snapshot()
+        self.assertEqual(counters['emoji_memo_misses'], 1)
+        self.assertEqual(counters['emoji_memo_hits'], 1)
+        self.assertGreater(counters['emoji_memo_seconds_saved'], 0)
+
+    def test_ascii_text_skips_tokenizer(self):
+        """Test that ASCII texts are not tokenized nor memoized."""
+        memo = EmojiMemo()
+
+        self.assertEqual(memo.extract('no emoji :)'), ())
+
+        self.assertEqual(len(memo), 0)
+        self.assertEqual(metrics.snapshot(), {'emoji_ascii_skips': 1})
+
+    def test_bounded_size(self):
+        """Test that the least recently used texts are evicted."""
+        memo = EmojiMemo(maxsize=2)
+        for text in ['😀', '😋', '😀', '🛫']:
+            memo.extract(text)
+
+        self.assertEqual(len(memo), 2)
+        # '😋' was evicted, '😀' was used more recently
+        memo.extract('😀')
+        self.assertEqual(metrics.snapshot()['emoji_memo_hits'], 2)
+
+    def test_shared_by_threads(self):
+        """Test that a small memo shared by threads stays consistent."""
+        memo = EmojiMemo(maxsize=8)
+        texts = [f'{i} 😀' for i in range(64)]
+        errors = []
+
+        def work():
+            try:
+                for _ in range(20):
+                    for text in texts:
+                        self.assertEqual(memo.extract(text), ('😀',))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(memo), 8)
+        counters = metrics.snapshot()
+        # the threads can evict each other's texts, there may be no hits
+        self.assertEqual(counters.get('emoji_memo_hits', 0) + counters['emoji_memo_misses'],
+                         8 * 20 * 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import json
+
+from src.handles import (check_source, extract_batch, extract_flat,
+                         extract_handles, may_have_handles, tweet_mentions)
+
+
+class TestHandles(unittest.TestCase):
+    """Test suite for the extraction of the @handles of the contents.
+    """
+
+    def test_handles(self):
+        """Test the handles found in texts, with the rules of Twitter."""
+        cases = {
+            'hi @user1 and @user_2!': ['user1', 'user_2'],
+            'RT @user1: text': ['user1'],
+            '.@user1,@user2': ['user1', 'user2'],
+            'repeated @user1 @user1': ['user1', 'user1'],
+            # fullwidth at sign
+            '\uff20user1 text': ['user1'],
+            # e-mail addresses and handles after other characters
+            'mail user@example.com': [],
+            'a_@user1 #@user1': [],
+            # lists, URLs and handles too long
+            '@user1/list': [],
+            '@user1/ text': ['user1'],
+            '@user1://example.com': [],
+            '@' + 'a' * 15: ['a' * 15],
+            '@' + 'a' * 16: [],
+            # followed by an accented letter or another at sign
+            '@jos\u00e9': [],
+            '@user1@user2': [],
+            'no handles @ here': [],
+            '': [],
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(extract_handles(text), expected)
+        self.assertEqual(extract_batch(list(cases)), list(cases.values()))
+
+    def test_extract_flat(self):
+        """Test that the handles of the joined texts are the handles of
+        each text, with the position of their text."""
+        texts = ['', '@user1', 'line\n@user2\n', 'no handles', '', '@user3/list',
+                 'end @user4', '@user5 @user6']
+        rows, found = extract_flat(texts)
+        self.assertEqual(found, ['user1', 'user2', 'user4', 'user5', 'user6'])
+        self.assertEqual(rows, [1, 2, 6, 7, 7])
+        # with a fullwidth at sign in one of the texts
+        rows, found = extract_flat(texts + ['\uff20user7'])
+        self.assertEqual((rows[-1], found[-1]), (8, 'user7'))
+        self.assertEqual(extract_flat([]), ([], []))
+
+    def test_tweet_mentions(self):
+        """Test the mentions of a tweet from each source."""
+        tweet = {"content": "@user1 @user2",
+                 "mentionedUsers": [{"username": "user3"}]}
+        null = {"content": "@user1", "mentionedUsers": None}
+        missing = {"content": "@user1"}
+        empty = {"content": "@user1", "mentionedUsers": []}
+
+        self.assertEqual(tweet_mentions(tweet), ['user3'])
+        self.assertEqual(tweet_mentions(null), [])
+        self.assertEqual(tweet_mentions(tweet, 'content'), ['user1', 'user2'])
+        self.assertEqual(tweet_mentions(empty, 'content'), ['user1'])
+        # auto reads the content only when the field is null or missing
+        self.assertEqual(tweet_mentions(tweet, 'auto'), ['user3'])
+        self.assertEqual(tweet_mentions(null, 'auto'), ['user1'])
+        self.assertEqual(tweet_mentions(missing, 'auto'), ['user1'])
+        self.assertEqual(tweet_mentions(empty, 'auto'), [])
+
+        with self.assertRaises(ValueError):
+            check_source('contents')
+
+    def test_may_have_handles(self):
+        """Test the scan of the raw lines, with the escapes of json.dumps."""
+        for text in ('@user1', '\uff20user1'):
+            line = json.dumps({"content": text}).encode('utf-8')
+            self.assertTrue(may_have_handles(line))
+            line = json.dumps({"content": text}, ensure_ascii=False).encode('utf-8')
+            self.assertTrue(may_have_handles(line))
+        self.assertFalse(may_have_handles(b'{"content": "no handles"}'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from src import queries
+from src.import_benchmark import MODULES, measure_import
+from src.q1_memory import q1_memory
+
+
+class TestImports(unittest.TestCase):
+    """Test suite for the startup cost of the q-function modules.
+    """
+
+    def test_no_heavy_imports(self):
+        """Test that importing the modules doesn't load pandas, numpy
+        or emoji."""
+        for module in MODULES:
+            with self.subTest(module=module):
+                _, _, heavy = measure_import(module)
+                self.assertEqual(heavy, [])
+
+    def test_queries_entry_point(self):
+        """Test that the entry point gives the q-functions."""
+        self.assertIs(queries.q1_memory, q1_memory)
+        self.assertEqual(sorted(queries.__all__),
+                         ['q1_auto', 'q1_memory', 'q1_time', 'q2_auto',
+                          'q2_memory', 'q2_time', 'q3_auto', 'q3_memory',
+                          'q3_time'])
+        with self.assertRaises(AttributeError):
+            queries.q4_time
+
+
+if __name__ == "__main__":
+    unittest.main()
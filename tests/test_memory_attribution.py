@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+import tempfile
+import json
+import tracemalloc
+
+from src.memory_attribution import attribute, deep_sizeof, write_reports
+from src.q1_memory import q1_memory
+from src.q3_memory import q3_memory
+
+
+class TestMemoryAttribution(unittest.TestCase):
+    """Test suite for the attribution of the memory of the q-functions.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.test_data = [
+            {'date': '2025-01-01T00:00:00', 'id': i,
+             'user': {'username': f'user_{i % 3}'}, 'content': 'text',
+             'mentionedUsers': [{'username': 'user_1'}], 'quotedTweet': None}
+            for i in range(500)]
+        self.test_file_path = self.create_test_file(self.test_data)
+
+    def create_test_file(self, test_data):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'test.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_deep_sizeof(self):
+        """Test that the items are counted, each object once."""
+        item = 'x' * 1000
+        self.assertEqual(deep_sizeof([item, item]),
+                         sys.getsizeof([item, item]) + sys.getsizeof(item))
+        self.assertGreater(deep_sizeof({'a': [item]}), sys.getsizeof(item))
+
+    def test_stages(self):
+        """Test the structures found at the end of each stage."""
+        stages = attribute(q1_memory, self.test_file_path)
+
+        self.assertEqual([s.stage for s in stages],
+                         ['q1_memory:mains', 'q1_memory:quoted', 'result'])
+        ids = [s for s in stages[0].structures if s.name == 'q1_memory.ids']
+        self.assertEqual(len(ids), 1)
+        self.assertEqual(ids[0].length, len(self.test_data))
+        self.assertEqual(stages[0].structures[0], ids[0])
+        self.assertTrue(stages[0].sites)
+        self.assertGreaterEqual(stages[0].peak, stages[0].traced)
+        self.assertEqual(stages[-1].structures[0].name, 'result')
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_report(self):
+        """Test the report written next to the memory profiles, with the
+        frames of the helpers of the engine."""
+        with self.assertLogs('src.memory_attribution', level='INFO') as logs:
+            path, = write_reports(self.test_file_path, [('q3_memory', q3_memory)],
+                                  self.test_dir.name, top=3)
+
+        self.assertEqual(path.name, 'q3_memory_attribution.txt')
+        self.assertIn(str(path), logs.output[0])
+        text = path.read_text()
+        self.assertTrue(text.startswith(f'# {os.path.basename(self.test_file_path)} ('))
+        self.assertIn('[q3_memory:mains]', text)
+        self.assertIn('mentioning_tweets.ids (set of 500)', text)
+        self.assertIn('src/q3_memory.py:', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import os
+import tempfile
+import json
+
+import numpy as np
+
+from src.differential import generate, write_tweets
+from src.mention_graph import MentionGraph
+from src.q3_memory import q3_memory
+
+
+class TestMentionGraph(unittest.TestCase):
+    """Test suite for the graph of mentions.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+
+        def tweet(i, author, mentions):
+            return {'date': '2025-01-01T00:00:00', 'id': i,
+                    'user': {'username': author}, 'content': 'text',
+                    'mentionedUsers': [{'username': m} for m in mentions],
+                    'quotedTweet': None}
+
+        # a, b and c mention each other and the celebrity, the spammer,
+        # that nobody mentions, mentions its victim many times
+        self.test_data = [
+            tweet(1, 'a', ['b', 'c', 'celebrity']),
+            tweet(2, 'b', ['a', 'c', 'celebrity']),
+            tweet(3, 'c', ['a', 'b', 'celebrity']),
+        ] + [tweet(10 + i, 'spammer', ['victim'] * 2) for i in range(10)]
+        self.test_file_path = self.create_test_file(self.test_data)
+
+    def create_test_file(self, test_data):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'test.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_csr(self):
+        """Test the aggregated edges of each author."""
+        graph = MentionGraph.from_file(self.test_file_path)
+        code = {name: i for i, name in enumerate(graph.usernames)}
+        spammer = code['spammer']
+
+        self.assertEqual(graph.n_edges, 3 * 3 + 1)
+        start, end = graph.indptr[spammer], graph.indptr[spammer + 1]
+        self.assertEqual(graph.indices[start:end].tolist(), [code['victim']])
+        self.assertEqual(graph.weights[start:end].tolist(), [20])
+
+    def test_spam_resistance(self):
+        """Test that the spammer makes its victim the most mentioned user,
+        but not the one with the highest rank."""
+        graph = MentionGraph.from_file(self.test_file_path)
+
+        self.assertEqual(graph.top_in_degree(1), [('victim', 20)])
+        self.assertEqual(graph.top_pagerank(1)[0][0], 'celebrity')
+        self.assertAlmostEqual(graph.pagerank().sum(), 1.0)
+
+    def test_pagerank_matches_dense(self):
+        """Test the PageRank against the dense power iteration."""
+        write_tweets(generate(0, 300), self.test_file_path)
+        graph = MentionGraph.from_file(self.test_file_path)
+        n, d = graph.n_users, 0.85
+
+        matrix = np.zeros((n, n))
+        for u in range(n):
+            for e in range(graph.indptr[u], graph.indptr[u + 1]):
+                matrix[u, graph.indices[e]] += graph.weights[e]
+        out = matrix.sum(axis=1)
+        # the users that mention nobody link to everyone
+        matrix[out == 0] = 1.0
+        matrix /= matrix.sum(axis=1, keepdims=True)
+        rank = np.full(n, 1.0 / n)
+        for _ in range(200):
+            rank = (1 - d) / n + d * rank @ matrix
+
+        np.testing.assert_allclose(graph.pagerank(tol=1e-14, max_iter=200),
+                                   rank, atol=1e-9)
+
+    def test_in_degree_is_q3(self):
+        """Test that the in-degree ranking is the result of q3_memory,
+        including the order of the ties."""
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                write_tweets(generate(seed, 200), self.test_file_path)
+                graph = MentionGraph.from_file(self.test_file_path)
+                self.assertEqual(graph.top_in_degree(), q3_memory(self.test_file_path))
+
+    def test_empty(self):
+        """Test the graph of a file without mentions."""
+        graph = MentionGraph.from_file(self.create_test_file([]))
+        self.assertEqual(graph.n_users, 0)
+        self.assertEqual(graph.top_in_degree(), [])
+        self.assertEqual(graph.top_pagerank(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
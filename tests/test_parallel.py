@@ -0,0 +1,113 @@
+import unittest
+import os
+import threading
+import tempfile
+import json
+from unittest import mock
+
+from src import metrics, parallel
+from src.differential import generate, write_tweets
+from src.parallel import choose_mode, count_file
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestParallel(unittest.TestCase):
+    """Test suite for the thread, process and serial modes.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.test_file_path = os.path.join(self.test_dir.name, 'test.json')
+        write_tweets(generate(0, 300, duplicate_mains=True), self.test_file_path)
+
+    def create_test_file(self, test_data):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'data.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_modes(self):
+        """Test that every mode gives the results of the `_memory` engines,
+        whatever the number of chunks."""
+        expected = (q1_memory(self.test_file_path), q2_memory(self.test_file_path),
+                    q3_memory(self.test_file_path))
+        for mode, workers in (('serial', 1), ('thread', 1), ('thread', 4),
+                              ('process', 2)):
+            with self.subTest(mode=mode, workers=workers):
+                index = count_file(self.test_file_path, workers, mode)
+                self.assertEqual((index.q1(), index.q2(), index.q3()), expected)
+
+    def test_engines(self):
+        """Test the mode argument of the `_memory` engines."""
+        for func in (q1_memory, q2_memory, q3_memory):
+            with self.subTest(func=func.__name__):
+                self.assertEqual(func(self.test_file_path, mode='thread', workers=4),
+                                 func(self.test_file_path))
+                with self.assertRaises(ValueError):
+                    func(self.test_file_path, mode='thread', max_memory_mb=0.0)
+        with self.assertRaises(ValueError):
+            q3_memory(self.test_file_path, mode='serial', mention_source='content')
+
+    def test_batch_mode(self):
+        """Test the batch mode of the `_memory` engines, which has no
+        workers."""
+        for func in (q1_memory, q2_memory, q3_memory):
+            with self.subTest(func=func.__name__):
+                self.assertEqual(func(self.test_file_path, mode='batch'),
+                                 func(self.test_file_path))
+                with self.assertRaises(ValueError):
+                    func(self.test_file_path, mode='batch', workers=2)
+
+    def test_threads_share_counters(self):
+        """Test that the threads don't lose updates of the metrics."""
+        metrics.reset()
+
+        def work():
+            for _ in range(10_000):
+                metrics.increment('test_thread_updates')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.snapshot()['test_thread_updates'], 80_000)
+
+    def test_auto(self):
+        """Test that threads are used only when the GIL is disabled."""
+        with mock.patch.object(parallel, 'gil_enabled', return_value=False):
+            self.assertEqual(choose_mode(4), 'thread')
+            self.assertEqual(choose_mode(1), 'serial')
+        with mock.patch.object(parallel, 'gil_enabled', return_value=True):
+            self.assertEqual(choose_mode(4), 'process')
+
+        with self.assertLogs('src.parallel', level='INFO') as logs:
+            index = count_file(self.test_file_path, workers=1)
+        self.assertIn('serial mode with 1 workers', logs.output[0])
+        self.assertEqual(index.q3(), q3_memory(self.test_file_path))
+
+        with self.assertRaises(ValueError):
+            count_file(self.test_file_path, mode='fibers')
+
+    def test_empty_file(self):
+        """Test every mode on an empty file."""
+        file_path = self.create_test_file([])
+        for mode in ('serial', 'thread', 'process'):
+            with self.subTest(mode=mode):
+                self.assertEqual(count_file(file_path, 2, mode).q2(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
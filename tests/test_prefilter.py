@@ -0,0 +1,108 @@
+import unittest
+import os
+import tempfile
+import json
+
+from src import metrics
+from src.prefilter import all_empty, may_have_emojis, tweet_id, MENTIONS_KEY, QUOTED_KEY
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestPrefilter(unittest.TestCase):
+    """Test suite for the scans of the raw lines.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+
+        def tweet(i, content, mentions, quoted=None):
+            return {
+                'date': '2025-01-01T00:00:00',
+                'id': i,
+                'user': {'username': 'user', 'id': 100 + i},
+                'content': content,
+                'mentionedUsers': [{'username': u} for u in mentions] or None,
+                'quotedTweet': quoted,
+            }
+
+        # tweet 3 is quoted by an ASCII tweet, then a main tweet
+        self.test_data = [
+            tweet(1, 'plain text', []),
+            tweet(2, 'text with {"id": 7}', ['user_1'],
+                  tweet(3, '😀 quoted', ['user_2'])),
+            tweet(4, '😋😋 @user_3', ['user_3']),
+            tweet(5, 'only ascii', [], tweet(6, '❤️', [])),
+            tweet(3, '😀 quoted', ['user_2']),
+        ]
+
+    def create_test_file(self, test_data, **dumps_options):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'test.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry, **dumps_options) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_tweet_id(self):
+        """Test that the id of the tweet is found, not the ones of the user
+        or the quoted tweet."""
+        for entry in self.test_data:
+            line = json.dumps(entry).encode()
+            self.assertEqual(tweet_id(line), entry['id'])
+            # the user comes before the id of the tweet
+            entry = {'user': entry['user'], **entry}
+            self.assertEqual(tweet_id(json.dumps(entry).encode()), entry['id'])
+        self.assertEqual(tweet_id(b'{"id":"abc","x":1}\n'), 'abc')
+        self.assertEqual(tweet_id(b'{"x": 1, "id": 12}\n'), 12)
+
+    def test_all_empty(self):
+        """Test the detection of null and missing keys."""
+        self.assertTrue(all_empty(b'{"quotedTweet": null}', QUOTED_KEY))
+        self.assertTrue(all_empty(b'{"id": 1}', QUOTED_KEY))
+        self.assertTrue(all_empty(b'{"mentionedUsers": []}', MENTIONS_KEY))
+        self.assertFalse(all_empty(b'{"quotedTweet": {"id": 1}}', QUOTED_KEY))
+        # other separators can't be decided, the line must be decoded
+        self.assertFalse(all_empty(b'{"quotedTweet":null}', QUOTED_KEY))
+        self.assertFalse(all_empty(
+            b'{"mentionedUsers": null, "quotedTweet": '
+            b'{"mentionedUsers": [{"username": "a"}]}}', MENTIONS_KEY))
+
+    def test_may_have_emojis(self):
+        """Test that escaped and raw non ASCII texts may have emojis."""
+        self.assertFalse(may_have_emojis(b'{"content": "plain"}'))
+        self.assertTrue(may_have_emojis(json.dumps({'content': '😀'}).encode()))
+        self.assertTrue(may_have_emojis('{"content": "😀"}'.encode()))
+
+    def test_same_results(self):
+        """Test that the engines give the same results with and without the
+        prefilter, for different encodings of the JSON."""
+        for options in ({}, {'ensure_ascii': False}, {'separators': (',', ':')}):
+            with self.subTest(options=options):
+                test_file = self.create_test_file(self.test_data, **options)
+                self.assertEqual(q2_memory(test_file),
+                                 q2_memory(test_file, prefilter=False))
+                self.assertEqual(q3_memory(test_file),
+                                 q3_memory(test_file, prefilter=False))
+
+    def test_skip_metrics(self):
+        """Test that the skipped lines are counted."""
+        test_file = self.create_test_file(self.test_data)
+        metrics.reset()
+        q3_memory(test_file)
+        counters = metrics.snapshot()
+        # tweets 1 and 5 have no mentions, tweets 1, 4 and 3 no quotes
+        self.assertEqual(counters['prefilter_lines'], 10)
+        self.assertEqual(counters['prefilter_skips'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import os
+import tempfile
+import json
+
+from src.preview import preview
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestPreview(unittest.TestCase):
+    """Test suite for the sampling preview.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.test_data = [
+            {'date': f'2025-01-{i % 12 + 1:02d}T00:00:00', 'id': i,
+             'user': {'username': f'user_{i % 5}'},
+             'content': '😀😀' + '🛫' * (i % 3),
+             'mentionedUsers': [{'username': f'user_{i % 4}'}],
+             'quotedTweet': None if i % 4 else {
+                 'date': '2025-01-01T00:00:00', 'id': 10000 + i % 50,
+                 'user': {'username': 'user_q'}, 'content': '❤️',
+                 'mentionedUsers': None, 'quotedTweet': None}}
+            for i in range(3000)]
+        self.test_file_path = self.create_test_file(self.test_data)
+
+    def create_test_file(self, test_data, name='test.json'):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, name)
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_exact_within_budget(self):
+        """Test that the last preview is exact when the budget allows to
+        read the whole file."""
+        result = list(preview(self.test_file_path, time_budget=60, seed=0))[-1]
+
+        self.assertTrue(result.exact)
+        self.assertEqual(result.q1, q1_memory(self.test_file_path))
+        self.assertEqual([(e.key, e.count) for e in result.q2],
+                         q2_memory(self.test_file_path))
+        self.assertEqual([(e.key, e.count) for e in result.q3],
+                         q3_memory(self.test_file_path))
+        self.assertTrue(all(e.low == e.count == e.high for e in result.q3))
+        self.assertEqual(result.estimated_lines, len(self.test_data))
+
+    def test_estimates_without_budget(self):
+        """Test that a single round of estimates is returned when there is
+        no time to refine them."""
+        results = list(preview(self.test_file_path, time_budget=0,
+                               initial_sample=64, seed=0))
+
+        self.assertEqual(len(results), 1)
+        result = results[0]
+        self.assertFalse(result.exact)
+        self.assertLessEqual(result.sample_lines, 64)
+        self.assertAlmostEqual(result.estimated_lines, len(self.test_data),
+                               delta=len(self.test_data) * 0.1)
+        # every line has two 😀, but the number of lines is estimated
+        self.assertEqual(result.q2[0].key, '😀')
+        self.assertLessEqual(result.q2[0].low, 2 * len(self.test_data))
+        self.assertLessEqual(2 * len(self.test_data), result.q2[0].high)
+        for estimates in (result.dates, result.q2, result.q3):
+            for e in estimates:
+                self.assertLessEqual(e.low, e.count)
+                self.assertLessEqual(e.count, e.high)
+        self.assertEqual(len(result.q1), 10)
+
+    def test_empty_file(self):
+        """Test that an empty file gives an exact empty preview."""
+        results = list(preview(self.create_test_file([], 'empty.json')))
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].exact)
+        self.assertEqual(results[0].q2, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
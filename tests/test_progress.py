@@ -0,0 +1,107 @@
+import unittest
+import os
+import tempfile
+import json
+
+from src import metrics, progress
+from src.progress import ProgressReporter
+from src.q1_memory import q1_memory
+from src.q3_memory import q3_memory
+
+
+class TestProgress(unittest.TestCase):
+    """Test suite for the progress reports.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        metrics.reset()
+        quoted = {'date': '2025-01-01T00:00:00', 'id': 1000,
+                  'user': {'username': 'user_q'}, 'content': 'q',
+                  'mentionedUsers': None, 'quotedTweet': None}
+        self.test_data = [
+            {'date': '2025-01-01T00:00:00', 'id': i,
+             'user': {'username': f'user_{i % 3}'}, 'content': 'text',
+             'mentionedUsers': [{'username': 'user_1'}],
+             'quotedTweet': quoted if i % 2 else None}
+            for i in range(3000)]
+        self.test_file_path = self.create_test_file(self.test_data)
+
+    def create_test_file(self, test_data):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'test.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_off_returns_the_file(self):
+        """Test that the file is iterated directly when no reporter is
+        active."""
+        with open(self.test_file_path, 'r') as f:
+            self.assertIs(progress.lines(f, 'stage'), f)
+
+    def test_reports_of_each_stage(self):
+        """Test that each pass sends reports, the last one with all the
+        lines and bytes of the file."""
+        reports = []
+        with ProgressReporter(callback=reports.append, interval=0):
+            result = q1_memory(self.test_file_path)
+
+        self.assertEqual(result, q1_memory(self.test_file_path))
+        # with interval 0, a report every CHECK_EVERY lines and at the end
+        stages = [report['stage'] for report in reports]
+        self.assertEqual(stages, ['q1_memory:mains'] * 3 + ['q1_memory:quoted'] * 3)
+        last = reports[-1]
+        self.assertEqual(last['lines'], len(self.test_data))
+        self.assertEqual(last['bytes'], os.path.getsize(self.test_file_path))
+        self.assertEqual(last['eta_seconds'], 0)
+        self.assertGreater(last['rss_mb'], 0)
+        # 1500 quotes of the tweet 1000, also a main tweet, and the counters
+        # are live during the pass
+        self.assertEqual(last['metrics']['quoted_resolved'], 1500)
+        self.assertEqual(last['metrics']['dedup_hits'], 1500)
+        # the first report of the pass is sent before the line 1024, after
+        # the 511 odd lines before it
+        self.assertEqual(reports[3]['metrics']['quoted_resolved'], 511)
+
+    def test_exports(self):
+        """Test the JSON lines log and the Prometheus textfile."""
+        jsonl_path = os.path.join(self.test_dir.name, 'progress.jsonl')
+        textfile_path = os.path.join(self.test_dir.name, 'progress.prom')
+        with ProgressReporter(interval=60, jsonl_path=jsonl_path,
+                              textfile_path=textfile_path):
+            q3_memory(self.test_file_path)
+
+        with open(jsonl_path, 'r') as f:
+            reports = [json.loads(line) for line in f]
+        # only the last report of each stage, the interval is not reached
+        self.assertEqual([r['stage'] for r in reports],
+                         ['q3_memory:mains', 'q3_memory:quoted'])
+
+        with open(textfile_path, 'r') as f:
+            text = f.read()
+        self.assertIn(f'latam_progress_lines{{stage="q3_memory:quoted"}} '
+                      f'{len(self.test_data)}\n', text)
+        self.assertIn('latam_metric{stage="q3_memory:quoted",name="dedup_hits"} 1500\n', text)
+
+    def test_reporters_nest(self):
+        """Test that the previous reporter is active again on exit."""
+        outer, inner = ProgressReporter(), ProgressReporter()
+        with outer:
+            with inner:
+                self.assertIs(progress._active, inner)
+            self.assertIs(progress._active, outer)
+        self.assertIsNone(progress._active)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -313,5 +313,30 @@ class TestQ1Functions(unittest.TestCase):
         self.assertEqual(result_time, expected)
         self.assertEqual(result_memory, expected)
 
+    def test_two_phase_ties(self):
+        """Test that the two-phase strategy gives the same result, with the
+        same order of the ties, when a user is quoted before its main
+        tweets and only some of the dates are counted."""
+        def tweet(i, day, username, quoted=None):
+            return {'date': f'2025-01-{day:02d}T00:00:00', 'id': i,
+                    'user': {'username': username}, 'quotedTweet': quoted}
+
+        # on day 2 user_a and user_b tie, user_b is read first in a quote
+        # but main tweets are counted first, so user_a wins
+        test_data = [
+            tweet(1, 1, 'user_c', tweet(100, 2, 'user_b')),
+            tweet(2, 2, 'user_a'),
+            tweet(3, 2, 'user_b'),
+            tweet(4, 2, 'user_a'),
+        ]
+        test_data += [tweet(10 + day, day, f'user_{day}') for day in range(3, 15)]
+        file_path = self.create_test_file(test_data)
+
+        result_two_phase = q1_memory(file_path, two_phase=True)
+
+        self.assertEqual(result_two_phase, q1_memory(file_path))
+        self.assertEqual(result_two_phase[0], (date(2025, 1, 2), 'user_a'))
+        self.assertEqual(len(result_two_phase), 10)
+
 if __name__ == '__main__':
     unittest.main()
@@ -194,5 +194,54 @@ class TestQ2Functions(unittest.TestCase):
         self.assertEqual(result_time, expected)
         self.assertEqual(result_memory, expected)
 
+    def test_repeated_main_tweet(self):
+        """Test with a main tweet that appears twice in the file."""
+        test_data = [
+            {'content': '😀😀 aa', 'id': 1,
+                'quotedTweet': None
+            },
+            {'content': '😋', 'id': 2,
+                'quotedTweet': {'content': '😀😀 aa', 'id': 1,
+                                'quotedTweet': None}
+            },
+            {'content': '😀😀 aa', 'id': 1,
+                'quotedTweet': None
+            }
+        ]
+        file_path = self.create_test_file(test_data)
+
+        # Run both functions
+        result_time = q2_time(file_path)
+        result_memory = q2_memory(file_path)
+
+        expected = [('😀', 2), ('😋', 1)]
+
+        self.assertEqual(result_time, expected)
+        self.assertEqual(result_memory, expected)
+
+    def test_repeated_main_tweet_edited(self):
+        """Test with a main tweet that appears twice in the file with a
+        different content, the content of the first line is counted."""
+        test_data = [
+            {'content': '\U0001f600 aa', 'id': 1,
+                'quotedTweet': None
+            },
+            {'content': '\U0001f60b', 'id': 2,
+                'quotedTweet': {'content': '\U0001f6eb', 'id': 1,
+                                'quotedTweet': None}
+            },
+            {'content': '\U0001f6eb\U0001f6eb aa', 'id': 1,
+                'quotedTweet': None
+            }
+        ]
+        file_path = self.create_test_file(test_data)
+
+        expected = [('\U0001f600', 1), ('\U0001f60b', 1)]
+
+        self.assertEqual(q2_time(file_path), expected)
+        self.assertEqual(q2_memory(file_path), expected)
+        self.assertEqual(q2_memory(file_path, prefilter=False), expected)
+        self.assertEqual(q2_memory(file_path, max_memory_mb=1), expected)
+
 if __name__ == "__main__":
     unittest.main()
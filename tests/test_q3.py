@@ -5,6 +5,7 @@ import json
 
 from src.q3_time import q3_time
 from src.q3_memory import q3_memory
+from src.differential import generate, write_tweets
 
 
 class TestQ3Functions(unittest.TestCase):
@@ -176,6 +177,111 @@ class TestQ3Functions(unittest.TestCase):
         self.assertEqual(result_time, expected)
         self.assertEqual(result_memory, expected)
 
+    def test_nested_quoted_content(self):
+        """Test with nested quoted content and repeated quotes."""
+        test_data = [
+            {
+                "mentionedUsers": [{"username": "user1"}],
+                "id": 1,
+                "quotedTweet": {
+                    "mentionedUsers": [{"username": "user2"}],
+                    "id": 2,
+                    "quotedTweet": {
+                        "mentionedUsers": [
+                            {"username": "user3"},
+                            {"username": "user3"}
+                        ],
+                        "id": 3,
+                        "quotedTweet": None,
+                    }
+                }
+            },
+            {
+                "mentionedUsers": None,
+                "id": 4,
+                "quotedTweet": {
+                    "mentionedUsers": [
+                        {"username": "user3"},
+                        {"username": "user3"}
+                    ],
+                    "id": 3,
+                    "quotedTweet": None,
+                }
+            }
+        ]
+        file_path = self.create_test_file(test_data)
+
+        # Run both functions
+        result_time = q3_time(file_path)
+        result_memory = q3_memory(file_path)
+
+        expected = [('user3', 2), ('user1', 1), ('user2', 1)]
+
+        self.assertEqual(result_time, expected)
+        self.assertEqual(result_memory, expected)
+
+    def test_mention_sources(self):
+        """Test the mentions read from the contents and from the field."""
+        test_data = [
+            {
+                "content": "@user1 @user2 mail user3@example.com",
+                "mentionedUsers": None,
+                "id": 1,
+                "quotedTweet": {
+                    "content": "@user2 @user4/list",
+                    "mentionedUsers": [{"username": "user4"}],
+                    "id": 2,
+                    "quotedTweet": None,
+                }
+            },
+            {
+                "content": "text without handles",
+                "mentionedUsers": [{"username": "user1"}],
+                "id": 3,
+                "quotedTweet": {
+                    "content": "@user2 repeated",
+                    "id": 1,
+                    "quotedTweet": None,
+                }
+            },
+            {
+                "content": "@user5",
+                "id": 4,
+                "quotedTweet": None
+            }
+        ]
+        file_path = self.create_test_file(test_data)
+
+        expected = {
+            'field': [('user1', 1), ('user4', 1)],
+            'content': [('user2', 2), ('user1', 1), ('user5', 1)],
+            'auto': [('user1', 2), ('user2', 1), ('user5', 1), ('user4', 1)],
+        }
+        for source, result in expected.items():
+            with self.subTest(source=source):
+                self.assertEqual(q3_time(file_path, mention_source=source), result)
+                for prefilter in (True, False):
+                    self.assertEqual(q3_memory(file_path, prefilter=prefilter,
+                                               mention_source=source), result)
+                self.assertEqual(q3_memory(file_path, max_memory_mb=0.001,
+                                           mention_source=source), result)
+
+        with self.assertRaises(ValueError):
+            q3_time(file_path, mention_source='text')
+        with self.assertRaises(ValueError):
+            q3_memory(file_path, mention_source='text')
+
+    def test_mention_sources_generated(self):
+        """Test that both functions agree on the mentions of generated
+        tweets, whose contents have handles, from each source."""
+        file_path = self.create_test_file([])
+        for seed in range(5):
+            write_tweets(generate(seed, 200), file_path)
+            for source in ('content', 'auto'):
+                with self.subTest(seed=seed, source=source):
+                    self.assertEqual(q3_time(file_path, mention_source=source),
+                                     q3_memory(file_path, mention_source=source))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import os
+import tempfile
+import json
+from unittest import mock
+
+from src import quote_index
+from src.differential import generate, write_tweets
+from src.quote_index import NO_PARENT, QuoteIndex
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestQuoteIndex(unittest.TestCase):
+    """Test suite for the persisted index of the quoted tweets.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+
+        def tweet(i, quoted=None):
+            return {'date': '2025-01-01T00:00:00', 'id': i,
+                    'user': {'username': f'user_{i}'}, 'content': f'text {i}',
+                    'mentionedUsers': [{'username': 'user_1'}],
+                    'quotedTweet': quoted}
+
+        # 1 quotes 100, which quotes 200, which quotes 300. 2 quotes 200
+        # again, and 300 is also a main tweet
+        chain = tweet(100, tweet(200, tweet(300)))
+        self.test_data = [tweet(1, chain), tweet(2, chain['quotedTweet']),
+                          tweet(300), tweet(3)]
+        self.test_file_path = self.create_test_file(self.test_data)
+        self.index_dir = os.path.join(self.test_dir.name, 'index')
+
+    def create_test_file(self, test_data):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, 'test.json')
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_chains(self):
+        """Test the records, parents and statistics of the chains."""
+        index = QuoteIndex.from_file(self.test_file_path)
+
+        self.assertEqual(index.main_ids.tolist(), [1, 2, 300, 3])
+        self.assertEqual(index.ids.tolist(), [100, 200, 300])
+        self.assertEqual(index.parents.tolist(), [200, 300, NO_PARENT])
+        self.assertEqual(index.references.tolist(), [1, 2, 1])
+        self.assertEqual(index.depths().tolist(), [2, 1, 0])
+        self.assertEqual([t.id for t in index.counted_tweets()], [100, 200])
+        self.assertEqual(index.records[1].username, 'user_200')
+
+        stats = index.stats()
+        self.assertEqual((stats['quoted'], stats['counted'], stats['max_depth']), (3, 2, 2))
+        self.assertEqual(stats['depth_histogram'], [1, 1, 1])
+        self.assertEqual(stats['looped'], 0)
+        self.assertEqual(stats['max_references'], 2)
+
+    def test_loop(self):
+        """Test the statistics of malformed chains with a loop."""
+        def tweet(i, quoted=None):
+            return {'date': '2025-01-01T00:00:00', 'id': i,
+                    'user': {'username': f'user_{i}'}, 'content': f'text {i}',
+                    'mentionedUsers': None, 'quotedTweet': quoted}
+
+        # 100 quotes 200, which quotes 100 back, and 300 quotes 100
+        self.create_test_file([tweet(1, tweet(100, tweet(200, tweet(100)))),
+                               tweet(2, tweet(300, tweet(100))), tweet(3, tweet(400))])
+        index = QuoteIndex.from_file(self.test_file_path)
+
+        self.assertEqual(index.depths().tolist(), [-1, -1, -1, 0])
+        stats = index.stats()
+        self.assertEqual(stats['looped'], 3)
+        self.assertEqual(stats['depth_histogram'], [1])
+        self.assertEqual((stats['max_depth'], stats['mean_depth']), (0, 0.0))
+
+    def test_saved(self):
+        """Test that the index is saved, loaded, and built again when the
+        file changes."""
+        built = QuoteIndex.for_file(self.test_file_path, self.index_dir)
+        with mock.patch.object(QuoteIndex, 'from_file') as from_file:
+            loaded = QuoteIndex.for_file(self.test_file_path, self.index_dir)
+        from_file.assert_not_called()
+        self.assertEqual(loaded.ids.tolist(), built.ids.tolist())
+        self.assertEqual(loaded.records[0].content, 'text 100')
+        self.assertEqual(loaded.fingerprint, built.fingerprint)
+
+        # a corrupted index is built again
+        path, = [os.path.join(self.index_dir, name) for name in os.listdir(self.index_dir)]
+        with open(path, 'wb') as f:
+            f.write(b'corrupted')
+        self.assertEqual(QuoteIndex.for_file(self.test_file_path, self.index_dir)
+                         .ids.tolist(), [100, 200, 300])
+
+        self.create_test_file(self.test_data[2:])
+        os.utime(self.test_file_path, ns=(0, 0))
+        self.assertEqual(QuoteIndex.for_file(self.test_file_path, self.index_dir)
+                         .ids.tolist(), [])
+
+    def test_engines(self):
+        """Test that the engines give the same results with the index,
+        ties included."""
+        with mock.patch.object(quote_index, 'DEFAULT_INDEX_DIR', self.index_dir):
+            for seed in range(3):
+                with self.subTest(seed=seed):
+                    write_tweets(generate(seed, 200, duplicate_mains=seed == 2),
+                                 self.test_file_path)
+                    for func in (q1_memory, q2_memory, q3_memory):
+                        self.assertEqual(func(self.test_file_path, quote_index=True),
+                                         func(self.test_file_path))
+                    self.assertEqual(
+                        q3_memory(self.test_file_path, quote_index=True,
+                                  mention_source='content'),
+                        q3_memory(self.test_file_path, mention_source='content'))
+
+            # the index doesn't tell a null field from an empty one
+            with self.assertRaises(ValueError):
+                q3_memory(self.test_file_path, quote_index=True, mention_source='auto')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import os
+import tempfile
+import gzip
+import json
+import threading
+from unittest import mock
+
+from src import progress, reader
+from src.differential import generate, write_tweets
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+from src.q3_time import q3_time
+from src.reader import background, iter_batches, read_lines
+
+
+class TestReader(unittest.TestCase):
+    """Test suite for the background reader.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.lines = [json.dumps({'id': i, 'content': '😀' * (i % 7) + 'x' * i})
+                      for i in range(200)]
+
+    def create_test_file(self, text, name='test.json'):
+        """Helper method to create a file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(file_path, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_same_lines_any_block_size(self):
+        """Test that the lines are the same as the lines of the file,
+        whatever the size of the blocks."""
+        file_path = self.create_test_file('\n'.join(self.lines) + '\n')
+        expected = [line.encode('utf-8') for line in self.lines]
+        for block_size in (1, 17, 4096, 1 << 20):
+            with self.subTest(block_size=block_size):
+                self.assertEqual(list(read_lines(file_path, block_size)), expected)
+
+    def test_long_line(self):
+        """Test a line much longer than the blocks, and a start offset."""
+        lines = ['a' * 10_000, 'b', 'c' * 3_000]
+        file_path = self.create_test_file('\n'.join(lines) + '\n')
+        self.assertEqual(list(read_lines(file_path, 64)),
+                         [line.encode('utf-8') for line in lines])
+        self.assertEqual(list(read_lines(file_path, 64, start=10_001)),
+                         [b'b', lines[2].encode('utf-8')])
+
+    def test_engines_in_background(self):
+        """Test that the engines read their files with the background
+        reader inside `background`, with the same results."""
+        file_path = os.path.join(self.test_dir.name, 'tweets.json')
+        write_tweets(generate(0, 300), file_path)
+        funcs = (q1_memory, q2_memory, q3_memory, q3_time)
+        expected = [func(file_path) for func in funcs]
+
+        with mock.patch.object(reader, 'iter_batches', wraps=reader.iter_batches) as spy:
+            with background():
+                self.assertEqual([func(file_path) for func in funcs], expected)
+                # also with the progress reported
+                reports = []
+                with progress.ProgressReporter(reports.append, interval=0):
+                    self.assertEqual(q1_memory(file_path), expected[0])
+        self.assertGreater(spy.call_count, 0)
+        self.assertFalse(reader.is_enabled())
+        last = [r for r in reports if r['stage'] == 'q1_memory:mains'][-1]
+        self.assertEqual(last['bytes'], os.path.getsize(file_path))
+        self.assertEqual(last['lines'], 300)
+
+    def test_last_line_without_newline(self):
+        """Test that the last line is read when the file doesn't end with a
+        newline, also from a gzip file."""
+        for name in ('test.json', 'test.json.gz'):
+            with self.subTest(name=name):
+                file_path = self.create_test_file('\n'.join(self.lines), name)
+                lines = list(read_lines(file_path, 100))
+                self.assertEqual(lines[-1], self.lines[-1].encode('utf-8'))
+                self.assertEqual(len(lines), len(self.lines))
+
+    def test_stop_early(self):
+        """Test that the background thread ends when the caller stops before
+        the end of the file."""
+        file_path = self.create_test_file('\n'.join(self.lines) + '\n')
+        batches = iter_batches(file_path, block_size=64, max_batches=1)
+        next(batches)
+        batches.close()
+        self.assertNotIn('background-reader',
+                         [thread.name for thread in threading.enumerate()])
+
+    def test_error_is_raised(self):
+        """Test that an error of the background thread is raised to the
+        caller."""
+        with self.assertRaises(FileNotFoundError):
+            list(read_lines(os.path.join(self.test_dir.name, 'missing.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import os
+import tempfile
+import json
+import threading
+import urllib.request
+
+from src.server import QueryServer
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestQueryServer(unittest.TestCase):
+    """Test suite for the query server.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_data = [
+            {
+                'date': '2025-01-01T00:00:00',
+                'id': 1,
+                'user': {'username': 'user_1'},
+                'content': '😀😀 aa',
+                'mentionedUsers': [{'username': 'user_2'}],
+                'quotedTweet': {
+                    'date': '2025-01-02T00:00:00',
+                    'id': 2,
+                    'user': {'username': 'user_2'},
+                    'content': '😋',
+                    'mentionedUsers': [{'username': 'user_3'}],
+                    'quotedTweet': None}},
+            {
+                'date': '2025-01-02T00:00:00',
+                'id': 3,
+                'user': {'username': 'user_3'},
+                'content': '😋 bb',
+                'mentionedUsers': None,
+                'quotedTweet': None},
+        ]
+        with tempfile.NamedTemporaryFile(delete=False, mode='w',
+                                         newline='',
+                                         encoding='utf-8') as f:
+            for entry in self.test_data:
+                f.write(json.dumps(entry) + '\n')
+            self.file_path = f.name
+
+        self.server = QueryServer(self.file_path, port=0, reload_interval=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        os.remove(self.file_path)
+
+    def get(self, path):
+        """Helper method to query the server."""
+        host, port = self.server.server_address
+        with urllib.request.urlopen(f'http://{host}:{port}{path}') as response:
+            return json.loads(response.read())
+
+    def test_same_results_as_functions(self):
+        """Test that the answers are the ones of the q-functions."""
+        q1 = [[date.isoformat(), user] for date, user in q1_memory(self.file_path)]
+        q2 = [list(item) for item in q2_memory(self.file_path)]
+        q3 = [list(item) for item in q3_memory(self.file_path)]
+
+        self.assertEqual(self.get('/q1')['result'], q1)
+        self.assertEqual(self.get('/q2')['result'], q2)
+        self.assertEqual(self.get('/q3')['result'], q3)
+        self.assertEqual(self.get('/q3?k=1')['result'], q3[:1])
+
+        metrics = self.get('/metrics')
+        self.assertEqual(metrics['endpoints']['q3']['requests'], 2)
+
+    def test_reload_when_file_changes(self):
+        """Test that the index is rebuilt when the file changes."""
+        self.assertEqual(self.get('/q3')['result'],
+                         [['user_2', 1], ['user_3', 1]])
+
+        with open(self.file_path, 'a') as f:
+            f.write(json.dumps({
+                'date': '2025-01-03T00:00:00',
+                'id': 4,
+                'user': {'username': 'user_1'},
+                'content': '',
+                'mentionedUsers': [{'username': 'user_3'}],
+                'quotedTweet': None}) + '\n')
+
+        # the request that sees the change starts the reload and is
+        # answered with the previous index
+        self.get('/q3')
+        self.server.wait_reload(10)
+        self.assertEqual(self.get('/q3')['result'],
+                         [['user_3', 2], ['user_2', 1]])
+        self.assertEqual(self.server.reloads, 1)
+
+    def test_malformed_file_keeps_index(self):
+        """Test that a file that can't be read keeps the previous index,
+        and the error is reported in the metrics."""
+        expected = self.get('/q3')['result']
+        with open(self.file_path, 'a') as f:
+            f.write('{"truncated": \n')
+
+        self.assertEqual(self.get('/q3')['result'], expected)
+        self.server.wait_reload(10)
+        self.assertEqual(self.get('/q3')['result'], expected)
+        metrics = self.get('/metrics')
+        self.assertEqual(metrics['reloads'], 0)
+        self.assertIn('JSONDecodeError', metrics['reload_error'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import os
+import tempfile
+import json
+from unittest import mock
+
+import numpy as np
+
+from src import shared_counts
+from src.chunks import iter_chunk, split_file
+from src.shared_counts import SharedCounts, top_k
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestSharedCounts(unittest.TestCase):
+    """Test suite for the parallel counters in shared memory.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+
+        def tweet(i, day, username, content, mentions, quoted=None):
+            return {
+                'date': f'2025-01-{day:02d}T00:00:00',
+                'id': i,
+                'user': {'username': username},
+                'content': content,
+                'mentionedUsers': [{'username': u} for u in mentions] or None,
+                'quotedTweet': quoted,
+            }
+
+        # tweet 5 is quoted before it is a main tweet, tweet 1 is a main
+        # tweet twice and tweet 6 is quoted twice, in different chunks
+        self.test_file_path = self.create_test_file([
+            tweet(1, 1, 'user_1', '😀 aa', ['user_2'],
+                  tweet(5, 3, 'user_5', '😋😋', ['user_5'])),
+            tweet(2, 2, 'user_2', '🛫', [],
+                  tweet(6, 2, 'user_6', '🛫🛫', ['user_1'])),
+            tweet(3, 3, 'user_3', '😋', ['user_2'],
+                  tweet(6, 2, 'user_6', '🛫🛫', ['user_1'])),
+            tweet(1, 1, 'user_1', '😀 aa', ['user_2']),
+            tweet(5, 3, 'user_5', '😋😋', ['user_5']),
+            tweet(7, 1, 'user_2', '😀', ['user_3'],
+                  tweet(8, 1, 'user_3', '❤️', [],
+                        tweet(9, 2, 'user_4', '👍🏽', ['user_4']))),
+        ])
+
+    def create_test_file(self, test_data, name='test.json'):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, name)
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def test_same_as_memory_engines(self):
+        """Test that the results are the ones of the _memory engines, with
+        the same order of the ties, for any number of workers."""
+        for workers in (1, 2, 4):
+            with self.subTest(workers=workers):
+                counts = SharedCounts.from_file(self.test_file_path, workers)
+                self.assertEqual(counts.q1(), q1_memory(self.test_file_path))
+                self.assertEqual(counts.q2(), q2_memory(self.test_file_path))
+                self.assertEqual(counts.q3(), q3_memory(self.test_file_path))
+
+    def test_flushed_blocks(self):
+        """Test that the codes counted by blocks, a flush every 2 codes,
+        give the same counters."""
+        with mock.patch.object(shared_counts, 'FLUSH_SIZE', 2):
+            for workers in (1, 2):
+                with self.subTest(workers=workers):
+                    counts = SharedCounts.from_file(self.test_file_path, workers)
+                    self.assertEqual(counts.q1(), q1_memory(self.test_file_path))
+                    self.assertEqual(counts.q2(), q2_memory(self.test_file_path))
+                    self.assertEqual(counts.q3(), q3_memory(self.test_file_path))
+
+    def test_empty_file(self):
+        """Test that an empty file gives empty results."""
+        counts = SharedCounts.from_file(self.create_test_file([], 'empty.json'), 2)
+        self.assertEqual(counts.q1(), [])
+        self.assertEqual(counts.q2(), [])
+        self.assertEqual(counts.q3(), [])
+
+    def test_date_out_of_range(self):
+        """Test that a date that can't be encoded raises an error."""
+        test_file = self.create_test_file([{
+            'date': '1969-12-31T00:00:00', 'id': 1, 'user': {'username': 'a'},
+            'content': '', 'mentionedUsers': None, 'quotedTweet': None}],
+            'old.json')
+        with self.assertRaises(ValueError):
+            SharedCounts.from_file(test_file, 1)
+
+    def test_top_k_ties(self):
+        """Test that ties are sorted by first position."""
+        counts = np.array([3, 5, 5, 0, 3, 1])
+        first = np.array([4, 9, 2, 0, 1, 5])
+        self.assertEqual(top_k(counts, first, 3).tolist(), [2, 1, 4])
+        self.assertEqual(top_k(counts, first, 10).tolist(), [2, 1, 4, 0, 5])
+
+    def test_chunks_cover_every_line(self):
+        """Test that the chunks split the file at line boundaries."""
+        with open(self.test_file_path, 'rb') as f:
+            lines = f.readlines()
+        for n_chunks in (1, 2, 3, 20):
+            chunks = split_file(self.test_file_path, n_chunks)
+            self.assertLessEqual(len(chunks), n_chunks)
+            read = [line for start, end in chunks
+                    for line in iter_chunk(self.test_file_path, start, end)]
+            self.assertEqual(read, lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import os
+import tempfile
+import json
+from unittest import mock
+
+from src import spill
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestSpill(unittest.TestCase):
+    """Test suite for the q-functions under a memory budget, which spill
+    the ids and the counters to disk.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_data = []
+
+    def create_test_file(self, test_data):
+        """Helper method to create a temporary JSON file for each test."""
+        with tempfile.NamedTemporaryFile(delete=False, mode='w',
+                                         newline='',
+                                         encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+            self.test_data.append(f.name)
+            return f.name  # Return the file path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        for file in self.test_data:
+            os.remove(file)
+
+    def tweet(self, i, quoted=None):
+        """Helper method to create a tweet with all the fields."""
+        return {
+            'date': f'2025-01-{i % 12 + 1:02d}T00:00:00',
+            'id': i,
+            'user': {'username': f'user_{i % 5}'},
+            'content': '😀' * (i % 3) + '😋' * (i % 4) + ' text',
+            'mentionedUsers': [{'username': f'user_{i % 7}'}] * (i % 3),
+            'quotedTweet': quoted,
+        }
+
+    def test_spilled_equals_in_memory(self):
+        """Test that a budget small enough to spill on every tweet gives
+        the same results as the in-memory engines."""
+        test_data = []
+        for i in range(300):
+            # quote chains with quotes of main tweets and repeated quotes
+            quoted = self.tweet(i % 50 + 280, self.tweet(i % 9 + 1000))
+            test_data.append(self.tweet(i, quoted if i % 2 else None))
+        # a repeated main tweet
+        test_data.append(self.tweet(3))
+        file_path = self.create_test_file(test_data)
+
+        for func in (q1_memory, q2_memory, q3_memory):
+            with self.subTest(func=func.__name__):
+                self.assertEqual(func(file_path, max_memory_mb=0.001),
+                                 func(file_path))
+
+    def test_no_emojis_no_mentions(self):
+        """Test that empty results are handled when spilling."""
+        test_data = [
+            {'content': 'aa', 'id': 1, 'mentionedUsers': None,
+             'quotedTweet': None},
+        ]
+        file_path = self.create_test_file(test_data)
+
+        self.assertEqual(q2_memory(file_path, max_memory_mb=0.001), [])
+        self.assertEqual(q3_memory(file_path, max_memory_mb=0.001), [])
+
+    def test_many_runs(self):
+        """Test that with more runs than MAX_FAN_IN, the runs are merged in
+        several passes and never more than MAX_FAN_IN runs are read at the
+        same time."""
+        test_data = [self.tweet(i, self.tweet(i % 40 + 1000) if i % 2 else None)
+                     for i in range(600)]
+        file_path = self.create_test_file(test_data)
+
+        read_run = spill._read_run
+        state = {'open': 0, 'most': 0, 'runs': 0}
+
+        def counting_read_run(path):
+            state['open'] += 1
+            state['most'] = max(state['most'], state['open'])
+            state['runs'] += 1
+            try:
+                yield from read_run(path)
+            finally:
+                state['open'] -= 1
+
+        for func in (q1_memory, q2_memory, q3_memory):
+            with self.subTest(func=func.__name__):
+                state.update(most=0, runs=0)
+                with mock.patch.object(spill, 'MAX_FAN_IN', 4), \
+                        mock.patch.object(spill, '_read_run', counting_read_run):
+                    result = func(file_path, max_memory_mb=0.001)
+                self.assertEqual(result, func(file_path))
+                # far more runs read than MAX_FAN_IN, several passes
+                self.assertGreater(state['runs'], 50)
+                self.assertLessEqual(state['most'], 4)
+
+    def test_block_size(self):
+        """Test that the blocks of the runs are sized from the budget."""
+        self.assertEqual(spill.block_size(1, 100), 1)
+        self.assertEqual(spill.block_size(64 * 100 * 10, 100), 10)
+        self.assertEqual(spill.block_size(2**40, 100), spill.BLOCK_SIZE)
+
+    def test_unsupported_options(self):
+        """Test that the options the spilled engines can't honor are
+        rejected."""
+        file_path = self.create_test_file([])
+        for func in (q1_memory, q2_memory, q3_memory):
+            with self.subTest(func=func.__name__):
+                with self.assertRaises(ValueError):
+                    func(file_path, max_memory_mb=0.001, quote_index=True)
+        with self.assertRaises(ValueError):
+            q1_memory(file_path, max_memory_mb=0.001, two_phase=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
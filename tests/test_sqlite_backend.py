@@ -0,0 +1,100 @@
+import unittest
+import os
+import tempfile
+import json
+from datetime import date
+
+from src.sqlite_backend import SQLiteBackend
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    """Test suite for the SQLite backend.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.test_dir.name, 'tweets.db')
+
+    def create_test_file(self, test_data):
+        """Helper method to create a temporary JSON file for each test."""
+        with tempfile.NamedTemporaryFile(delete=False, mode='w',
+                                         newline='',
+                                         encoding='utf-8',
+                                         dir=self.test_dir.name) as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+            return f.name  # Return the file path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def tweet(self, i, day, username, content, mentions, quoted=None):
+        """Helper method to create a tweet with all the fields."""
+        return {
+            'date': f'2025-01-{day:02d}T00:00:00',
+            'id': i,
+            'user': {'username': username},
+            'content': content,
+            'mentionedUsers': [{'username': u} for u in mentions] or None,
+            'quotedTweet': quoted,
+        }
+
+    def test_same_results_as_functions(self):
+        """Test with repeated main tweets and quoted tweets that are main
+        tweets, repeated or new."""
+        quoted = self.tweet(2, 2, 'user_2', '😋😋', ['user_3'])
+        test_data = [
+            self.tweet(1, 1, 'user_1', '😀 aa', ['user_2'], quoted),
+            self.tweet(3, 2, 'user_3', '😋', [], quoted),
+            self.tweet(4, 2, 'user_3', '🛫', ['user_1', 'user_1'],
+                       self.tweet(1, 1, 'user_1', '😀 aa', ['user_2'])),
+            self.tweet(1, 1, 'user_1', '😀 aa', ['user_2'], quoted),
+        ]
+        file_path = self.create_test_file(test_data)
+
+        with SQLiteBackend(self.db_path) as db:
+            db.ingest(file_path)
+
+            self.assertEqual(db.q1(), q1_memory(file_path))
+            self.assertEqual(db.q2(), q2_memory(file_path))
+            self.assertEqual(db.q3(), q3_memory(file_path))
+            self.assertEqual(db.q1(), [(date(2025, 1, 2), 'user_3'),
+                                       (date(2025, 1, 1), 'user_1')])
+
+    def test_incremental_append(self):
+        """Test that appending files gives the results of the
+        concatenated file, also when a quoted tweet of the first file is a
+        main tweet of the second."""
+        first = [
+            self.tweet(1, 1, 'user_1', '😀', ['user_2'],
+                       self.tweet(5, 3, 'user_5', '😋😋', ['user_5'])),
+        ]
+        second = [
+            self.tweet(5, 3, 'user_5', '😋😋', ['user_5']),
+            self.tweet(6, 3, 'user_6', '😀', ['user_2']),
+        ]
+        first_path = self.create_test_file(first)
+        second_path = self.create_test_file(second)
+        both_path = self.create_test_file(first + second)
+
+        with SQLiteBackend(self.db_path) as db:
+            db.ingest(first_path)
+        # reopen the database, as a new process would
+        with SQLiteBackend(self.db_path) as db:
+            db.ingest(second_path)
+
+            self.assertEqual(db.q1(), q1_memory(both_path))
+            self.assertEqual(db.q2(), q2_memory(both_path))
+            self.assertEqual(db.q3(), q3_memory(both_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import tempfile
+import json
+
+from src.state import AggregateState, merge_states, run_shards
+from src.q1_memory import q1_memory
+from src.q2_memory import q2_memory
+from src.q3_memory import q3_memory
+
+
+class TestAggregateState(unittest.TestCase):
+    """Test suite for the mergeable state of sharded files.
+    """
+
+    def setUp(self):
+        """This method will run before each test,
+        setting up the temporary test environment.
+        """
+        self.test_dir = tempfile.TemporaryDirectory()
+
+        def tweet(i, day, username, content, mentions, quoted=None):
+            return {
+                'date': f'2025-01-{day:02d}T00:00:00',
+                'id': i,
+                'user': {'username': username},
+                'content': content,
+                'mentionedUsers': [{'username': u} for u in mentions] or None,
+                'quotedTweet': quoted,
+            }
+
+        # tweet 5 is quoted in the first shard and is a main tweet of the
+        # last one, tweet 1 is a main tweet in two shards
+        self.shards = [
+            [tweet(1, 1, 'user_1', '😀 aa', ['user_2'],
+                   tweet(5, 3, 'user_5', '😋😋', ['user_5'])),
+             tweet(2, 2, 'user_2', '🛫', [],
+                   tweet(6, 2, 'user_6', '🛫🛫', ['user_1']))],
+            [tweet(3, 3, 'user_3', '😋', ['user_2'],
+                   tweet(6, 2, 'user_6', '🛫🛫', ['user_1'])),
+             tweet(1, 1, 'user_1', '😀 aa', ['user_2'])],
+            [tweet(5, 3, 'user_5', '😋😋', ['user_5']),
+             tweet(7, 1, 'user_2', '😀', ['user_3'],
+                   tweet(8, 1, 'user_3', '❤️', []))],
+        ]
+        self.shard_paths = [
+            self.create_test_file(shard, f'shard-{i}.json')
+            for i, shard in enumerate(self.shards)]
+        self.full_path = self.create_test_file(
+            [t for shard in self.shards for t in shard], 'full.json')
+
+    def create_test_file(self, test_data, name):
+        """Helper method to create a JSON file in the test folder."""
+        file_path = os.path.join(self.test_dir.name, name)
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for entry in test_data:
+                f.write(json.dumps(entry) + '\n')
+        return file_path
+
+    def tearDown(self):
+        """This method will run after each test,
+        cleaning up the temporary test environment."""
+        self.test_dir.cleanup()
+
+    def assertSameAsFullFile(self, index):
+        """Compare the index with the q-functions on the full file."""
+        self.assertEqual(index.q1(), q1_memory(self.full_path))
+        self.assertEqual(index.q2(), q2_memory(self.full_path))
+        self.assertEqual(index.q3(), q3_memory(self.full_path))
+
+    def test_merge_equals_full_file(self):
+        """Test that merging the shards gives the results of the full
+        file, in any grouping."""
+        states = [AggregateState.from_file(p) for p in self.shard_paths]
+
+        self.assertSameAsFullFile(merge_states(states).finalize())
+        self.assertSameAsFullFile(
+            states[0].merge(states[1].merge(states[2])).finalize())
+
+    def test_serialization(self):
+        """Test that a state survives serialization."""
+        states = [AggregateState.loads(AggregateState.from_file(p).dumps())
+                  for p in self.shard_paths]
+
+        self.assertSameAsFullFile(merge_states(states).finalize())
+
+    def test_invalid_payload(self):
+        """Test that payloads which are not states are rejected."""
+        with self.assertRaises(ValueError):
+            AggregateState.loads(b'not a state')
+
+    def test_run_shards_in_subprocesses(self):
+        """Test the coordinator with local subprocesses."""
+        self.assertSameAsFullFile(run_shards(self.shard_paths))
+
+
+if __name__ == "__main__":
+    unittest.main()